@@ -1,4 +1,6 @@
 from logging.config import fileConfig
+from typing import Literal
+from typing import MutableMapping
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
@@ -25,6 +27,28 @@ config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL)
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
+
+def include_name(
+    name: str | None,
+    type_: Literal[
+        "schema",
+        "table",
+        "column",
+        "index",
+        "unique_constraint",
+        "foreign_key_constraint",
+    ],
+    parent_names: MutableMapping[
+        Literal["schema_name", "table_name", "schema_qualified_table_name"],
+        str | None,
+    ],
+) -> bool:
+    # The full-text search index (and its shadow tables) is managed manually
+    if type_ == "table" and name and name.startswith("search_index"):
+        return False
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -50,6 +74,7 @@ def run_migrations_offline() -> None:
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
         render_as_batch=True,
+        include_name=include_name,
     )
 
     with context.begin_transaction():
@@ -74,6 +99,7 @@ def run_migrations_online() -> None:
             connection=connection,
             target_metadata=target_metadata,
             render_as_batch=True,
+            include_name=include_name,
         )
 
         with context.begin_transaction():
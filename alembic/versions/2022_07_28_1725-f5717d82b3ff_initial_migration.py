@@ -260,7 +260,7 @@ def upgrade() -> None:
     )
     with op.batch_alter_table('poll_answer', schema=None) as batch_op:
         batch_op.create_index(batch_op.f('ix_poll_answer_id'), ['id'], unique=False)
-        batch_op.create_index('uix_one_of_outbox_object_id_actor_id', ['outbox_object_id', 'actor_id'], unique=True, sqlite_where=sa.text('poll_type = "oneOf"'))
+        batch_op.create_index('uix_one_of_outbox_object_id_actor_id', ['outbox_object_id', 'actor_id'], unique=True, sqlite_where=sa.text('poll_type = "oneOf"'), postgresql_where=sa.text("poll_type = 'oneOf'"))
 
     op.create_table('tagged_outbox_object',
     sa.Column('id', sa.Integer(), nullable=False),
@@ -330,7 +330,7 @@ def downgrade() -> None:
 
     op.drop_table('tagged_outbox_object')
     with op.batch_alter_table('poll_answer', schema=None) as batch_op:
-        batch_op.drop_index('uix_one_of_outbox_object_id_actor_id', sqlite_where=sa.text('poll_type = "oneOf"'))
+        batch_op.drop_index('uix_one_of_outbox_object_id_actor_id', sqlite_where=sa.text('poll_type = "oneOf"'), postgresql_where=sa.text("poll_type = 'oneOf'"))
         batch_op.drop_index(batch_op.f('ix_poll_answer_id'))
 
     op.drop_table('poll_answer')
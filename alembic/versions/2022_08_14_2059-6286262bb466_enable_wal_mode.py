@@ -15,8 +15,10 @@ depends_on = None
 
 
 def upgrade() -> None:
-    op.execute("PRAGMA journal_mode=WAL")
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("PRAGMA journal_mode=WAL")
 
 
 def downgrade() -> None:
-    op.execute("PRAGMA journal_mode=DELETE")
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("PRAGMA journal_mode=DELETE")
@@ -22,7 +22,7 @@ def upgrade() -> None:
         batch_op.add_column(sa.Column('has_local_mention', sa.Boolean(), server_default='0', nullable=False))
 
     # ### end Alembic commands ###
-    op.execute("UPDATE inbox SET has_local_mention = 1 WHERE id IN (select inbox_object_id from notifications where notification_type = 'MENTION')")
+    op.execute("UPDATE inbox SET has_local_mention = true WHERE id IN (select inbox_object_id from notifications where notification_type = 'MENTION')")
 
 
 def downgrade() -> None:
@@ -7,7 +7,6 @@ Create Date: 2022-10-30 14:09:14.540461+00:00
 """
 import sqlalchemy as sa
 from sqlalchemy import select
-from sqlalchemy.orm.session import Session
 
 from alembic import op
 
@@ -26,17 +25,17 @@ def upgrade() -> None:
 
     # ### end Alembic commands ###
 
-    # Backfill the slug for existing articles
-    from app.models import OutboxObject
+    # Backfill the slug for existing articles (without the ORM model, as it
+    # references columns added by later migrations)
     from app.utils.text import slugify
-    sess = Session(op.get_bind())
-    articles = sess.execute(select(OutboxObject).where(
-        OutboxObject.ap_type == "Article")
-    ).scalars()
+    outbox = sa.table('outbox', sa.column('id'), sa.column('ap_type'), sa.column('ap_object', sa.JSON), sa.column('slug'))
+    conn = op.get_bind()
+    articles = conn.execute(select(outbox.c.id, outbox.c.ap_object).where(
+        outbox.c.ap_type == "Article")
+    ).all()
     for article in articles:
         title = article.ap_object["name"]
-        article.slug = slugify(title)
-    sess.commit()
+        conn.execute(outbox.update().where(outbox.c.id == article.id).values(slug=slugify(title)))
 
 
 def downgrade() -> None:
@@ -17,9 +17,13 @@ depends_on = None
 
 
 def upgrade() -> None:
+    webmention_type = sa.Enum('UNKNOWN', 'LIKE', 'REPLY', 'REPOST', name='webmentiontype')
+    # Needed for PostgreSQL, a no-op with SQLite
+    webmention_type.create(op.get_bind(), checkfirst=True)
+
     # ### commands auto generated by Alembic - please adjust! ###
     with op.batch_alter_table('webmention', schema=None) as batch_op:
-        batch_op.add_column(sa.Column('webmention_type', sa.Enum('UNKNOWN', 'LIKE', 'REPLY', 'REPOST', name='webmentiontype'), nullable=True))
+        batch_op.add_column(sa.Column('webmention_type', webmention_type, nullable=True))
 
     # ### end Alembic commands ###
 
@@ -0,0 +1,43 @@
+"""Add missing PostgreSQL enum values
+
+Revision ID: 2b7d4e9f1c60
+Revises: 8a6d2f1e3b57
+Create Date: 2023-01-06 11:30:12.483921+00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '2b7d4e9f1c60'
+down_revision = '8a6d2f1e3b57'
+branch_labels = None
+depends_on = None
+
+# Values added to the enums after their creation (SQLite stores them as strings)
+_NEW_ENUM_VALUES = {
+    'notificationtype': [
+        'PENDING_INCOMING_FOLLOWER',
+        'REJECTED_FOLLOWER',
+        'MOVE',
+        'BLOCKED',
+        'UNBLOCKED',
+        'BLOCK',
+        'UNBLOCK',
+        'FAN_OUT_FAILED',
+    ],
+    'fanoutstatus': ['PENDING_UPDATE'],
+}
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return None
+
+    for enum_name, values in _NEW_ENUM_VALUES.items():
+        for value in values:
+            op.execute(f"ALTER TYPE {enum_name} ADD VALUE IF NOT EXISTS '{value}'")
+
+
+def downgrade() -> None:
+    # PostgreSQL does not support removing enum values
+    pass
@@ -0,0 +1,98 @@
+"""Compress large JSON columns
+
+Revision ID: 9c2e5a7d3f18
+Revises: 4e1b8c3a7f92
+Create Date: 2023-01-07 14:02:18.930412+00:00
+
+"""
+from typing import Any
+from typing import Callable
+
+import sqlalchemy as sa
+
+from alembic import op
+from app.utils import json_codec
+from app.utils.compressed_json import compress
+from app.utils.compressed_json import decompress
+
+# revision identifiers, used by Alembic.
+revision = '9c2e5a7d3f18'
+down_revision = '4e1b8c3a7f92'
+branch_labels = None
+depends_on = None
+
+_COMPRESSED_COLUMNS = [
+    ('inbox', 'ap_object', False),
+    ('outbox', 'revisions', True),
+    ('webmention', 'source_microformats', True),
+    ('incoming_activity', 'ap_object', True),
+]
+
+_BATCH_SIZE = 500
+
+_LAST_RESPONSE_MAX_LENGTH = 2048
+
+
+def _rewrite_rows(table_name: str, column_name: str, encode: Callable[[Any], bytes]) -> None:
+    table = sa.table(table_name, sa.column('id', sa.Integer), sa.column(column_name))
+    column = table.c[column_name]
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(table.c.id, column)
+            .where(table.c.id > last_id, column.is_not(None))
+            .order_by(table.c.id)
+            .limit(_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        bind.execute(
+            table.update()
+            .where(table.c.id == sa.bindparam('row_id'))
+            .values({column_name: sa.bindparam('value', type_=sa.LargeBinary)}),
+            [
+                {
+                    'row_id': row_id,
+                    'value': encode(decompress(value if isinstance(value, str) else bytes(value))),
+                }
+                for row_id, value in rows
+            ],
+        )
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    for table_name, column_name, nullable in _COMPRESSED_COLUMNS:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.alter_column(
+                column_name,
+                existing_type=sa.JSON(),
+                type_=sa.LargeBinary(),
+                existing_nullable=nullable,
+                postgresql_using=f"convert_to({column_name}::text, 'UTF8')",
+            )
+
+        _rewrite_rows(table_name, column_name, compress)
+
+    outgoing_activity = sa.table('outgoing_activity', sa.column('last_response', sa.String))
+    op.execute(
+        outgoing_activity.update()
+        .where(sa.func.length(outgoing_activity.c.last_response) > _LAST_RESPONSE_MAX_LENGTH)
+        .values(last_response=sa.func.substr(outgoing_activity.c.last_response, 1, _LAST_RESPONSE_MAX_LENGTH))
+    )
+
+
+def downgrade() -> None:
+    for table_name, column_name, nullable in reversed(_COMPRESSED_COLUMNS):
+        _rewrite_rows(table_name, column_name, json_codec.dumps_bytes)
+
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.alter_column(
+                column_name,
+                existing_type=sa.LargeBinary(),
+                type_=sa.JSON(),
+                existing_nullable=nullable,
+                postgresql_using=f"convert_from({column_name}, 'UTF8')::json",
+            )
@@ -0,0 +1,35 @@
+"""Add search index
+
+Revision ID: 3d8b6f1e2a57
+Revises: 6f3a9d2c8e41
+Create Date: 2023-01-08 16:30:12.184307+00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3d8b6f1e2a57'
+down_revision = '6f3a9d2c8e41'
+branch_labels = None
+depends_on = None
+
+# Full-text search is SQLite only (FTS5), existing data is indexed with
+# `inv rebuild-search-index`
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return None
+
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "kind UNINDEXED, ref_id UNINDEXED, title, content, tags, "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return None
+
+    op.execute("DROP TABLE IF EXISTS search_index")
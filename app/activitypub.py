@@ -15,6 +15,7 @@ from app.httpsig import auth
 from app.key import get_pubkey_as_pem
 from app.source import dedup_tags
 from app.source import hashtagify
+from app.utils import timings
 from app.utils.url import check_url
 
 if TYPE_CHECKING:
@@ -180,17 +181,18 @@ async def fetch(
     logger.info(f"Fetching {url} ({params=})")
     check_url(url)
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            url,
-            headers={
-                "User-Agent": config.USER_AGENT,
-                "Accept": config.AP_CONTENT_TYPE,
-            },
-            params=params,
-            follow_redirects=True,
-            auth=None if disable_httpsig else auth,
-        )
+    with timings.network():
+        async with httpx.AsyncClient() as client:
+            resp = await client.get(
+                url,
+                headers={
+                    "User-Agent": config.USER_AGENT,
+                    "Accept": config.AP_CONTENT_TYPE,
+                },
+                params=params,
+                follow_redirects=True,
+                auth=None if disable_httpsig else auth,
+            )
 
     # Special handling for deleted object
     if resp.status_code == 410:
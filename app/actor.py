@@ -9,7 +9,6 @@ from urllib.parse import urlparse
 import httpx
 from loguru import logger
 from sqlalchemy import select
-from sqlalchemy.orm import joinedload
 
 from app import activitypub as ap
 from app import media
@@ -18,6 +17,7 @@ from app.config import USER_AGENT
 from app.config import USERNAME
 from app.config import WEBFINGER_DOMAIN
 from app.database import AsyncSession
+from app.utils import timings
 from app.utils.datetime import as_utc
 from app.utils.datetime import now
 
@@ -211,7 +211,9 @@ LOCAL_ACTOR = RemoteActor(ap_actor=ap.ME, handle=f"@{USERNAME}@{WEBFINGER_DOMAIN
 
 
 async def save_actor(db_session: AsyncSession, ap_actor: ap.RawObject) -> "ActorModel":
+    from app import known_actors
     from app import models
+    from app import search
 
     if ap_type := ap_actor.get("type") not in ap.ACTOR_TYPES:
         raise ValueError(f"Invalid type {ap_type} for actor {ap_actor}")
@@ -225,9 +227,12 @@ async def save_actor(db_session: AsyncSession, ap_actor: ap.RawObject) -> "Actor
     db_session.add(actor)
     await db_session.flush()
     await db_session.refresh(actor)
+    await search.index(db_session, actor)
+    known_actors.add_actor(actor)
     return actor
 
 
+@timings.stage
 async def fetch_actor(
     db_session: AsyncSession,
     actor_id: str,
@@ -297,11 +302,14 @@ async def update_actor_if_needed(
     actor_in_db: "ActorModel",
     ra: RemoteActor,
 ) -> None:
+    from app import search
+
     # Check if we actually need to udpte the actor in DB
     if _actor_hash(ra) != _actor_hash(actor_in_db):
         actor_in_db.ap_actor = ra.ap_actor
         actor_in_db.handle = ra.handle
         actor_in_db.ap_type = ra.ap_type
+        await search.index(db_session, actor_in_db)
 
     actor_in_db.updated_at = now()
     await db_session.flush()
@@ -331,16 +339,18 @@ async def get_actors_metadata(
 
     ap_actor_ids = [actor.ap_id for actor in actors]
     followers = {
-        follower.ap_actor_id: follower.inbox_object.ap_id
-        for follower in (
-            await db_session.scalars(
-                select(models.Follower)
-                .where(models.Follower.ap_actor_id.in_(ap_actor_ids))
-                .options(joinedload(models.Follower.inbox_object))
+        follower.ap_actor_id: follower.inbox_follow_ap_id
+        for follower in await db_session.execute(
+            select(
+                models.Follower.ap_actor_id,
+                models.InboxObject.ap_id.label("inbox_follow_ap_id"),
+            )
+            .join(
+                models.InboxObject,
+                models.InboxObject.id == models.Follower.inbox_object_id,
             )
+            .where(models.Follower.ap_actor_id.in_(ap_actor_ids))
         )
-        .unique()
-        .all()
     }
     following = {
         following.ap_actor_id
@@ -351,9 +361,12 @@ async def get_actors_metadata(
         )
     }
     sent_follow_requests = {
-        follow_req.ap_object["object"]: follow_req.ap_id
+        follow_req.activity_object_ap_id: follow_req.ap_id
         for follow_req in await db_session.execute(
-            select(models.OutboxObject.ap_object, models.OutboxObject.ap_id).where(
+            select(
+                models.OutboxObject.activity_object_ap_id,
+                models.OutboxObject.ap_id,
+            ).where(
                 models.OutboxObject.ap_type == "Follow",
                 models.OutboxObject.undone_by_outbox_object_id.is_(None),
                 models.OutboxObject.activity_object_ap_id.in_(ap_actor_ids),
@@ -380,22 +393,38 @@ async def get_actors_metadata(
         )
     }
 
+    # Loaded at once, `fetch_actor` is only called for the ones to refresh
+    moved_to_actors = (
+        {
+            moved_to_actor.ap_id: moved_to_actor
+            for moved_to_actor in await db_session.scalars(
+                select(models.Actor).where(
+                    models.Actor.ap_id.in_(
+                        [actor.moved_to for actor in actors if actor.moved_to]
+                    ),
+                    models.Actor.is_deleted.is_(False),
+                )
+            )
+        }
+        if any(actor.moved_to for actor in actors)
+        else {}
+    )
+
     idx: ActorsMetadata = {}
     for actor in actors:
         if not actor.ap_id:
             raise ValueError("Should never happen")
         moved_to = None
-        if actor.moved_to:
-            try:
-                moved_to = await fetch_actor(
-                    db_session,
-                    actor.moved_to,
-                    save_if_not_found=False,
-                )
-            except ap.ObjectNotFoundError:
-                pass
-            except Exception:
-                logger.exception(f"Failed to fetch {actor.moved_to=}")
+        if actor.moved_to and (moved_to := moved_to_actors.get(actor.moved_to)):
+            if now() - as_utc(moved_to.updated_at) > timedelta(hours=24):
+                try:
+                    moved_to = await fetch_actor(
+                        db_session,
+                        actor.moved_to,
+                        save_if_not_found=False,
+                    )
+                except Exception:
+                    logger.exception(f"Failed to refresh {actor.moved_to=}")
 
         idx[actor.ap_id] = ActorMetadata(
             ap_actor_id=actor.ap_id,
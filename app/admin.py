@@ -16,11 +16,14 @@ from sqlalchemy import delete
 from sqlalchemy import func
 from sqlalchemy import or_
 from sqlalchemy import select
+from sqlalchemy import tuple_
 from sqlalchemy.orm import joinedload
 
 from app import activitypub as ap
 from app import boxes
+from app import known_actors
 from app import models
+from app import search
 from app import templates
 from app.actor import LOCAL_ACTOR
 from app.actor import fetch_actor
@@ -36,12 +39,14 @@ from app.config import generate_csrf_token
 from app.config import session_serializer
 from app.config import verify_csrf_token
 from app.config import verify_password
+from app.database import IS_SQLITE
 from app.database import AsyncSession
 from app.database import get_db_session
 from app.lookup import lookup
 from app.templates import is_current_user_admin
 from app.uploads import save_upload
 from app.utils import pagination
+from app.utils import stats
 from app.utils.emoji import EMOJIS_BY_NAME
 
 
@@ -157,6 +162,43 @@ async def get_lookup(
     )
 
 
+@router.get("/search")
+async def admin_search(
+    request: Request,
+    query: str | None = None,
+    cursor: str | None = None,
+    db_session: AsyncSession = Depends(get_db_session),
+) -> templates.TemplateResponse:
+    results: list[models.InboxObject | models.OutboxObject | models.Actor] = []
+    next_cursor = None
+    if query:
+        search_results, next_cursor = await search.search(db_session, query, cursor)
+        results = await search.load_results(db_session, search_results)
+
+    actors_metadata = await get_actors_metadata(
+        db_session,
+        [
+            result.actor if not isinstance(result, models.Actor) else result
+            for result in results
+            if not isinstance(result, models.OutboxObject)
+        ],
+    )
+
+    return await templates.render_template(
+        db_session,
+        request,
+        "admin_search.html",
+        {
+            "query": query,
+            "results": results,
+            "next_cursor": next_cursor,
+            "actors_metadata": actors_metadata,
+            "is_search_enabled": IS_SQLITE,
+            "is_index_empty": await search.is_index_empty(db_session),
+        },
+    )
+
+
 @router.get("/new")
 async def admin_new(
     request: Request,
@@ -272,25 +314,53 @@ async def admin_stream(
     db_session: AsyncSession = Depends(get_db_session),
     cursor: str | None = None,
 ) -> templates.TemplateResponse:
-    where = [
-        models.InboxObject.is_hidden_from_stream.is_(False),
-        models.InboxObject.is_deleted.is_(False),
-    ]
+    page_size = 20
+    where = [models.InboxObject.is_deleted.is_(False)]
     if cursor:
         where.append(
-            models.InboxObject.ap_published_at < pagination.decode_cursor(cursor)
+            tuple_(  # type: ignore
+                models.StreamEntry.ap_published_at,
+                models.StreamEntry.inbox_object_id,
+            )
+            < tuple_(*pagination.decode_keyset_cursor(cursor))  # type: ignore
         )
 
-    page_size = 20
-    remaining_count = await db_session.scalar(
-        select(func.count(models.InboxObject.id)).where(*where)
+    # Keyset pagination over the materialized stream, the extra row tells if
+    # there's a next page
+    stream_entries = (
+        await db_session.execute(
+            select(
+                models.StreamEntry.inbox_object_id,
+                models.StreamEntry.ap_published_at,
+            )
+            .join(
+                models.InboxObject,
+                models.InboxObject.id == models.StreamEntry.inbox_object_id,
+            )
+            .where(*where)
+            .order_by(
+                models.StreamEntry.ap_published_at.desc(),
+                models.StreamEntry.inbox_object_id.desc(),
+            )
+            .limit(page_size + 1)
+        )
+    ).all()
+    next_cursor = (
+        pagination.encode_keyset_cursor(
+            stream_entries[page_size - 1].ap_published_at,
+            stream_entries[page_size - 1].inbox_object_id,
+        )
+        if len(stream_entries) > page_size
+        else None
     )
-    q = select(models.InboxObject).where(*where)
 
-    inbox = (
+    inbox_object_ids = [entry.inbox_object_id for entry in stream_entries[:page_size]]
+    inbox_objects = (
         (
             await db_session.scalars(
-                q.options(
+                select(models.InboxObject)
+                .where(models.InboxObject.id.in_(inbox_object_ids))
+                .options(
                     joinedload(models.InboxObject.relates_to_inbox_object).options(
                         joinedload(models.InboxObject.actor)
                     ),
@@ -301,19 +371,20 @@ async def admin_stream(
                     ),
                     joinedload(models.InboxObject.actor),
                 )
-                .order_by(models.InboxObject.ap_published_at.desc())
-                .limit(20)
             )
         )
         .unique()
         .all()
     )
-
-    next_cursor = (
-        pagination.encode_cursor(inbox[-1].ap_published_at)
-        if inbox and remaining_count > page_size
-        else None
-    )
+    # Keep the order of the stream (with the tiebreaker)
+    inbox_objects_by_id = {
+        inbox_object.id: inbox_object for inbox_object in inbox_objects
+    }
+    inbox = [
+        inbox_objects_by_id[inbox_object_id]
+        for inbox_object_id in inbox_object_ids
+        if inbox_object_id in inbox_objects_by_id
+    ]
 
     actors_metadata = await get_actors_metadata(
         db_session,
@@ -337,6 +408,103 @@ async def admin_stream(
     )
 
 
+@router.get("/tags")
+async def admin_tags(
+    request: Request,
+    tag: str | None = None,
+    db_session: AsyncSession = Depends(get_db_session),
+    cursor: str | None = None,
+) -> templates.TemplateResponse:
+    followed_hashtags = (
+        await db_session.scalars(
+            select(models.FollowedHashtag.tag).order_by(models.FollowedHashtag.tag)
+        )
+    ).all()
+
+    inbox: list[models.InboxObject] = []
+    next_cursor = None
+    if tag:
+        tag = tag.removeprefix("#").lower()
+        page_size = 20
+        where = [
+            models.TaggedInboxObject.tag == tag,
+            models.InboxObject.is_deleted.is_(False),
+        ]
+        if cursor:
+            where.append(
+                tuple_(  # type: ignore
+                    models.TaggedInboxObject.ap_published_at,
+                    models.TaggedInboxObject.inbox_object_id,
+                )
+                < tuple_(*pagination.decode_keyset_cursor(cursor))  # type: ignore
+            )
+
+        tagged_objects = (
+            await db_session.execute(
+                select(
+                    models.TaggedInboxObject.inbox_object_id,
+                    models.TaggedInboxObject.ap_published_at,
+                )
+                .join(
+                    models.InboxObject,
+                    models.InboxObject.id == models.TaggedInboxObject.inbox_object_id,
+                )
+                .where(*where)
+                .order_by(
+                    models.TaggedInboxObject.ap_published_at.desc(),
+                    models.TaggedInboxObject.inbox_object_id.desc(),
+                )
+                .limit(page_size + 1)
+            )
+        ).all()
+        next_cursor = (
+            pagination.encode_keyset_cursor(
+                tagged_objects[page_size - 1].ap_published_at,
+                tagged_objects[page_size - 1].inbox_object_id,
+            )
+            if len(tagged_objects) > page_size
+            else None
+        )
+
+        inbox_object_ids = [
+            tagged_object.inbox_object_id
+            for tagged_object in tagged_objects[:page_size]
+        ]
+        inbox_objects = (
+            (
+                await db_session.scalars(
+                    select(models.InboxObject)
+                    .where(models.InboxObject.id.in_(inbox_object_ids))
+                    .options(joinedload(models.InboxObject.actor))
+                )
+            )
+            .unique()
+            .all()
+        )
+        # Keep the order of the tag timeline (with the tiebreaker)
+        inbox_objects_by_id = {
+            inbox_object.id: inbox_object for inbox_object in inbox_objects
+        }
+        inbox = [
+            inbox_objects_by_id[inbox_object_id]
+            for inbox_object_id in inbox_object_ids
+            if inbox_object_id in inbox_objects_by_id
+        ]
+
+    return await templates.render_template(
+        db_session,
+        request,
+        "admin_tags.html",
+        {
+            "tag": tag,
+            "is_followed": tag in followed_hashtags,
+            "followed_hashtags": followed_hashtags,
+            "inbox": inbox,
+            "next_cursor": next_cursor,
+        },
+    )
+
+
 @router.get("/inbox")
 async def admin_inbox(
     request: Request,
@@ -572,35 +740,58 @@ async def admin_direct_messages(
         else []
     )
 
-    # Build the template response
-    threads = []
-    for anybox_object in sorted(
+    # Fetch the participants of all the threads at once, if a message from the
+    # outbox starts a thread with no replies, look at the mentions
+    sorted_last_objects = sorted(
         last_from_inbox + last_from_outbox,
         key=lambda x: x.ap_published_at,
         reverse=True,
-    ):
-        convo = convos[anybox_object.ap_context]
-        actors = list(
-            (
-                await db_session.execute(
-                    select(models.Actor).where(models.Actor.id.in_(convo["actor_ids"]))
-                )
-            ).scalars()
-        )
-        # If this message from outbox starts a thread with no replies, look
-        # at the mentions
-        if not actors and anybox_object.is_from_outbox:
-            actors = (  # type: ignore
-                await db_session.execute(
-                    select(models.Actor).where(
-                        models.Actor.ap_id.in_(
-                            mention["href"]
-                            for mention in anybox_object.tags
-                            if mention["type"] == "Mention"
-                        )
+    )
+    mentions_by_context = {
+        anybox_object.ap_context: [
+            mention["href"]
+            for mention in anybox_object.tags
+            if mention["type"] == "Mention"
+        ]
+        for anybox_object in sorted_last_objects
+        if anybox_object.is_from_outbox
+        and not convos[anybox_object.ap_context]["actor_ids"]
+    }
+    actor_ids = set().union(*[convo["actor_ids"] for convo in convos.values()])
+    actor_ap_ids = set().union(*mentions_by_context.values())
+    participants = (
+        (
+            await db_session.scalars(
+                select(models.Actor).where(
+                    or_(
+                        models.Actor.id.in_(actor_ids),
+                        models.Actor.ap_id.in_(actor_ap_ids),
                     )
                 )
-            ).scalars()
+            )
+        ).all()
+        if actor_ids or actor_ap_ids
+        else []
+    )
+    actors_by_id = {actor.id: actor for actor in participants}
+    actors_by_ap_id = {actor.ap_id: actor for actor in participants}
+
+    # Build the template response
+    threads = []
+    for anybox_object in sorted_last_objects:
+        convo = convos[anybox_object.ap_context]
+        if anybox_object.ap_context in mentions_by_context:
+            actors = [
+                actors_by_ap_id[ap_id]
+                for ap_id in mentions_by_context[anybox_object.ap_context]
+                if ap_id in actors_by_ap_id
+            ]
+        else:
+            actors = [
+                actors_by_id[actor_id]
+                for actor_id in convo["actor_ids"]
+                if actor_id in actors_by_id
+            ]
         threads.append((anybox_object, convo, actors))
 
     return await templates.render_template(
@@ -766,6 +957,42 @@ async def get_notifications(
     return tpl_resp
 
 
+@router.get("/stats")
+async def admin_stats(
+    request: Request,
+    db_session: AsyncSession = Depends(get_db_session),
+) -> templates.TemplateResponse:
+    return await templates.render_template(
+        db_session,
+        request,
+        "admin_stats.html",
+        {
+            "outgoing_activity_stats": await stats.get_outgoing_activity_stats(
+                db_session
+            ),
+            "unhealthy_hosts": await stats.get_unhealthy_outgoing_hosts(db_session),
+            "dropped_activities": known_actors.get_dropped_activities_count(),
+        },
+    )
+
+
+@router.get("/processing")
+async def admin_processing(
+    request: Request,
+    db_session: AsyncSession = Depends(get_db_session),
+) -> templates.TemplateResponse:
+    return await templates.render_template(
+        db_session,
+        request,
+        "admin_processing.html",
+        {
+            "processing_stats": await stats.get_incoming_processing_stats(
+                db_session, limit=20
+            ),
+        },
+    )
+
+
 @router.get("/object")
 async def admin_object(
     request: Request,
@@ -965,6 +1192,39 @@ async def admin_actions_unblock(
     return RedirectResponse(redirect_url, status_code=302)
 
 
+@router.post("/actions/follow_hashtag")
+async def admin_actions_follow_hashtag(
+    request: Request,
+    tag: str = Form(),
+    redirect_url: str = Form(),
+    csrf_check: None = Depends(verify_csrf_token),
+    db_session: AsyncSession = Depends(get_db_session),
+) -> RedirectResponse:
+    tag = tag.removeprefix("#").lower()
+    if tag and not await db_session.scalar(
+        select(models.FollowedHashtag.id).where(models.FollowedHashtag.tag == tag)
+    ):
+        db_session.add(models.FollowedHashtag(tag=tag))
+        await db_session.commit()
+    return RedirectResponse(redirect_url, status_code=302)
+
+
+@router.post("/actions/unfollow_hashtag")
+async def admin_actions_unfollow_hashtag(
+    request: Request,
+    tag: str = Form(),
+    redirect_url: str = Form(),
+    csrf_check: None = Depends(verify_csrf_token),
+    db_session: AsyncSession = Depends(get_db_session),
+) -> RedirectResponse:
+    tag = tag.removeprefix("#").lower()
+    await db_session.execute(
+        delete(models.FollowedHashtag).where(models.FollowedHashtag.tag == tag)
+    )
+    await db_session.commit()
+    return RedirectResponse(redirect_url, status_code=302)
+
+
 @router.post("/actions/hide_announces")
 async def admin_actions_hide_announces(
     request: Request,
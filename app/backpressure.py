@@ -0,0 +1,192 @@
+"""Admission control for the inbox.
+
+Activities are rejected with a 429 (and a Retry-After header) when the sending
+host exceeds its rate limit, or when the incoming activities queue is too far
+behind. Limits are tracked per process.
+
+The queue depth is checked before the HTTP signature verification (that may
+require fetching the public key of the sender), the rate limits are charged
+after it, on the verified host (or on the client IP if the signature is not
+valid).
+"""
+import math
+import time
+from dataclasses import dataclass
+from typing import MutableMapping
+
+import fastapi
+from cachetools import TTLCache
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy import union
+
+from app import config
+from app import httpsig
+from app import models
+from app.database import AsyncSession
+from app.database import get_db_session
+
+# The queue depth and the known actors are cached to avoid querying the DB for
+# every request
+_QUEUE_DEPTH_TTL = 5.0
+_KNOWN_ACTORS_TTL = 60.0
+
+# Retry-After sent when the queue is full
+_QUEUE_FULL_RETRY_AFTER = 60
+
+
+@dataclass
+class TokenBucket:
+    capacity: float
+    refill_rate: float  # tokens per second
+    tokens: float
+    updated_at: float
+
+    def consume(self) -> float | None:
+        """Returns None if a token was consumed, or the number of seconds to
+        wait for the next token."""
+        current_time = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (current_time - self.updated_at) * self.refill_rate,
+        )
+        self.updated_at = current_time
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return None
+
+        return (1 - self.tokens) / self.refill_rate
+
+
+_BUCKETS: MutableMapping[tuple[str, bool], TokenBucket] = TTLCache(
+    maxsize=10_000, ttl=3600
+)
+
+
+@dataclass
+class _CachedValue:
+    value: object
+    expires_at: float
+
+
+_CACHE: dict[str, _CachedValue] = {}
+
+
+async def _get_queue_depth(db_session: AsyncSession) -> int:
+    cached = _CACHE.get("queue_depth")
+    if cached and cached.expires_at > time.monotonic():
+        return cached.value  # type: ignore
+
+    queue_depth = await db_session.scalar(
+        select(func.count(models.IncomingActivity.id)).where(
+            models.IncomingActivity.is_processed.is_(False),
+            models.IncomingActivity.is_errored.is_(False),
+        )
+    )
+    _CACHE["queue_depth"] = _CachedValue(
+        queue_depth, time.monotonic() + _QUEUE_DEPTH_TTL
+    )
+    return queue_depth
+
+
+async def _get_known_actors(db_session: AsyncSession) -> set[str]:
+    cached = _CACHE.get("known_actors")
+    if cached and cached.expires_at > time.monotonic():
+        return cached.value  # type: ignore
+
+    known_actors = set(
+        (
+            await db_session.scalars(
+                union(
+                    select(models.Follower.ap_actor_id),
+                    select(models.Following.ap_actor_id),
+                )
+            )
+        ).all()
+    )
+    _CACHE["known_actors"] = _CachedValue(
+        known_actors, time.monotonic() + _KNOWN_ACTORS_TTL
+    )
+    return known_actors
+
+
+def _too_many_requests(retry_after: float) -> fastapi.HTTPException:
+    return fastapi.HTTPException(
+        status_code=429,
+        detail="Too many requests",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def _check_queue_depth(db_session: AsyncSession, max_queue_size: int) -> None:
+    queue_depth = await _get_queue_depth(db_session)
+    if queue_depth >= max_queue_size:
+        logger.warning(f"Incoming queue is full {queue_depth=}")
+        raise _too_many_requests(_QUEUE_FULL_RETRY_AFTER)
+
+
+def _consume_token(key: tuple[str, bool], limit: int) -> None:
+    bucket = _BUCKETS.get(key)
+    if not bucket:
+        bucket = TokenBucket(
+            capacity=limit,
+            refill_rate=limit / 60,
+            tokens=limit,
+            updated_at=time.monotonic(),
+        )
+        _BUCKETS[key] = bucket
+
+    if (retry_after := bucket.consume()) is not None:
+        logger.warning(f"Rate limiting {key[0]} {retry_after=}")
+        raise _too_many_requests(retry_after)
+
+
+async def enforce_inbox_admission(
+    db_session: AsyncSession = fastapi.Depends(get_db_session),
+) -> None:
+    """FastAPI Depends, raises a 429 if the incoming queue is full, before
+    verifying the HTTP signature.
+
+    The sender is not verified yet, so the higher limit of the known actors
+    applies to everyone.
+    """
+    if config.INBOX_MAX_QUEUE_SIZE:
+        await _check_queue_depth(db_session, config.INBOX_MAX_QUEUE_SIZE * 2)
+
+    return None
+
+
+async def enforce_inbox_rate_limit(
+    request: fastapi.Request,
+    httpsig_info: httpsig.HTTPSigInfo = fastapi.Depends(httpsig.httpsig_checker),
+    db_session: AsyncSession = fastapi.Depends(get_db_session),
+) -> None:
+    """FastAPI Depends, raises a 429 if the sender exceeds its rate limit (or
+    if the queue is full for actors that are not known)."""
+    if not httpsig_info.has_valid_signature:
+        # Not verified, the keyId may be forged so limit the client IP instead
+        if not config.INBOX_RATE_LIMIT or not request.client:
+            return None
+
+        _consume_token((f"ip:{request.client.host}", False), config.INBOX_RATE_LIMIT)
+        return None
+
+    is_known_actor = httpsig_info.signed_by_ap_actor_id in await _get_known_actors(
+        db_session
+    )
+
+    if config.INBOX_MAX_QUEUE_SIZE and not is_known_actor:
+        await _check_queue_depth(db_session, config.INBOX_MAX_QUEUE_SIZE)
+
+    limit = (
+        config.INBOX_RATE_LIMIT_KNOWN_ACTORS
+        if is_known_actor
+        else config.INBOX_RATE_LIMIT
+    )
+    if not limit or not httpsig_info.server:
+        return None
+
+    _consume_token((httpsig_info.server, is_known_actor), limit)
+    return None
@@ -1,4 +1,5 @@
 """Actions related to the AP inbox/outbox."""
+import asyncio
 import datetime
 import uuid
 from collections import defaultdict
@@ -9,17 +10,23 @@ from urllib.parse import urlparse
 import fastapi
 import httpx
 from loguru import logger
+from sqlalchemy import and_
 from sqlalchemy import delete
+from sqlalchemy import exists
 from sqlalchemy import func
+from sqlalchemy import or_
 from sqlalchemy import select
 from sqlalchemy import update
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer
 from sqlalchemy.orm import joinedload
 
 from app import activitypub as ap
 from app import config
+from app import discovery_cache
 from app import ldsig
 from app import models
+from app import search
 from app.actor import LOCAL_ACTOR
 from app.actor import Actor
 from app.actor import RemoteActor
@@ -34,12 +41,13 @@ from app.config import set_moved_to
 from app.config import stream_visibility_callback
 from app.customization import ObjectInfo
 from app.database import AsyncSession
+from app.outgoing_activities import new_outgoing_activities
 from app.outgoing_activities import new_outgoing_activity
 from app.source import dedup_tags
 from app.source import markdownify
 from app.uploads import upload_to_attachment
 from app.utils import opengraph
-from app.utils import webmentions
+from app.utils import timings
 from app.utils.datetime import as_utc
 from app.utils.datetime import now
 from app.utils.datetime import parse_isoformat
@@ -49,6 +57,9 @@ from app.utils.url import is_hostname_blocked
 
 AnyboxObject = models.InboxObject | models.OutboxObject
 
+# Max number of unknown recipients fetched in parallel by `_compute_recipients`
+_MAX_CONCURRENT_RECIPIENT_FETCHES = 10
+
 
 def is_notification_enabled(notification_type: models.NotificationType) -> bool:
     """Checks if a given notification type is enabled."""
@@ -104,6 +115,7 @@ async def save_outbox_object(
     db_session.add(outbox_object)
     await db_session.flush()
     await db_session.refresh(outbox_object)
+    await search.index(db_session, outbox_object)
 
     return outbox_object
 
@@ -113,10 +125,12 @@ async def send_unblock(db_session: AsyncSession, ap_actor_id: str) -> None:
 
     block_activity = (
         await db_session.scalars(
-            select(models.OutboxObject).where(
+            select(models.OutboxObject)
+            .where(
                 models.OutboxObject.activity_object_ap_id == actor.ap_id,
                 models.OutboxObject.is_deleted.is_(False),
             )
+            .options(defer(models.OutboxObject.ap_object))
         )
     ).one_or_none()
     if not block_activity:
@@ -218,13 +232,13 @@ async def send_delete(db_session: AsyncSession, ap_object_id: str) -> None:
 
     outbox_object_to_delete.is_deleted = True
     await db_session.flush()
+    await search.index(db_session, outbox_object_to_delete)
 
     # Compute the original recipients
     recipients = await _compute_recipients(
         db_session, outbox_object_to_delete.ap_object
     )
-    for rcp in recipients:
-        await new_outgoing_activity(db_session, rcp, outbox_object.id)
+    await new_outgoing_activities(db_session, recipients, outbox_object.id)
 
     # Revert side effects
     if outbox_object_to_delete.in_reply_to:
@@ -325,8 +339,7 @@ async def send_announce(db_session: AsyncSession, ap_object_id: str) -> None:
     inbox_object.announced_via_outbox_object_ap_id = outbox_object.ap_id
 
     recipients = await _compute_recipients(db_session, announce)
-    for rcp in recipients:
-        await new_outgoing_activity(db_session, rcp, outbox_object.id)
+    await new_outgoing_activities(db_session, recipients, outbox_object.id)
 
     await db_session.commit()
 
@@ -354,7 +367,12 @@ async def _send_follow(db_session: AsyncSession, ap_actor_id: str) -> None:
     if not outbox_object.id:
         raise ValueError("Should never happen")
 
-    await new_outgoing_activity(db_session, actor.inbox_url, outbox_object.id)
+    await new_outgoing_activity(
+        db_session,
+        actor.inbox_url,
+        outbox_object.id,
+        priority=models.DeliveryPriority.INTERACTIVE,
+    )
 
     # Caller should commit
 
@@ -412,6 +430,7 @@ async def _send_undo(db_session: AsyncSession, ap_object_id: str) -> None:
                 models.Following.ap_actor_id == followed_actor.ap_id
             )
         )
+        await _remove_actor_from_stream(db_session, followed_actor)
     elif outbox_object_to_undo.ap_type == "Like":
         liked_object_ap_id = outbox_object_to_undo.activity_object_ap_id
         if not liked_object_ap_id:
@@ -442,8 +461,7 @@ async def _send_undo(db_session: AsyncSession, ap_object_id: str) -> None:
         recipients = await _compute_recipients(
             db_session, outbox_object_to_undo.ap_object
         )
-        for rcp in recipients:
-            await new_outgoing_activity(db_session, rcp, outbox_object.id)
+        await new_outgoing_activities(db_session, recipients, outbox_object.id)
     elif outbox_object_to_undo.ap_type == "Block":
         if not outbox_object_to_undo.activity_object_ap_id:
             raise ValueError(f"Invalid block activity {outbox_object_to_undo.ap_id}")
@@ -545,8 +563,7 @@ async def send_move(
         raise ValueError("Should never happen")
 
     recipients = await _get_followers_recipients(db_session)
-    for rcp in recipients:
-        await new_outgoing_activity(db_session, rcp, outbox_object.id)
+    await new_outgoing_activities(db_session, recipients, outbox_object.id)
 
     # Store the moved to in order to update the profile
     set_moved_to(target)
@@ -573,8 +590,12 @@ async def send_self_destruct(db_session: AsyncSession) -> None:
         raise ValueError("Should never happen")
 
     recipients = await compute_all_known_recipients(db_session)
-    for rcp in recipients:
-        await new_outgoing_activity(db_session, rcp, outbox_object.id)
+    await new_outgoing_activities(
+        db_session,
+        recipients,
+        outbox_object.id,
+        priority=models.DeliveryPriority.BULK,
+    )
 
     await db_session.commit()
 
@@ -722,24 +743,8 @@ async def send_create(
         )
         db_session.add(outbox_object_attachment)
 
-    recipients = await _compute_recipients(db_session, obj)
-    for rcp in recipients:
-        await new_outgoing_activity(db_session, rcp, outbox_object.id)
-
-    # If the note is public, check if we need to send any webmentions
-    if visibility == ap.VisibilityEnum.PUBLIC:
-        possible_targets = await opengraph.external_urls(db_session, outbox_object)
-        logger.info(f"webmentions possible targert {possible_targets}")
-        for target in possible_targets:
-            webmention_endpoint = await webmentions.discover_webmention_endpoint(target)
-            logger.info(f"{target=} {webmention_endpoint=}")
-            if webmention_endpoint:
-                await new_outgoing_activity(
-                    db_session,
-                    webmention_endpoint,
-                    outbox_object_id=outbox_object.id,
-                    webmention_target=target,
-                )
+    # The recipients and webmentions will be computed by the outgoing worker
+    schedule_fan_out(outbox_object)
 
     await db_session.commit()
 
@@ -815,8 +820,12 @@ async def send_vote(
             raise ValueError("Should never happen")
 
         recipients = await _compute_recipients(db_session, note)
-        for rcp in recipients:
-            await new_outgoing_activity(db_session, rcp, outbox_object.id)
+        await new_outgoing_activities(
+            db_session,
+            recipients,
+            outbox_object.id,
+            priority=models.DeliveryPriority.INTERACTIVE,
+        )
 
     await db_session.commit()
     return vote_id
@@ -869,18 +878,99 @@ async def send_update(
     outbox_object.ap_object = note
     outbox_object.source = source
     outbox_object.revisions = revisions
+    await search.index(db_session, outbox_object)
+    schedule_fan_out(outbox_object)
 
-    recipients = await _compute_recipients(db_session, note)
-    for rcp in recipients:
-        await new_outgoing_activity(db_session, rcp, outbox_object.id)
+    await db_session.commit()
+    return outbox_object.public_id  # type: ignore
 
-    # If the note is public, check if we need to send any webmentions
-    if outbox_object.visibility == ap.VisibilityEnum.PUBLIC:
 
+def schedule_fan_out(
+    outbox_object: models.OutboxObject,
+    fan_out_status: models.FanOutStatus = models.FanOutStatus.PENDING,
+) -> None:
+    """Mark the object as needing to be (re-)sent by the outgoing worker.
+
+    Fan-outs are debounced: at most one is done per object and per
+    `UPDATE_DEBOUNCE_SECONDS`, changes made in the meantime are coalesced.
+    """
+    # A pending full fan-out (new/edited object) already covers an update
+    if outbox_object.fan_out_status != models.FanOutStatus.PENDING:
+        outbox_object.fan_out_status = fan_out_status
+
+    fan_out_after = now()
+    if outbox_object.last_fan_out_at:
+        fan_out_after = max(
+            fan_out_after,
+            as_utc(outbox_object.last_fan_out_at)
+            + timedelta(seconds=config.UPDATE_DEBOUNCE_SECONDS),
+        )
+    outbox_object.fan_out_after = fan_out_after
+
+
+async def fan_out_outbox_object(
+    db_session: AsyncSession,
+    outbox_object: models.OutboxObject,
+) -> None:
+    """Queue the outgoing activities for an object scheduled with
+    `schedule_fan_out` (run by the outgoing worker)."""
+    recipients = await _compute_recipients(db_session, outbox_object.ap_object)
+
+    # Deliveries not sent yet will send the latest version of the object
+    already_queued_recipients = set(
+        (
+            await db_session.scalars(
+                select(models.OutgoingActivity.recipient).where(
+                    models.OutgoingActivity.outbox_object_id == outbox_object.id,
+                    models.OutgoingActivity.webmention_target.is_(None),
+                    models.OutgoingActivity.is_sent.is_(False),
+                    models.OutgoingActivity.is_errored.is_(False),
+                )
+            )
+        ).all()
+    )
+    if already_queued_recipients:
+        logger.info(f"Coalescing {len(already_queued_recipients)} pending deliveries")
+
+    if outbox_object.fan_out_status == models.FanOutStatus.PENDING_UPDATE:
+        priority = models.DeliveryPriority.BULK
+    elif (
+        outbox_object.visibility == ap.VisibilityEnum.DIRECT
+        or outbox_object.in_reply_to
+    ):
+        priority = models.DeliveryPriority.INTERACTIVE
+    else:
+        priority = models.DeliveryPriority.NORMAL
+    await new_outgoing_activities(
+        db_session,
+        recipients - already_queued_recipients,
+        outbox_object.id,
+        priority=priority,
+    )
+
+    # If the note is public, check if we need to send any webmentions
+    if (
+        outbox_object.visibility == ap.VisibilityEnum.PUBLIC
+        and outbox_object.fan_out_status == models.FanOutStatus.PENDING
+    ):
         possible_targets = await opengraph.external_urls(db_session, outbox_object)
         logger.info(f"webmentions possible targert {possible_targets}")
-        for target in possible_targets:
-            webmention_endpoint = await webmentions.discover_webmention_endpoint(target)
+        already_queued_targets = set(
+            (
+                await db_session.scalars(
+                    select(models.OutgoingActivity.webmention_target).where(
+                        models.OutgoingActivity.outbox_object_id == outbox_object.id,
+                        models.OutgoingActivity.webmention_target.is_not(None),
+                        models.OutgoingActivity.is_sent.is_(False),
+                        models.OutgoingActivity.is_errored.is_(False),
+                    )
+                )
+            ).all()
+        )
+        for target in possible_targets - already_queued_targets:
+            webmention_endpoint = await discovery_cache.get_webmention_endpoint(
+                db_session, target
+            )
             logger.info(f"{target=} {webmention_endpoint=}")
             if webmention_endpoint:
                 await new_outgoing_activity(
@@ -890,9 +980,6 @@ async def send_update(
                     webmention_target=target,
                 )
 
-    await db_session.commit()
-    return outbox_object.public_id  # type: ignore
-
 
 async def _compute_recipients(
     db_session: AsyncSession, ap_object: ap.RawObject
@@ -903,6 +990,7 @@ async def _compute_recipients(
             _recipients.extend(ap.as_list(ap_object[field]))
 
     recipients = set()
+    remote_recipients = set()
     logger.info(f"{_recipients}")
     for r in _recipients:
         if r in [ap.AS_PUBLIC, ID]:
@@ -910,58 +998,180 @@ async def _compute_recipients(
 
         # If we got a local collection, assume it's a collection of actors
         if r.startswith(BASE_URL):
-            for actor in await fetch_actor_collection(db_session, r):
-                recipients.add(actor.shared_inbox_url)
+            if r == BASE_URL + "/followers":
+                recipients |= await _get_followers_recipients(db_session)
+            else:
+                for actor in await fetch_actor_collection(db_session, r):
+                    recipients.add(actor.shared_inbox_url)
 
             continue
 
-        # Is it a known actor?
-        known_actor = (
-            await db_session.execute(
-                select(models.Actor).where(models.Actor.ap_id == r)
+        remote_recipients.add(r)
+
+    if not remote_recipients:
+        return recipients
+
+    # Is it a known actor?
+    known_actors = (
+        await db_session.execute(
+            select(models.Actor.ap_id, models.Actor.shared_inbox_url).where(
+                models.Actor.ap_id.in_(remote_recipients)
             )
-        ).scalar_one_or_none()  # type: ignore
-        if known_actor:
-            recipients.add(known_actor.shared_inbox_url)
-            continue
+        )
+    ).all()
+    for known_actor in known_actors:
+        recipients.add(known_actor.shared_inbox_url)
+        remote_recipients.discard(known_actor.ap_id)
+
+    if not remote_recipients:
+        return recipients
+
+    # Fetch the unknown objects (actors or collections of actors) concurrently
+    semaphore = asyncio.Semaphore(_MAX_CONCURRENT_RECIPIENT_FETCHES)
+
+    async def _fetch_recipient(r: str) -> tuple[ap.RawObject | None, set[str]]:
+        async with semaphore:
+            raw_object = await ap.fetch(r)
+            if raw_object.get("type") in ap.ACTOR_TYPES:
+                return raw_object, set()
 
-        # Fetch the object
-        raw_object = await ap.fetch(r)
-        if raw_object.get("type") in ap.ACTOR_TYPES:
-            saved_actor = await save_actor(db_session, raw_object)
-            recipients.add(saved_actor.shared_inbox_url)
-        else:
             # Assume it's a collection of actors
-            for raw_actor in await ap.parse_collection(payload=raw_object):
-                actor = RemoteActor(raw_actor)
-                recipients.add(actor.shared_inbox_url)
+            return None, {
+                RemoteActor(raw_actor).shared_inbox_url
+                for raw_actor in await ap.parse_collection(payload=raw_object)
+            }
+
+    saved_actor_ap_ids = set()
+    for raw_actor, collection_recipients in await asyncio.gather(
+        *[_fetch_recipient(r) for r in remote_recipients]
+    ):
+        recipients |= collection_recipients
+        if raw_actor and ap.get_id(raw_actor) not in saved_actor_ap_ids:
+            saved_actor = await save_actor(db_session, raw_actor)
+            saved_actor_ap_ids.add(saved_actor.ap_id)
+            recipients.add(saved_actor.shared_inbox_url)
 
     return recipients
 
 
 async def compute_all_known_recipients(db_session: AsyncSession) -> set[str]:
-    return {
-        actor.shared_inbox_url or actor.inbox_url
-        for actor in (
+    return set(
+        (
             await db_session.scalars(
-                select(models.Actor).where(models.Actor.is_deleted.is_(False))
+                select(models.Actor.shared_inbox_url).where(
+                    models.Actor.is_deleted.is_(False),
+                    models.Actor.shared_inbox_url.is_not(None),
+                )
             )
         ).all()
+    )
+
+
+async def _add_to_stream(
+    db_session: AsyncSession,
+    inbox_object: models.InboxObject,
+) -> None:
+    if not inbox_object.id:
+        raise ValueError("Should never happen")
+
+    inbox_object.is_hidden_from_stream = False
+    if await _is_in_stream(db_session, inbox_object):
+        return
+
+    db_session.add(
+        models.StreamEntry(
+            inbox_object_id=inbox_object.id,
+            actor_id=inbox_object.actor_id,
+            ap_published_at=inbox_object.ap_published_at,
+        )
+    )
+
+
+async def _is_in_stream(
+    db_session: AsyncSession,
+    inbox_object: models.InboxObject,
+) -> bool:
+    """The stream entries are the source of truth, `is_hidden_from_stream` is only
+    set at ingest."""
+    return bool(
+        await db_session.scalar(
+            select(models.StreamEntry.id).where(
+                models.StreamEntry.inbox_object_id == inbox_object.id
+            )
+        )
+    )
+
+
+async def _remove_actor_from_stream(
+    db_session: AsyncSession,
+    actor: models.Actor,
+) -> None:
+    """Called on unfollow, only objects mentioning/replying to the local actor (or
+    with a followed hashtag) stay in the stream."""
+    inbox_object_ids = select(models.InboxObject.id).where(
+        models.InboxObject.actor_id == actor.id,
+        models.InboxObject.has_local_mention.is_(False),
+        or_(
+            models.InboxObject.in_reply_to.is_(None),
+            models.InboxObject.in_reply_to.not_like(f"{BASE_URL}%"),
+        ),
+        ~exists().where(
+            and_(
+                models.TaggedInboxObject.inbox_object_id == models.InboxObject.id,
+                models.TaggedInboxObject.tag.in_(select(models.FollowedHashtag.tag)),
+            )
+        ),
+    )
+    await db_session.execute(
+        delete(models.StreamEntry)
+        .where(models.StreamEntry.inbox_object_id.in_(inbox_object_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _get_hashtags(tags: list[ap.RawObject]) -> set[str]:
+    """Normalized hashtags, i.e. `#MicroblogPub` -> `microblogpub`."""
+    return {
+        tag["name"].removeprefix("#").lower()
+        for tag in tags
+        if tag.get("type") == "Hashtag" and tag.get("name")
     }
 
 
-async def _get_following(db_session: AsyncSession) -> list[models.Following]:
-    return (
-        (
-            await db_session.scalars(
-                select(models.Following).options(joinedload(models.Following.actor))
+def _tag_inbox_object(
+    db_session: AsyncSession,
+    inbox_object: models.InboxObject,
+) -> None:
+    if not inbox_object.id:
+        raise ValueError("Should never happen")
+
+    for tag in _get_hashtags(inbox_object.tags):
+        db_session.add(
+            models.TaggedInboxObject(
+                inbox_object_id=inbox_object.id,
+                tag=tag,
+                ap_published_at=inbox_object.ap_published_at,
             )
         )
-        .unique()
-        .all()
+
+
+async def _has_followed_hashtag(db_session: AsyncSession, hashtags: set[str]) -> bool:
+    if not hashtags:
+        return False
+
+    return bool(
+        await db_session.scalar(
+            select(models.FollowedHashtag.id)
+            .where(models.FollowedHashtag.tag.in_(hashtags))
+            .limit(1)
+        )
     )
 
 
+async def _get_following_ap_actor_ids(db_session: AsyncSession) -> set[str]:
+    return set((await db_session.scalars(select(models.Following.ap_actor_id))).all())
+
+
 async def _get_followers(db_session: AsyncSession) -> list[models.Follower]:
     return (
         (
@@ -979,16 +1189,19 @@ async def _get_followers_recipients(
     skip_actors: list[models.Actor] | None = None,
 ) -> set[str]:
     """Returns all the recipients from the local follower collection."""
-    actor_ap_ids_to_skip = []
+    where = []
     if skip_actors:
-        actor_ap_ids_to_skip = [actor.ap_id for actor in skip_actors]
+        where.append(models.Actor.ap_id.not_in([actor.ap_id for actor in skip_actors]))
 
-    followers = await _get_followers(db_session)
-    return {
-        follower.actor.shared_inbox_url  # type: ignore
-        for follower in followers
-        if follower.actor.ap_id not in actor_ap_ids_to_skip
-    }
+    return set(
+        (
+            await db_session.scalars(
+                select(models.Actor.shared_inbox_url)
+                .join(models.Follower, models.Follower.actor_id == models.Actor.id)
+                .where(*where)
+            )
+        ).all()
+    )
 
 
 async def get_notification_by_id(
@@ -1035,8 +1248,7 @@ async def get_inbox_delete_for_activity_object_ap_id(
             )
             .options(
                 joinedload(models.InboxObject.actor),
-                joinedload(models.InboxObject.relates_to_inbox_object),
-                joinedload(models.InboxObject.relates_to_outbox_object),
+                defer(models.InboxObject.ap_object),
             )
         )
     ).scalar_one_or_none()  # type: ignore
@@ -1119,6 +1331,7 @@ async def get_webmention_by_id(
     ).scalar_one_or_none()  # type: ignore
 
 
+@timings.stage
 async def _handle_delete_activity(
     db_session: AsyncSession,
     from_actor: models.Actor,
@@ -1166,6 +1379,7 @@ async def _handle_delete_activity(
             forwarded_by_actor,
         )
         ap_object_to_delete.is_deleted = True
+        await search.index(db_session, ap_object_to_delete)
     elif isinstance(ap_object_to_delete, models.Actor):
         if from_actor.ap_id != ap_object_to_delete.ap_id:
             logger.warning(
@@ -1189,12 +1403,14 @@ async def _handle_delete_activity(
             # Also mark Follow activities for this actor as deleted
             follow_activities = (
                 await db_session.scalars(
-                    select(models.OutboxObject).where(
+                    select(models.OutboxObject)
+                    .where(
                         models.OutboxObject.ap_type == "Follow",
                         models.OutboxObject.relates_to_actor_id
                         == ap_object_to_delete.id,
                         models.OutboxObject.is_deleted.is_(False),
                     )
+                    .options(defer(models.OutboxObject.ap_object))
                 )
             ).all()
             for follow_activity in follow_activities:
@@ -1213,9 +1429,11 @@ async def _handle_delete_activity(
         if following:
             logger.info("Removing actor from following")
             await db_session.delete(following)
+            await _remove_actor_from_stream(db_session, ap_object_to_delete)
 
         # Mark the actor as deleted
         ap_object_to_delete.is_deleted = True
+        await search.index(db_session, ap_object_to_delete)
 
         inbox_objects = (
             await db_session.scalars(
@@ -1223,6 +1441,9 @@ async def _handle_delete_activity(
                     models.InboxObject.actor_id == ap_object_to_delete.id,
                     models.InboxObject.is_deleted.is_(False),
                 )
+                # Only the denormalized columns are needed to revert the side
+                # effects, the actor may have a lot of objects
+                .options(defer(models.InboxObject.ap_object))
             )
         ).all()
         logger.info(f"Deleting {len(inbox_objects)} objects")
@@ -1234,6 +1455,11 @@ async def _handle_delete_activity(
                 forwarded_by_actor=None,
             )
             inbox_object.is_deleted = True
+        await search.remove_from_index(
+            db_session,
+            search.SearchKind.INBOX,
+            [inbox_object.id for inbox_object in inbox_objects],
+        )
     else:
         raise ValueError("Should never happen")
 
@@ -1247,16 +1473,14 @@ async def _get_replies_count(
     return (
         await db_session.scalar(
             select(func.count(models.InboxObject.id)).where(
-                func.json_extract(models.InboxObject.ap_object, "$.inReplyTo")
-                == replied_object_ap_id,
+                models.InboxObject.in_reply_to == replied_object_ap_id,
                 models.InboxObject.is_deleted.is_(False),
             )
         )
     ) + (
         await db_session.scalar(
             select(func.count(models.OutboxObject.id)).where(
-                func.json_extract(models.OutboxObject.ap_object, "$.inReplyTo")
-                == replied_object_ap_id,
+                models.OutboxObject.in_reply_to == replied_object_ap_id,
                 models.OutboxObject.is_deleted.is_(False),
             )
         )
@@ -1441,15 +1665,15 @@ async def _revert_side_effect_for_deleted_object(
             db_session,
             skip_actors=skip_actors,
         )
-        for rcp in recipients:
-            await new_outgoing_activity(
-                db_session,
-                rcp,
-                outbox_object_id=None,
-                inbox_object_id=delete_activity.id,
-            )
+        await new_outgoing_activities(
+            db_session,
+            recipients,
+            inbox_object_id=delete_activity.id,
+            priority=models.DeliveryPriority.BULK,
+        )
 
 
+@timings.stage
 async def _handle_follow_follow_activity(
     db_session: AsyncSession,
     from_actor: models.Actor,
@@ -1538,7 +1762,12 @@ async def _send_accept(
     )
     if not outbox_activity.id:
         raise ValueError("Should never happen")
-    await new_outgoing_activity(db_session, from_actor.inbox_url, outbox_activity.id)
+    await new_outgoing_activity(
+        db_session,
+        from_actor.inbox_url,
+        outbox_activity.id,
+        priority=models.DeliveryPriority.INTERACTIVE,
+    )
 
     if is_notification_enabled(models.NotificationType.NEW_FOLLOWER):
         notif = models.Notification(
@@ -1582,7 +1811,12 @@ async def _send_reject(
     )
     if not outbox_activity.id:
         raise ValueError("Should never happen")
-    await new_outgoing_activity(db_session, from_actor.inbox_url, outbox_activity.id)
+    await new_outgoing_activity(
+        db_session,
+        from_actor.inbox_url,
+        outbox_activity.id,
+        priority=models.DeliveryPriority.INTERACTIVE,
+    )
 
     if is_notification_enabled(models.NotificationType.REJECTED_FOLLOWER):
         notif = models.Notification(
@@ -1592,6 +1826,7 @@ async def _send_reject(
         db_session.add(notif)
 
 
+@timings.stage
 async def _handle_undo_activity(
     db_session: AsyncSession,
     from_actor: models.Actor,
@@ -1690,6 +1925,7 @@ async def _handle_undo_activity(
     # commit will be perfomed in save_to_inbox
 
 
+@timings.stage
 async def _handle_move_activity(
     db_session: AsyncSession,
     from_actor: models.Actor,
@@ -1756,6 +1992,7 @@ async def _handle_move_activity(
         db_session.add(notif)
 
 
+@timings.stage
 async def _handle_update_activity(
     db_session: AsyncSession,
     from_actor: models.Actor,
@@ -1803,11 +2040,19 @@ async def _handle_update_activity(
             logger.info(f"Updating {existing_object.ap_id}")
             existing_object.ap_object = wrapped_object
             existing_object.updated_at = now()
+            await search.index(db_session, existing_object)
+            await db_session.execute(
+                delete(models.TaggedInboxObject).where(
+                    models.TaggedInboxObject.inbox_object_id == existing_object.id
+                )
+            )
+            _tag_inbox_object(db_session, existing_object)
     else:
         # TODO(ts): support updating objects
         logger.info(f'Cannot update {wrapped_object["type"]}')
 
 
+@timings.stage
 async def _handle_create_activity(
     db_session: AsyncSession,
     from_actor: models.Actor,
@@ -1864,6 +2109,7 @@ async def _handle_create_activity(
     )
 
 
+@timings.stage
 async def _handle_read_activity(
     db_session: AsyncSession,
     from_actor: models.Actor,
@@ -1893,6 +2139,7 @@ async def _handle_read_activity(
         await _process_note_object(db_session, read_activity, wrapped_object_actor, ro)
 
 
+@timings.stage
 async def _process_note_object(
     db_session: AsyncSession,
     parent_activity: models.InboxObject,
@@ -1907,9 +2154,7 @@ async def _process_note_object(
     if "published" in ro.ap_object:
         ap_published_at = parse_isoformat(ro.ap_object["published"])
 
-    following = await _get_following(db_session)
-
-    is_from_following = ro.actor.ap_id in {f.ap_actor_id for f in following}
+    is_from_following = ro.actor.ap_id in await _get_following_ap_actor_ids(db_session)
     is_reply = bool(ro.in_reply_to)
     is_local_reply = ro.is_local_reply
     is_mention = False
@@ -1928,6 +2173,9 @@ async def _process_note_object(
         is_mention=is_mention,
         is_from_following=is_from_following,
         hashtags=hashtags,
+        has_followed_hashtag=await _has_followed_hashtag(
+            db_session, _get_hashtags(ro.tags)
+        ),
         actor_handle=ro.actor.handle,
         remote_object=ro,
     )
@@ -1956,8 +2204,12 @@ async def _process_note_object(
     db_session.add(inbox_object)
     await db_session.flush()
     await db_session.refresh(inbox_object)
+    await search.index(db_session, inbox_object)
+    _tag_inbox_object(db_session, inbox_object)
 
     parent_activity.relates_to_inbox_object_id = inbox_object.id
+    if not inbox_object.is_hidden_from_stream:
+        await _add_to_stream(db_session, inbox_object)
 
     if inbox_object.in_reply_to:
         replied_object = await get_anybox_object_by_ap_id(
@@ -2015,13 +2267,12 @@ async def _process_note_object(
                 db_session,
                 skip_actors=skip_actors,
             )
-            for rcp in recipients:
-                await new_outgoing_activity(
-                    db_session,
-                    rcp,
-                    outbox_object_id=None,
-                    inbox_object_id=parent_activity.id,
-                )
+            await new_outgoing_activities(
+                db_session,
+                recipients,
+                inbox_object_id=parent_activity.id,
+                priority=models.DeliveryPriority.BULK,
+            )
 
     if is_mention and is_notification_enabled(models.NotificationType.MENTION):
         notif = models.Notification(
@@ -2032,6 +2283,7 @@ async def _process_note_object(
         db_session.add(notif)
 
 
+@timings.stage
 async def _handle_vote_answer(
     db_session: AsyncSession,
     answer: models.InboxObject,
@@ -2103,12 +2355,11 @@ async def _handle_vote_answer(
 
     await db_session.flush()
 
-    # Finally send an update
-    recipients = await _compute_recipients(db_session, question.ap_object)
-    for rcp in recipients:
-        await new_outgoing_activity(db_session, rcp, question.id)
+    # Finally send an update, votes received in the same window are coalesced
+    schedule_fan_out(question, models.FanOutStatus.PENDING_UPDATE)
 
 
+@timings.stage
 async def _handle_announce_activity(
     db_session: AsyncSession,
     actor: models.Actor,
@@ -2133,10 +2384,10 @@ async def _handle_announce_activity(
     else:
         # Only show the announce in the stream if it comes from an actor
         # in the following collection
-        followings = await _get_following(db_session)
-        is_from_following = announce_activity.actor.ap_id in {
-            f.ap_actor_id for f in followings
-        }
+        is_from_following = (
+            announce_activity.actor.ap_id
+            in await _get_following_ap_actor_ids(db_session)
+        )
 
         # This is announce for a maybe unknown object
         if relates_to_inbox_object:
@@ -2149,17 +2400,21 @@ async def _handle_announce_activity(
             )
             dup_count = 0
             if (
-                not relates_to_inbox_object.is_hidden_from_stream
-                and delta_from_original < skip_delta
+                delta_from_original < skip_delta
+                and await _is_in_stream(db_session, relates_to_inbox_object)
             ) or (
                 dup_count := (
                     await db_session.scalar(
-                        select(func.count(models.InboxObject.id)).where(
+                        select(func.count(models.InboxObject.id))
+                        .join(
+                            models.StreamEntry,
+                            models.StreamEntry.inbox_object_id == models.InboxObject.id,
+                        )
+                        .where(
                             models.InboxObject.ap_type == "Announce",
                             models.InboxObject.ap_published_at > now() - skip_delta,
                             models.InboxObject.relates_to_inbox_object_id
                             == relates_to_inbox_object.id,
-                            models.InboxObject.is_hidden_from_stream.is_(False),
                         )
                     )
                 )
@@ -2211,6 +2466,7 @@ async def _handle_announce_activity(
                 )
 
 
+@timings.stage
 async def _handle_like_activity(
     db_session: AsyncSession,
     actor: models.Actor,
@@ -2240,6 +2496,7 @@ async def _handle_like_activity(
             db_session.add(notif)
 
 
+@timings.stage
 async def _handle_block_activity(
     db_session: AsyncSession,
     actor: models.Actor,
@@ -2263,6 +2520,7 @@ async def _handle_block_activity(
         db_session.add(notif)
 
 
+@timings.stage
 async def _process_transient_object(
     db_session: AsyncSession,
     raw_object: ap.RawObject,
@@ -2297,6 +2555,7 @@ async def save_to_inbox(
 
             # Update the actor
             actor.ap_actor = updated_actor.ap_actor
+            await search.index(db_session, actor)
             await db_session.commit()
             return
 
@@ -2495,6 +2754,7 @@ async def save_to_inbox(
                     if maybe_following:
                         logger.info("Removing actor from following")
                         await db_session.delete(maybe_following)
+                        await _remove_actor_from_stream(db_session, actor)
 
             else:
                 logger.info(
@@ -2527,6 +2787,8 @@ async def save_to_inbox(
             relates_to_outbox_object,
             relates_to_inbox_object,
         )
+        if not inbox_object.is_hidden_from_stream:
+            await _add_to_stream(db_session, inbox_object)
     elif activity_ro.ap_type == "View":
         # View is used by Peertube, there's nothing useful we can do with it
         await db_session.delete(inbox_object)
@@ -2542,6 +2804,7 @@ async def save_to_inbox(
     await db_session.commit()
 
 
+@timings.stage
 async def _prefetch_actor_outbox(
     db_session: AsyncSession,
     actor: models.Actor,
@@ -2561,7 +2824,7 @@ async def _prefetch_actor_outbox(
                 saved_inbox_object = await save_object_to_inbox(db_session, obj)
 
             if not saved_inbox_object.in_reply_to:
-                saved_inbox_object.is_hidden_from_stream = False
+                await _add_to_stream(db_session, saved_inbox_object)
 
             saved += 1
 
@@ -2607,6 +2870,8 @@ async def save_object_to_inbox(
     db_session.add(inbox_object)
     await db_session.flush()
     await db_session.refresh(inbox_object)
+    await search.index(db_session, inbox_object)
+    _tag_inbox_object(db_session, inbox_object)
     return inbox_object
 
 
@@ -113,7 +113,35 @@ class Config(pydantic.BaseModel):
     hides_followers: bool = False
     hides_following: bool = False
 
+    # Async SQLAlchemy URL of a PostgreSQL DB (`postgresql+asyncpg://...`),
+    # the SQLite DB in `data/` is used by default
+    database_url: str | None = None
+    # SQLite pragmas applied on connect (see app/database.py for the defaults)
+    sqlite_pragmas: dict[str, str | int] = {}
+    # Pooled read-only connections used by the public pages (0 disables)
+    db_read_pool_size: int = 8
+    # A warning is logged for requests running more SQL queries, or running the
+    # same statement more times (likely an N+1 query)
+    sql_queries_threshold: int = 50
+    sql_repeated_queries_threshold: int = 10
+
     inbox_retention_days: int = 15
+    # Prune old data every X hours from the prune worker, disabled by default
+    prune_interval_hours: int = 0
+
+    # At most one Update per object is sent during this window (poll votes, edits)
+    update_debounce_seconds: int = 60
+
+    # Batch the activities received by the inbox in a single transaction every
+    # X milliseconds, disabled by default
+    inbox_write_buffer_ms: int = 0
+
+    # Inbox backpressure: activities per minute and per sending host (disabled
+    # by default as relays can send a lot), and maximum number of incoming
+    # activities waiting to be processed (0 disables)
+    inbox_rate_limit: int = 0
+    inbox_rate_limit_known_actors: int = 0
+    inbox_max_queue_size: int = 10_000
 
     custom_content_security_policy: str | None = None
 
@@ -187,6 +215,12 @@ ALSO_KNOWN_AS = CONFIG.also_known_as
 CUSTOM_CONTENT_SECURITY_POLICY = CONFIG.custom_content_security_policy
 
 INBOX_RETENTION_DAYS = CONFIG.inbox_retention_days
+PRUNE_INTERVAL_HOURS = CONFIG.prune_interval_hours
+UPDATE_DEBOUNCE_SECONDS = CONFIG.update_debounce_seconds
+INBOX_WRITE_BUFFER_MS = CONFIG.inbox_write_buffer_ms
+INBOX_RATE_LIMIT = CONFIG.inbox_rate_limit
+INBOX_RATE_LIMIT_KNOWN_ACTORS = CONFIG.inbox_rate_limit_known_actors
+INBOX_MAX_QUEUE_SIZE = CONFIG.inbox_max_queue_size
 SESSION_TIMEOUT = CONFIG.session_timeout
 CUSTOM_FOOTER = (
     markdown(CONFIG.custom_footer.replace("{version}", VERSION))
@@ -197,7 +231,12 @@ CUSTOM_FOOTER = (
 BASE_URL = ID
 DEBUG = CONFIG.debug
 DB_PATH = CONFIG.sqlalchemy_database or ROOT_DIR / "data" / "microblogpub.db"
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+# The env var makes it easy to run the test suite against PostgreSQL
+POSTGRESQL_DATABASE_URL = os.getenv("MICROBLOGPUB_DATABASE_URL") or CONFIG.database_url
+SQLITE_PRAGMAS = CONFIG.sqlite_pragmas
+DB_READ_POOL_SIZE = CONFIG.db_read_pool_size
+SQL_QUERIES_THRESHOLD = CONFIG.sql_queries_threshold
+SQL_REPEATED_QUERIES_THRESHOLD = CONFIG.sql_repeated_queries_threshold
 KEY_PATH = (
     (ROOT_DIR / CONFIG.key_path) if CONFIG.key_path else ROOT_DIR / "data" / "key.pem"
 )
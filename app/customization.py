@@ -136,6 +136,9 @@ class ObjectInfo:
     # List of hashtags, e.g. #microblogpub
     hashtags: list[str]
 
+    # Is one of the hashtags followed by the local actor
+    has_followed_hashtag: bool
+
     # @dev@microblog.pub
     actor_handle: str
 
@@ -148,6 +151,7 @@ _StreamVisibilityCallback = Callable[[ObjectInfo], bool]
 def default_stream_visibility_callback(object_info: ObjectInfo) -> bool:
     result = (
         (not object_info.is_reply and object_info.is_from_following)
+        or object_info.has_followed_hashtag
         or object_info.is_mention
         or object_info.is_local_reply
     )
@@ -1,28 +1,141 @@
+import time
 from typing import Any
 from typing import AsyncGenerator
 
 from sqlalchemy import MetaData
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.config import DB_PATH
+from app.config import DB_READ_POOL_SIZE
 from app.config import DEBUG
-from app.config import SQLALCHEMY_DATABASE_URL
+from app.config import POSTGRESQL_DATABASE_URL
+from app.config import SQLITE_PRAGMAS
+from app.utils import json_codec
+from app.utils import metrics
+from app.utils import query_tracker
+from app.utils import timings
+
+if POSTGRESQL_DATABASE_URL:
+    DATABASE_URL = POSTGRESQL_DATABASE_URL
+    # The migrations and the tests use the default sync driver (psycopg2)
+    SQLALCHEMY_DATABASE_URL = str(make_url(DATABASE_URL).set(drivername="postgresql"))
+else:
+    DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
+    SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+IS_POSTGRESQL = make_url(DATABASE_URL).get_backend_name() == "postgresql"
+
+# Applied on every new connection, can be overridden with the `sqlite_pragmas`
+# config item (WAL is enabled by a migration as it's persisted in the DB file)
+DEFAULT_SQLITE_PRAGMAS: dict[str, str | int] = {
+    "synchronous": "NORMAL",
+    "cache_size": -20_000,  # in KiB
+    "mmap_size": 268_435_456,
+    "temp_store": "MEMORY",
+    "busy_timeout": 15_000,
+}
+
+
+def apply_sqlite_pragmas(engine: Engine, pragmas: dict[str, str | int]) -> None:
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(
+    conn: Any,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    conn.info["query_start_time"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(
+    conn: Any,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    elapsed_time = time.perf_counter() - conn.info["query_start_time"]
+    operation = (statement.split(None, 1) or [""])[0].upper()
+    metrics.DB_QUERIES.inc(operation=operation)
+    metrics.DB_QUERY_DURATION.observe(elapsed_time, operation=operation)
+    query_tracker.record_query(statement, elapsed_time)
+    timings.record_db_time(elapsed_time)
+
+
+_PRAGMAS = {**DEFAULT_SQLITE_PRAGMAS, **SQLITE_PRAGMAS}
+_CONNECT_ARGS: dict[str, Any] = {"timeout": 15} if IS_SQLITE else {}
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 15}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args=(
+        {**_CONNECT_ARGS, "check_same_thread": False} if IS_SQLITE else _CONNECT_ARGS
+    ),
+    json_serializer=json_codec.dumps,
+    json_deserializer=json_codec.loads,
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
 async_engine = create_async_engine(
-    DATABASE_URL, future=True, echo=DEBUG, connect_args={"timeout": 15}
+    DATABASE_URL,
+    future=True,
+    echo=DEBUG,
+    connect_args=_CONNECT_ARGS,
+    json_serializer=json_codec.dumps,
+    json_deserializer=json_codec.loads,
 )
 async_session = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
+if IS_SQLITE:
+    apply_sqlite_pragmas(engine, _PRAGMAS)
+    apply_sqlite_pragmas(async_engine.sync_engine, _PRAGMAS)
+
+# Read-only connections for the public pages, pooled so they're not re-opened
+# for every request. They don't compete with the writer thanks to WAL.
+# The in-memory DB used by the tests cannot be shared this way, and PostgreSQL
+# connections are already pooled.
+if IS_SQLITE and DB_READ_POOL_SIZE and "mode=memory" not in str(DB_PATH):
+    async_read_engine = create_async_engine(
+        DATABASE_URL,
+        future=True,
+        echo=DEBUG,
+        connect_args=_CONNECT_ARGS,
+        json_serializer=json_codec.dumps,
+        json_deserializer=json_codec.loads,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=DB_READ_POOL_SIZE,
+        max_overflow=-1,
+    )
+    apply_sqlite_pragmas(
+        async_read_engine.sync_engine, {**_PRAGMAS, "query_only": "ON"}
+    )
+else:
+    async_read_engine = async_engine
+async_read_session = sessionmaker(
+    async_read_engine, class_=AsyncSession, expire_on_commit=False
+)
+
 Base: Any = declarative_base()
 metadata_obj = MetaData()
 
@@ -33,3 +146,19 @@ async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
             yield session
         finally:
             await session.close()
+
+
+async def get_read_db_session() -> AsyncGenerator[AsyncSession, None]:
+    """For GET handlers that never write to the DB."""
+    async with async_read_session() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+async def notify(db_session: AsyncSession, channel: str) -> None:
+    """Wake up the workers listening on the channel once the transaction is
+    committed (PostgreSQL only, the workers poll the DB otherwise)."""
+    if IS_POSTGRESQL:
+        await db_session.execute(text(f"NOTIFY {channel}"))
@@ -0,0 +1,151 @@
+"""Cache for the WebFinger and Webmention endpoint discovery results.
+
+Negative results (i.e. nothing was found) are cached too, with a shorter TTL.
+Failures (timeouts, server errors...) are not negative results: the previous
+value is kept and the discovery is retried with an exponential backoff.
+"""
+from datetime import timedelta
+
+from loguru import logger
+from sqlalchemy import select
+
+from app import models
+from app import webfinger
+from app.database import AsyncSession
+from app.utils import webmentions
+from app.utils.datetime import as_utc
+from app.utils.datetime import now
+
+_TTL = {
+    models.DiscoveryCacheType.WEBFINGER_ACTOR_URL: timedelta(days=7),
+    models.DiscoveryCacheType.WEBMENTION_ENDPOINT: timedelta(days=3),
+}
+_NEGATIVE_TTL = timedelta(hours=12)
+
+_RETRY_BASE_BACKOFF = timedelta(minutes=5)
+
+# Entries used recently are refreshed by the outgoing worker before they expire
+_REFRESH_BEFORE_EXPIRY = timedelta(hours=1)
+_REFRESH_IF_USED_WITHIN = timedelta(days=30)
+
+
+async def _discover(
+    cache_type: models.DiscoveryCacheType,
+    key: str,
+) -> str | None:
+    if cache_type == models.DiscoveryCacheType.WEBFINGER_ACTOR_URL:
+        return await webfinger.get_actor_url(key)
+    elif cache_type == models.DiscoveryCacheType.WEBMENTION_ENDPOINT:
+        return await webmentions.discover_webmention_endpoint(key)
+    else:
+        raise ValueError(f"Unhandled cache type {cache_type}")
+
+
+def _set_value(entry: models.DiscoveryCacheEntry, value: str | None) -> None:
+    entry.value = value
+    entry.updated_at = now()
+    entry.failed_attempts = 0
+    entry.expires_at = now() + (
+        _TTL[entry.cache_type] if value else _NEGATIVE_TTL  # type: ignore
+    )
+
+
+def _set_next_retry(entry: models.DiscoveryCacheEntry) -> None:
+    """Keep the current value and retry later."""
+    entry.failed_attempts += 1
+    entry.expires_at = now() + min(
+        _RETRY_BASE_BACKOFF * (2 ** (entry.failed_attempts - 1)),
+        _NEGATIVE_TTL,
+    )
+
+
+async def _get_or_discover(
+    db_session: AsyncSession,
+    cache_type: models.DiscoveryCacheType,
+    key: str,
+) -> str | None:
+    entry = (
+        await db_session.execute(
+            select(models.DiscoveryCacheEntry).where(
+                models.DiscoveryCacheEntry.cache_type == cache_type,
+                models.DiscoveryCacheEntry.key == key,
+            )
+        )
+    ).scalar_one_or_none()
+
+    if entry and as_utc(entry.expires_at) > now():
+        logger.info(f"Discovery cache hit for {cache_type.value} {key}")
+        entry.last_hit_at = now()
+        await db_session.flush()
+        return entry.value
+
+    try:
+        value = await _discover(cache_type, key)
+    except Exception:
+        if not entry:
+            raise
+
+        # Serve the stale value
+        logger.exception(f"Failed to refresh {cache_type.value} {key}")
+        entry.last_hit_at = now()
+        _set_next_retry(entry)
+        await db_session.flush()
+        return entry.value
+
+    if not entry:
+        entry = models.DiscoveryCacheEntry(cache_type=cache_type, key=key)
+        db_session.add(entry)
+
+    entry.last_hit_at = now()
+    _set_value(entry, value)
+    await db_session.flush()
+    return value
+
+
+async def get_actor_url(db_session: AsyncSession, resource: str) -> str | None:
+    """Cached version of `webfinger.get_actor_url`."""
+    return await _get_or_discover(
+        db_session,
+        models.DiscoveryCacheType.WEBFINGER_ACTOR_URL,
+        resource,
+    )
+
+
+async def get_webmention_endpoint(db_session: AsyncSession, url: str) -> str | None:
+    """Cached version of `utils.webmentions.discover_webmention_endpoint`."""
+    return await _get_or_discover(
+        db_session,
+        models.DiscoveryCacheType.WEBMENTION_ENDPOINT,
+        url,
+    )
+
+
+async def refresh_expiring_entries(
+    db_session: AsyncSession,
+    limit: int = 5,
+) -> None:
+    entries = (
+        await db_session.scalars(
+            select(models.DiscoveryCacheEntry)
+            .where(
+                models.DiscoveryCacheEntry.expires_at < now() + _REFRESH_BEFORE_EXPIRY,
+                models.DiscoveryCacheEntry.last_hit_at
+                > now() - _REFRESH_IF_USED_WITHIN,
+            )
+            .order_by(models.DiscoveryCacheEntry.expires_at.asc())
+            .limit(limit)
+        )
+    ).all()
+
+    for entry in entries:
+        logger.info(f"Refreshing {entry.cache_type.value} {entry.key}")
+        try:
+            value = await _discover(entry.cache_type, entry.key)  # type: ignore
+        except Exception:
+            logger.exception(f"Failed to refresh {entry.cache_type.value}")
+            _set_next_retry(entry)
+        else:
+            _set_value(entry, value)
+
+    if entries:
+        await db_session.commit()
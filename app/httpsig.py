@@ -1,6 +1,5 @@
 import base64
 import hashlib
-import json
 import typing
 from dataclasses import dataclass
 from datetime import datetime
@@ -27,6 +26,8 @@ from app.config import KEY_PATH
 from app.database import AsyncSession
 from app.database import get_db_session
 from app.key import Key
+from app.utils import json_codec
+from app.utils import metrics
 from app.utils.datetime import now
 from app.utils.url import is_hostname_blocked
 
@@ -94,9 +95,12 @@ async def _get_public_key(
     key_id: str,
     should_skip_cache: bool = False,
 ) -> Key:
-    if not should_skip_cache and (cached_key := _KEY_CACHE.get(key_id)):
-        logger.info(f"Key {key_id} found in cache")
-        return cached_key
+    if not should_skip_cache:
+        cached_key = _KEY_CACHE.get(key_id)
+        metrics.record_cache_lookup("httpsig_key", cached_key is not None)
+        if cached_key:
+            logger.info(f"Key {key_id} found in cache")
+            return cached_key
 
     # Check if the key belongs to an actor already in DB
     from app import models
@@ -151,6 +155,13 @@ async def _get_public_key(
     return k
 
 
+async def get_json_payload(request: fastapi.Request) -> Any:
+    """Parse the JSON body, only once per request."""
+    if not hasattr(request.state, "json_payload"):
+        request.state.json_payload = json_codec.loads(await request.body())
+    return request.state.json_payload
+
+
 @dataclass(frozen=True)
 class HTTPSigInfo:
     has_valid_signature: bool
@@ -200,25 +211,22 @@ async def httpsig_checker(
         )
 
     # Try to drop Delete activity spams early on, this prevent making an extra
-    # HTTP requests trying to fetch an unavailable actor to verify the HTTP sig
+    # HTTP requests trying to fetch an unavailable actor to verify the HTTP sig.
+    # Only for actors deleting themselves, as the objects of an unknown actor may
+    # still be waiting in the incoming activities queue.
     try:
         if request.method == "POST" and request.url.path.endswith("/inbox"):
-            from app import models  # TODO: solve this circular import
+            from app import known_actors  # TODO: solve this circular import
 
-            activity = json.loads(body)
+            activity = await get_json_payload(request)
             actor_id = ap.get_id(activity["actor"])
             if (
                 ap.as_list(activity["type"])[0] == "Delete"
                 and actor_id == ap.get_id(activity["object"])
-                and not (
-                    await db_session.scalars(
-                        select(models.Actor).where(
-                            models.Actor.ap_id == actor_id,
-                        )
-                    )
-                ).one_or_none()
+                and not await known_actors.is_known_actor(db_session, actor_id)
             ):
-                logger.info(f"Dropping Delete activity early for {body=}")
+                logger.info(f"Dropping Delete activity early for {actor_id=}")
+                known_actors.record_dropped_activity()
                 raise fastapi.HTTPException(status_code=202)
     except fastapi.HTTPException as http_exc:
         raise http_exc
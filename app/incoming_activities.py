@@ -1,23 +1,46 @@
 import asyncio
+import time
 import traceback
 from datetime import datetime
 from datetime import timedelta
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from urllib.parse import urlparse
 
 from loguru import logger
 from sqlalchemy import func
+from sqlalchemy import insert
 from sqlalchemy import select
+from sqlalchemy.orm import aliased
 
 from app import activitypub as ap
+from app import config
 from app import httpsig
 from app import ldsig
 from app import models
 from app.boxes import save_to_inbox
 from app.database import AsyncSession
+from app.database import async_session
+from app.database import notify
+from app.utils import metrics
+from app.utils import timings
+from app.utils.datetime import as_utc
 from app.utils.datetime import now
+from app.utils.workers import WORKER_ID
 from app.utils.workers import Worker
+from app.utils.workers import acquire_lease
+from app.utils.workers import is_lease_available
+from app.utils.workers import release_lease
+from app.webmentions import process_webmention
 
 _MAX_RETRIES = 8
 
+# Number of candidates to try when racing with other workers
+_MAX_LEASE_ATTEMPTS = 3
+
+_NOTIFY_CHANNEL = "incoming_activities"
+
 
 async def new_ap_incoming_activity(
     db_session: AsyncSession,
@@ -37,17 +60,113 @@ async def new_ap_incoming_activity(
 
     # TODO(ts): dedup first
 
+    if config.INBOX_WRITE_BUFFER_MS:
+        # Returns once the batch is committed, the caller can acknowledge it
+        await inbox_write_buffer.add(
+            {
+                "sent_by_ap_actor_id": httpsig_info.signed_by_ap_actor_id,
+                "ap_id": ap_id,
+                "ap_object": raw_object,
+            }
+        )
+        return None
+
     incoming_activity = models.IncomingActivity(
         sent_by_ap_actor_id=httpsig_info.signed_by_ap_actor_id,
         ap_id=ap_id,
         ap_object=raw_object,
     )
     db_session.add(incoming_activity)
+    await notify(db_session, _NOTIFY_CHANNEL)
     await db_session.commit()
     await db_session.refresh(incoming_activity)
     return incoming_activity
 
 
+class WriteBuffer:
+    """Group commit for incoming activities.
+
+    Activities received by concurrent requests are inserted in a single
+    transaction (one fsync) every `window` seconds, and each request waits for
+    its batch to be committed.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        session_maker: Callable[[], AsyncSession] = async_session,
+        max_batch_size: int = 200,
+    ) -> None:
+        self._window = window
+        self._session_maker = session_maker
+        self._max_batch_size = max_batch_size
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._queue: asyncio.Queue[tuple[dict[str, Any], asyncio.Future[None]]]
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or not self._task or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        return loop
+
+    async def add(self, values: dict[str, Any]) -> None:
+        loop = self._ensure_started()
+        committed: asyncio.Future[None] = loop.create_future()
+        await self._queue.put((values, committed))
+        await committed
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._window
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._flush(batch)
+
+    async def _flush(
+        self,
+        batch: list[tuple[dict[str, Any], asyncio.Future[None]]],
+    ) -> None:
+        try:
+            async with self._session_maker() as db_session:
+                await db_session.execute(
+                    insert(models.IncomingActivity),
+                    [values for values, _ in batch],
+                )
+                await notify(db_session, _NOTIFY_CHANNEL)
+                await db_session.commit()
+        except Exception as exc:
+            logger.exception(f"Failed to save {len(batch)} incoming activities")
+            for _, committed in batch:
+                if not committed.done():
+                    committed.set_exception(exc)
+        else:
+            logger.info(f"Saved {len(batch)} incoming activities")
+            for _, committed in batch:
+                if not committed.done():
+                    committed.set_result(None)
+
+
+inbox_write_buffer = WriteBuffer(window=config.INBOX_WRITE_BUFFER_MS / 1000)
+
+
 def _exp_backoff(tries: int) -> datetime:
     seconds = 2 * (2 ** (tries - 1))
     return now() + timedelta(seconds=seconds)
@@ -74,6 +193,7 @@ async def fetch_next_incoming_activity(
         models.IncomingActivity.next_try <= now(),
         models.IncomingActivity.is_errored.is_(False),
         models.IncomingActivity.is_processed.is_(False),
+        is_lease_available(models.IncomingActivity),
     ]
     q_count = await db_session.scalar(
         select(func.count(models.IncomingActivity.id)).where(*where)
@@ -84,16 +204,45 @@ async def fetch_next_incoming_activity(
         # logger.debug("No activities to process")
         return None
 
-    next_activity = (
-        await db_session.execute(
-            select(models.IncomingActivity)
-            .where(*where)
+    # Activities sent by the same actor must be processed in order, skip them
+    # while a previous one is being processed by another worker
+    in_flight = aliased(models.IncomingActivity)
+    is_actor_busy = (
+        select(in_flight.id)
+        .where(
+            in_flight.sent_by_ap_actor_id
+            == models.IncomingActivity.sent_by_ap_actor_id,
+            in_flight.id < models.IncomingActivity.id,
+            in_flight.is_processed.is_(False),
+            in_flight.is_errored.is_(False),
+            in_flight.lease_expires_at > now(),
+            in_flight.lease_owner != WORKER_ID,
+        )
+        .exists()
+    )
+
+    for _ in range(_MAX_LEASE_ATTEMPTS):
+        next_activity_id = await db_session.scalar(
+            select(models.IncomingActivity.id)
+            .where(*where, ~is_actor_busy)
             .limit(1)
             .order_by(models.IncomingActivity.next_try.asc())
+            # Skip the rows being leased by another worker (PostgreSQL only)
+            .with_for_update(skip_locked=True)
         )
-    ).scalar_one()
+        if not next_activity_id:
+            return None
+
+        if await acquire_lease(db_session, models.IncomingActivity, next_activity_id):
+            return await db_session.get(
+                models.IncomingActivity,
+                next_activity_id,
+                populate_existing=True,
+            )
+
+        logger.info(f"{next_activity_id} was leased by another worker")
 
-    return next_activity
+    return None
 
 
 async def process_next_incoming_activity(
@@ -102,47 +251,115 @@ async def process_next_incoming_activity(
 ) -> None:
     logger.info(
         f"incoming_activity={next_activity.ap_object}/"
-        f"{next_activity.sent_by_ap_actor_id}"
+        f"{next_activity.sent_by_ap_actor_id}/"
+        f"{next_activity.webmention_source}"
     )
 
+    # Time since the activity is ready to be processed
+    ready_at = next_activity.next_try or next_activity.created_at
+    if not ready_at:
+        raise ValueError("Should never happen")
+    queue_wait = (now() - as_utc(ready_at)).total_seconds()
+
     next_activity.tries = next_activity.tries + 1
     next_activity.last_try = now()
     await db_session.commit()
 
+    task: Awaitable[None]
     if next_activity.ap_object and next_activity.sent_by_ap_actor_id:
-        try:
+        ap_type = ap.as_list(next_activity.ap_object.get("type"))[0]
+        sender = next_activity.sent_by_ap_actor_id
+        base_stage = "save_to_inbox"
+        task = save_to_inbox(
+            db_session,
+            next_activity.ap_object,
+            next_activity.sent_by_ap_actor_id,
+        )
+    elif next_activity.webmention_source and next_activity.webmention_target:
+        ap_type = "Webmention"
+        sender = next_activity.webmention_source
+        base_stage = "process_webmention"
+        task = process_webmention(
+            db_session,
+            next_activity.webmention_source,
+            next_activity.webmention_target,
+        )
+    else:
+        logger.warning(f"Nothing to process for {next_activity.id}")
+        next_activity.is_errored = True
+        next_activity.next_try = None
+        release_lease(next_activity)
+        await db_session.commit()
+        return None
+
+    started_at = time.perf_counter()
+    try:
+        with timings.measure(base_stage) as activity_timings:
             async with db_session.begin_nested():
-                await asyncio.wait_for(
-                    save_to_inbox(
-                        db_session,
-                        next_activity.ap_object,
-                        next_activity.sent_by_ap_actor_id,
-                    ),
-                    timeout=60,
-                )
-        except asyncio.exceptions.TimeoutError:
-            logger.error("Activity took too long to process")
-            await db_session.rollback()
-            await db_session.refresh(next_activity)
-            next_activity.error = traceback.format_exc()
-            _set_next_try(next_activity)
-        except Exception:
-            logger.exception("Failed")
-            await db_session.rollback()
-            await db_session.refresh(next_activity)
-            next_activity.error = traceback.format_exc()
-            _set_next_try(next_activity)
-        else:
-            logger.info("Success")
-            next_activity.is_processed = True
+                await asyncio.wait_for(task, timeout=60)
+    except asyncio.exceptions.TimeoutError:
+        logger.error("Activity took too long to process")
+        result = "timeout"
+        await db_session.rollback()
+        await db_session.refresh(next_activity)
+        next_activity.error = traceback.format_exc()
+        _set_next_try(next_activity)
+    except Exception:
+        logger.exception("Failed")
+        result = "error"
+        await db_session.rollback()
+        await db_session.refresh(next_activity)
+        next_activity.error = traceback.format_exc()
+        _set_next_try(next_activity)
+    else:
+        logger.info("Success")
+        result = "success"
+        next_activity.is_processed = True
 
-    # FIXME: webmention support
+    metrics.INCOMING_ACTIVITY_PROCESSING_DURATION.observe(
+        time.perf_counter() - started_at,
+        ap_type=ap_type,
+        result=result,
+    )
+
+    total_timings = activity_timings.total
+    handler = activity_timings.handler or base_stage
+    db_session.add(
+        models.IncomingActivityTiming(
+            incoming_activity_id=next_activity.id,
+            ap_type=ap_type,
+            server=urlparse(sender).hostname or "",
+            handler=handler,
+            result=result,
+            queue_wait=queue_wait,
+            total_time=total_timings.total,
+            network_time=total_timings.network,
+            db_time=total_timings.db,
+            cpu_time=total_timings.cpu,
+        )
+    )
+    db_session.add_all(
+        [
+            models.IncomingActivityStageTiming(
+                handler=handler,
+                stage=stage_name,
+                total_time=stage.total,
+                network_time=stage.network,
+                db_time=stage.db,
+                cpu_time=stage.cpu,
+            )
+            for stage_name, stage in activity_timings.stages.items()
+        ]
+    )
 
+    release_lease(next_activity)
     await db_session.commit()
     return None
 
 
 class IncomingActivityWorker(Worker[models.IncomingActivity]):
+    notify_channel = _NOTIFY_CHANNEL
+
     async def process_message(
         self,
         db_session: AsyncSession,
@@ -0,0 +1,103 @@
+"""In-memory index of the actors saved in the DB.
+
+Used to drop activities from unknown actors (like the Delete storms sent when
+an instance purges accounts) without querying the DB or fetching the actor key.
+
+The bloom filter is rebuilt from the `actor` table periodically, and new actors
+are added on insert. Actors inserted by other processes are picked up by an
+incremental refresh every few seconds.
+"""
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy import select
+
+from app import models
+from app.database import AsyncSession
+from app.utils.bloom_filter import BloomFilter
+from app.utils.datetime import now
+
+_REFRESH_INTERVAL = 10.0
+_REBUILD_INTERVAL = 3600.0
+_MIN_CAPACITY = 10_000
+
+
+@dataclass
+class _State:
+    bloom_filter: BloomFilter | None = None
+    last_actor_id: int = 0
+    refreshed_at: float = 0.0
+    rebuilt_at: float = 0.0
+
+    # Counters, since the process started
+    started_at: datetime = field(default_factory=now)
+    dropped_activities_count: int = 0
+
+
+_STATE = _State()
+
+
+async def _rebuild(db_session: AsyncSession) -> None:
+    actors_count = await db_session.scalar(select(func.count(models.Actor.id)))
+    bloom_filter = BloomFilter(capacity=max(_MIN_CAPACITY, actors_count * 2))
+
+    last_actor_id = 0
+    for actor_id, ap_id in (
+        await db_session.execute(select(models.Actor.id, models.Actor.ap_id))
+    ).all():
+        bloom_filter.add(ap_id)
+        last_actor_id = max(last_actor_id, actor_id)
+
+    logger.info(f"Rebuilt known actors filter with {bloom_filter.items_count} actors")
+    _STATE.bloom_filter = bloom_filter
+    _STATE.last_actor_id = last_actor_id
+    _STATE.rebuilt_at = _STATE.refreshed_at = time.monotonic()
+
+
+async def _refresh(db_session: AsyncSession) -> None:
+    if not _STATE.bloom_filter:
+        raise ValueError("Should never happen")
+
+    for actor_id, ap_id in (
+        await db_session.execute(
+            select(models.Actor.id, models.Actor.ap_id).where(
+                models.Actor.id > _STATE.last_actor_id
+            )
+        )
+    ).all():
+        _STATE.bloom_filter.add(ap_id)
+        _STATE.last_actor_id = max(_STATE.last_actor_id, actor_id)
+
+    _STATE.refreshed_at = time.monotonic()
+
+
+async def is_known_actor(db_session: AsyncSession, actor_id: str) -> bool:
+    """Returns False only if the actor is not in the DB (modulo the refresh
+    interval for actors inserted by another process)."""
+    current_time = time.monotonic()
+    if not _STATE.bloom_filter or current_time - _STATE.rebuilt_at > _REBUILD_INTERVAL:
+        await _rebuild(db_session)
+    elif current_time - _STATE.refreshed_at > _REFRESH_INTERVAL:
+        await _refresh(db_session)
+
+    if not _STATE.bloom_filter:
+        raise ValueError("Should never happen")
+
+    return actor_id in _STATE.bloom_filter
+
+
+def add_actor(actor: models.Actor) -> None:
+    if _STATE.bloom_filter:
+        _STATE.bloom_filter.add(actor.ap_id)
+
+
+def record_dropped_activity() -> None:
+    _STATE.dropped_activities_count += 1
+
+
+def get_dropped_activities_count() -> tuple[int, datetime]:
+    return _STATE.dropped_activities_count, _STATE.started_at
@@ -12,6 +12,7 @@ from pyld import jsonld  # type: ignore
 from app import activitypub as ap
 from app.database import AsyncSession
 from app.httpsig import _get_public_key
+from app.utils import timings
 
 if typing.TYPE_CHECKING:
     from app.key import Key
@@ -62,6 +63,7 @@ def _doc_hash(doc: ap.RawObject) -> str:
     return h.hexdigest()
 
 
+@timings.stage
 async def verify_signature(
     db_session: AsyncSession,
     doc: ap.RawObject,
@@ -5,6 +5,8 @@ import time
 from datetime import timezone
 from io import BytesIO
 from typing import Any
+from typing import Awaitable
+from typing import Callable
 from typing import MutableMapping
 from typing import Type
 
@@ -14,6 +16,7 @@ import starlette
 from asgiref.typing import ASGI3Application
 from asgiref.typing import ASGIReceiveCallable
 from asgiref.typing import ASGISendCallable
+from asgiref.typing import HTTPScope
 from asgiref.typing import Scope
 from cachetools import LFUCache
 from fastapi import Depends
@@ -24,6 +27,7 @@ from fastapi import Response
 from fastapi.exception_handlers import http_exception_handler
 from fastapi.exceptions import HTTPException
 from fastapi.responses import FileResponse
+from fastapi.responses import HTMLResponse
 from fastapi.responses import PlainTextResponse
 from fastapi.responses import RedirectResponse
 from fastapi.responses import StreamingResponse
@@ -44,6 +48,7 @@ from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware  # type: ign
 
 from app import activitypub as ap
 from app import admin
+from app import backpressure
 from app import boxes
 from app import config
 from app import httpsig
@@ -51,6 +56,7 @@ from app import indieauth
 from app import media
 from app import micropub
 from app import models
+from app import search
 from app import templates
 from app import webmentions
 from app.actor import LOCAL_ACTOR
@@ -66,18 +72,27 @@ from app.config import WEBFINGER_DOMAIN
 from app.config import is_activitypub_requested
 from app.config import verify_csrf_token
 from app.customization import get_custom_router
+from app.database import IS_SQLITE
 from app.database import AsyncSession
 from app.database import async_session
 from app.database import get_db_session
+from app.database import get_read_db_session
 from app.incoming_activities import new_ap_incoming_activity
 from app.templates import is_current_user_admin
 from app.uploads import UPLOAD_DIR
+from app.utils import json_codec
+from app.utils import metrics
 from app.utils import pagination
+from app.utils import profiler
+from app.utils import query_tracker
+from app.utils.datetime import as_utc
+from app.utils.datetime import now
 from app.utils.emoji import EMOJIS_BY_NAME
 from app.utils.facepile import Face
 from app.utils.facepile import WebmentionReply
 from app.utils.facepile import merge_faces
 from app.utils.highlight import HIGHLIGHT_CSS_HASH
+from app.utils.stats import get_queue_stats
 from app.utils.url import check_url
 from app.webfinger import get_remote_follow_template
 
@@ -140,7 +155,8 @@ class CustomMiddleware:
                 headers["x-xss-protection"] = "1; mode=block"
                 headers["x-frame-options"] = "DENY"
                 headers["permissions-policy"] = "interest-cohort=()"
-                headers["content-security-policy"] = (
+                headers.setdefault(
+                    "content-security-policy",
                     (
                         f"default-src 'self'; "
                         f"style-src 'self' 'sha256-{HIGHLIGHT_CSS_HASH}'; "
@@ -149,7 +165,7 @@ class CustomMiddleware:
                     if not config.CUSTOM_CONTENT_SECURITY_POLICY
                     else config.CUSTOM_CONTENT_SECURITY_POLICY.format(
                         HIGHLIGHT_CSS_HASH=HIGHLIGHT_CSS_HASH
-                    )
+                    ),
                 )
                 if not DEBUG:
                     headers["strict-transport-security"] = "max-age=63072000;"
@@ -173,16 +189,109 @@ class CustomMiddleware:
                 f'"{user_agent}"'
             )
             try:
-                await self.app(scope, receive, send_wrapper)  # type: ignore
+                with query_tracker.track_queries(
+                    f"{request_method} {request_path}"
+                ) as tracker:
+                    if profiler_format := _get_profiler_format(scope):
+                        await self._profile(
+                            scope,
+                            receive,
+                            send_wrapper,
+                            profiler_format,
+                        )
+                    else:
+                        await self.app(scope, receive, send_wrapper)  # type: ignore
             finally:
                 elapsed_time = time.perf_counter() - start_time
                 logger.info(
                     f"status_code={response_details['status_code']} "
-                    f"{elapsed_time=:.2f}s"
+                    f"{elapsed_time=:.2f}s "
+                    f"queries={tracker.queries_count} "
+                    f"db_time={tracker.db_time:.2f}s"
+                )
+
+                route = _get_route_template(scope)
+                metrics.HTTP_REQUESTS.inc(
+                    method=request_method,
+                    route=route,
+                    status_code=response_details["status_code"],
                 )
+                metrics.HTTP_REQUEST_DURATION.observe(
+                    elapsed_time,
+                    method=request_method,
+                    route=route,
+                )
+                metrics.maybe_write_snapshot()
+
+        return None
+
+    async def _profile(
+        self,
+        scope: HTTPScope,
+        receive: ASGIReceiveCallable,
+        send: Callable[[Message], Awaitable[None]],
+        profiler_format: str,
+    ) -> None:
+        """Run the request under the profiler, the response is replaced by the
+        profile report."""
+
+        async def discard_response(message: Message) -> None:
+            return None
+
+        with profiler.profile(f"{scope['method']} {scope['path']}") as request_profile:
+            await self.app(scope, receive, discard_response)  # type: ignore
+
+        response: Response
+        if profiler_format == "speedscope":
+            response = JSONResponse(
+                profiler.to_speedscope(request_profile),
+                headers={
+                    "Content-Disposition": (
+                        'attachment; filename="profile.speedscope.json"'
+                    )
+                },
+            )
+        else:
+            response = HTMLResponse(
+                templates.render_profile_report(request_profile),
+                headers={
+                    "content-security-policy": (
+                        "default-src 'none'; style-src 'unsafe-inline'"
+                    )
+                },
+            )
+        await response(scope, receive, send)  # type: ignore
+
 
+_PROFILER_FORMATS = ["html", "speedscope"]
+
+
+def _get_profiler_format(scope: HTTPScope) -> str | None:
+    """Admin requests can be profiled with `?profiler=html|speedscope`."""
+    if b"profiler=" not in scope["query_string"]:
         return None
 
+    request = Request(scope)  # type: ignore
+    profiler_format = request.query_params.get("profiler")
+    if profiler_format not in _PROFILER_FORMATS or not is_current_user_admin(request):
+        return None
+
+    return profiler_format
+
+
+_ROUTE_TEMPLATES: dict[Any, str] = {}
+
+
+def _get_route_template(scope: Scope) -> str:
+    """Path template of the matched route (set in the scope by the router),
+    e.g. `/o/{public_id}`."""
+    if not _ROUTE_TEMPLATES:
+        for route in app.routes:
+            endpoint = getattr(route, "endpoint", getattr(route, "app", None))
+            _ROUTE_TEMPLATES[endpoint] = route.path  # type: ignore
+
+    return _ROUTE_TEMPLATES.get(scope.get("endpoint"), "unmatched")
+
 
 def _check_0rtt_early_data(request: Request) -> None:
     """Disable TLS1.3 0-RTT requests for non-GET."""
@@ -257,6 +366,9 @@ async def custom_http_exception_handler(
 class ActivityPubResponse(JSONResponse):
     media_type = "application/activity+json"
 
+    def render(self, content: Any) -> bytes:
+        return json_codec.dumps_bytes(content)
+
 
 async def redirect_to_remote_instance(
     request: Request,
@@ -285,7 +397,7 @@ async def redirect_to_remote_instance(
 @app.get(config.NavBarItems.NOTES_PATH)
 async def index(
     request: Request,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
     page: int | None = None,
 ) -> templates.TemplateResponse | ActivityPubResponse:
     if is_activitypub_requested(request):
@@ -344,7 +456,7 @@ async def index(
 @app.get("/articles")
 async def articles(
     request: Request,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
     _: httpsig.HTTPSigInfo = Depends(httpsig.httpsig_checker),
     page: int | None = None,
 ) -> templates.TemplateResponse | ActivityPubResponse:
@@ -404,14 +516,16 @@ async def _build_followx_collection(
             "totalItems": total_items,
         }
 
-    q = select(model_cls).order_by(model_cls.created_at.desc())  # type: ignore
+    q = select(model_cls.ap_actor_id, model_cls.created_at).order_by(
+        model_cls.created_at.desc()  # type: ignore
+    )
     if next_cursor:
         q = q.where(
             model_cls.created_at < pagination.decode_cursor(next_cursor)  # type: ignore
         )
     q = q.limit(20)
 
-    items = [followx for followx in (await db_session.scalars(q)).all()]
+    items = (await db_session.execute(q)).all()
     next_cursor = None
     if (
         items
@@ -461,6 +575,7 @@ async def followers(
     page: bool | None = None,
     next_cursor: str | None = None,
     prev_cursor: str | None = None,
+    # Not read-only, the actors metadata may refresh the actors in admin mode
     db_session: AsyncSession = Depends(get_db_session),
     _: httpsig.HTTPSigInfo = Depends(httpsig.httpsig_checker),
 ) -> ActivityPubResponse | templates.TemplateResponse:
@@ -525,6 +640,7 @@ async def following(
     page: bool | None = None,
     next_cursor: str | None = None,
     prev_cursor: str | None = None,
+    # Not read-only, the actors metadata may refresh the actors in admin mode
     db_session: AsyncSession = Depends(get_db_session),
     _: httpsig.HTTPSigInfo = Depends(httpsig.httpsig_checker),
 ) -> ActivityPubResponse | templates.TemplateResponse:
@@ -591,7 +707,7 @@ async def following(
 @app.get("/outbox")
 async def outbox(
     request: Request,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
     _: httpsig.HTTPSigInfo = Depends(httpsig.httpsig_checker),
 ) -> ActivityPubResponse:
     maybe_access_token_info = await indieauth.check_access_token(
@@ -677,7 +793,7 @@ async def post_outbox(
 
 @app.get("/featured")
 async def featured(
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
     _: httpsig.HTTPSigInfo = Depends(httpsig.httpsig_checker),
 ) -> ActivityPubResponse:
     outbox_objects = (
@@ -809,7 +925,7 @@ async def _fetch_webmentions(
 async def outbox_by_public_id(
     public_id: str,
     request: Request,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
     httpsig_info: httpsig.HTTPSigInfo = Depends(httpsig.httpsig_checker),
 ) -> ActivityPubResponse | templates.TemplateResponse | RedirectResponse:
     maybe_object = (
@@ -939,7 +1055,7 @@ async def article_by_slug(
     short_id: str,
     slug: str,
     request: Request,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
     httpsig_info: httpsig.HTTPSigInfo = Depends(httpsig.httpsig_checker),
 ) -> ActivityPubResponse | templates.TemplateResponse | RedirectResponse:
     maybe_object = await boxes.get_outbox_object_by_slug_and_short_id(
@@ -988,7 +1104,7 @@ async def article_by_slug(
 async def outbox_activity_by_public_id(
     public_id: str,
     request: Request,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
     httpsig_info: httpsig.HTTPSigInfo = Depends(httpsig.httpsig_checker),
 ) -> ActivityPubResponse:
     maybe_object = (
@@ -1011,7 +1127,7 @@ async def outbox_activity_by_public_id(
 async def tag_by_name(
     tag: str,
     request: Request,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
     _: httpsig.HTTPSigInfo = Depends(httpsig.httpsig_checker),
 ) -> ActivityPubResponse | templates.TemplateResponse:
     where = [
@@ -1092,7 +1208,7 @@ def emoji_by_name(name: str) -> ActivityPubResponse:
 @app.get("/inbox")
 async def get_inbox(
     request: Request,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
     access_token_info: indieauth.AccessTokenInfo = Depends(
         indieauth.enforce_access_token
     ),
@@ -1161,14 +1277,57 @@ async def get_inbox(
     return ActivityPubResponse(collection_page)
 
 
+@app.get("/search")
+async def get_search(
+    request: Request,
+    q: str,
+    cursor: str | None = None,
+    db_session: AsyncSession = Depends(get_read_db_session),
+    access_token_info: indieauth.AccessTokenInfo = Depends(
+        indieauth.enforce_access_token
+    ),
+) -> JSONResponse:
+    if "read" not in access_token_info.scopes:
+        return JSONResponse(status_code=401, content={"error": "insufficient_scope"})
+
+    if not IS_SQLITE:
+        raise HTTPException(status_code=501, detail="search requires SQLite")
+
+    try:
+        search_results, next_cursor = await search.search(db_session, q, cursor)
+    except search.InvalidCursorError:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": "invalid_request",
+                "error_description": "Invalid cursor",
+            },
+        )
+
+    items = []
+    for result in await search.load_results(db_session, search_results):
+        if isinstance(result, models.Actor):
+            items.append({"kind": search.SearchKind.ACTOR, "object": result.ap_actor})
+        elif isinstance(result, models.OutboxObject):
+            items.append({"kind": search.SearchKind.OUTBOX, "object": result.ap_object})
+        else:
+            items.append({"kind": search.SearchKind.INBOX, "object": result.ap_object})
+
+    return JSONResponse({"items": items, "next_cursor": next_cursor})
+
+
 @app.post("/inbox")
 async def inbox(
     request: Request,
     db_session: AsyncSession = Depends(get_db_session),
+    # Resolved before the HTTP signature to reject floods early
+    admission_check: None = Depends(backpressure.enforce_inbox_admission),
+    # Resolved after the HTTP signature check, before rejecting invalid signatures
+    rate_limit_check: None = Depends(backpressure.enforce_inbox_rate_limit),
     httpsig_info: httpsig.HTTPSigInfo = Depends(httpsig.enforce_httpsig),
 ) -> Response:
     # logger.info(f"headers={request.headers}")
-    payload = await request.json()
+    payload = await httpsig.get_json_payload(request)
     logger.info(f"{payload=}")
     await new_ap_incoming_activity(db_session, httpsig_info, payload)
     return Response(status_code=202)
@@ -1177,7 +1336,7 @@ async def inbox(
 @app.get("/remote_follow")
 async def get_remote_follow(
     request: Request,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
 ) -> templates.TemplateResponse:
     return await templates.render_template(
         db_session,
@@ -1213,7 +1372,7 @@ async def post_remote_follow(
 async def remote_interaction(
     request: Request,
     ap_id: str,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
 ) -> templates.TemplateResponse:
     outbox_object = await boxes.get_outbox_object_by_ap_id(
         db_session,
@@ -1302,7 +1461,7 @@ async def well_known_nodeinfo() -> dict[str, Any]:
 
 @app.get("/nodeinfo")
 async def nodeinfo(
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
 ):
     local_posts = await public_outbox_objects_count(db_session)
     return JSONResponse(
@@ -1448,7 +1607,9 @@ async def serve_proxy_media_resized(
     check_url(url)
     media.verify_proxied_media_sig(exp, url, sig)
 
-    if (cached_resp := _RESIZED_CACHE.get((url, size))) and is_webp_supported:
+    cached_resp = _RESIZED_CACHE.get((url, size)) if is_webp_supported else None
+    metrics.record_cache_lookup("resized_media", cached_resp is not None)
+    if cached_resp:
         resized_content, resized_mimetype, resp_headers = cached_resp
         return PlainTextResponse(
             resized_content,
@@ -1536,7 +1697,7 @@ async def serve_proxy_media_resized(
 async def serve_attachment(
     content_hash: str,
     filename: str,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
 ):
     upload = (
         await db_session.execute(
@@ -1560,7 +1721,7 @@ async def serve_attachment_thumbnail(
     request: Request,
     content_hash: str,
     filename: str,
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
 ):
     upload = (
         await db_session.execute(
@@ -1598,6 +1759,34 @@ Disallow: /remote_interaction
 Disallow: /remote_follow"""
 
 
+_LOOPBACK_HOSTS = ["127.0.0.1", "::1"]
+
+
+@app.get("/metrics")
+async def metrics_endpoint(
+    request: Request,
+    db_session: AsyncSession = Depends(get_read_db_session),
+) -> PlainTextResponse:
+    """Prometheus metrics, only for the admin or when scraped from localhost."""
+    if not (
+        is_current_user_admin(request)
+        or (request.client and request.client.host in _LOOPBACK_HOSTS)
+    ):
+        raise HTTPException(status_code=404)
+
+    for queue, queue_stats in (await get_queue_stats(db_session)).items():
+        metrics.QUEUE_SIZE.set(queue_stats.size, queue=queue)
+        oldest_age = 0.0
+        if queue_stats.oldest_created_at:
+            oldest_age = (now() - as_utc(queue_stats.oldest_created_at)).total_seconds()
+        metrics.QUEUE_OLDEST_AGE.set(oldest_age, queue=queue)
+
+    return PlainTextResponse(
+        metrics.render(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
 async def _get_outbox_for_feed(db_session: AsyncSession) -> list[models.OutboxObject]:
     return (
         (
@@ -1624,7 +1813,7 @@ async def _get_outbox_for_feed(db_session: AsyncSession) -> list[models.OutboxOb
 
 @app.get("/feed.json")
 async def json_feed(
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
 ) -> dict[str, Any]:
     outbox_objects = await _get_outbox_for_feed(db_session)
     data = []
@@ -1710,7 +1899,7 @@ async def _gen_rss_feed(
 
 @app.get("/feed.rss")
 async def rss_feed(
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
 ) -> PlainTextResponse:
     return PlainTextResponse(
         (await _gen_rss_feed(db_session, is_rss=True)).rss_str(),
@@ -1720,7 +1909,7 @@ async def rss_feed(
 
 @app.get("/feed.atom")
 async def atom_feed(
-    db_session: AsyncSession = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_read_db_session),
 ) -> PlainTextResponse:
     return PlainTextResponse(
         (await _gen_rss_feed(db_session, is_rss=False)).atom_str(),
@@ -11,15 +11,16 @@ from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import DateTime
 from sqlalchemy import Enum
+from sqlalchemy import Float
 from sqlalchemy import ForeignKey
 from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
-from sqlalchemy import Table
 from sqlalchemy import UniqueConstraint
 from sqlalchemy import text
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm import validates
 
 from app import activitypub as ap
 from app.actor import LOCAL_ACTOR
@@ -28,11 +29,17 @@ from app.ap_object import Attachment
 from app.ap_object import Object as BaseObject
 from app.config import BASE_URL
 from app.database import Base
-from app.database import metadata_obj
 from app.utils import webmentions
+from app.utils.compressed_json import CompressedJSON
 from app.utils.datetime import now
 
 
+def _get_in_reply_to(ap_object: ap.RawObject) -> str | None:
+    if in_reply_to := ap_object.get("inReplyTo"):
+        return ap.get_id(in_reply_to)
+    return None
+
+
 class ObjectRevision(pydantic.BaseModel):
     ap_object: ap.RawObject
     source: str
@@ -59,6 +66,18 @@ class Actor(Base, BaseActor):
         Boolean, nullable=False, default=False, server_default="0"
     )
 
+    # Denormalized from `ap_actor` to compute recipients without loading the JSON
+    inbox_url: Mapped[str] = Column(String, nullable=True, index=True)
+    shared_inbox_url: Mapped[str] = Column(String, nullable=True, index=True)
+
+    @validates("ap_actor")
+    def _set_inbox_urls(self, _key: str, ap_actor: ap.RawObject) -> ap.RawObject:
+        self.inbox_url = ap_actor.get("inbox")
+        self.shared_inbox_url = (
+            ap_actor.get("endpoints", {}).get("sharedInbox") or self.inbox_url
+        )
+        return ap_actor
+
     @property
     def is_from_db(self) -> bool:
         return True
@@ -83,11 +102,14 @@ class InboxObject(Base, BaseObject):
     ap_id: Mapped[str] = Column(String, nullable=False, unique=True, index=True)
     ap_context = Column(String, nullable=True)
     ap_published_at = Column(DateTime(timezone=True), nullable=False)
-    ap_object: Mapped[ap.RawObject] = Column(JSON, nullable=False)
+    ap_object: Mapped[ap.RawObject] = Column(CompressedJSON, nullable=False)
 
     # Only set for activities
     activity_object_ap_id = Column(String, nullable=True, index=True)
 
+    # Denormalized from `ap_object` to query replies without loading the JSON
+    in_reply_to: Mapped[str | None] = Column(String, nullable=True, index=True)
+
     visibility = Column(Enum(ap.VisibilityEnum), nullable=False)
     conversation = Column(String, nullable=True)
 
@@ -135,6 +157,15 @@ class InboxObject(Base, BaseObject):
 
     og_meta: Mapped[list[dict[str, Any]] | None] = Column(JSON, nullable=True)
 
+    @validates("ap_object")
+    def _set_denormalized_fields(
+        self,
+        _key: str,
+        ap_object: ap.RawObject,
+    ) -> ap.RawObject:
+        self.in_reply_to = _get_in_reply_to(ap_object)
+        return ap_object
+
     @property
     def relates_to_anybox_object(self) -> Union["InboxObject", "OutboxObject"] | None:
         if self.relates_to_inbox_object_id:
@@ -153,6 +184,15 @@ class InboxObject(Base, BaseObject):
         return True
 
 
+@enum.unique
+class FanOutStatus(str, enum.Enum):
+    PENDING = "pending"
+    # Only the object needs to be re-sent (e.g. updated poll results)
+    PENDING_UPDATE = "pending_update"
+    DONE = "done"
+    FAILED = "failed"
+
+
 class OutboxObject(Base, BaseObject):
     __tablename__ = "outbox"
 
@@ -172,9 +212,14 @@ class OutboxObject(Base, BaseObject):
 
     activity_object_ap_id = Column(String, nullable=True, index=True)
 
+    # Denormalized from `ap_object` to query replies without loading the JSON
+    in_reply_to: Mapped[str | None] = Column(String, nullable=True, index=True)
+
     # Source content for activities (like Notes)
     source = Column(String, nullable=True)
-    revisions: Mapped[list[dict[str, Any]] | None] = Column(JSON, nullable=True)
+    revisions: Mapped[list[dict[str, Any]] | None] = Column(
+        CompressedJSON, nullable=True
+    )
 
     ap_published_at = Column(DateTime(timezone=True), nullable=False, default=now)
     visibility = Column(Enum(ap.VisibilityEnum), nullable=False)
@@ -197,6 +242,17 @@ class OutboxObject(Base, BaseObject):
     # Never actually delete from the outbox
     is_deleted = Column(Boolean, nullable=False, default=False)
 
+    # Recipients and webmentions of created/updated objects are computed by the
+    # outgoing worker, `None` means the delivery was queued synchronously
+    fan_out_status = Column(Enum(FanOutStatus), nullable=True, index=True)
+    # Updates are debounced, the fan-out is delayed until this date
+    fan_out_after = Column(DateTime(timezone=True), nullable=True)
+    last_fan_out_at = Column(DateTime(timezone=True), nullable=True)
+    # Failed attempts, the fan-out is retried with an exponential backoff
+    fan_out_tries: Mapped[int] = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+
     # Used for Create, Like, Announce and Undo activities
     relates_to_inbox_object_id = Column(
         Integer,
@@ -233,6 +289,15 @@ class OutboxObject(Base, BaseObject):
 
     undone_by_outbox_object_id = Column(Integer, ForeignKey("outbox.id"), nullable=True)
 
+    @validates("ap_object")
+    def _set_denormalized_fields(
+        self,
+        _key: str,
+        ap_object: ap.RawObject,
+    ) -> ap.RawObject:
+        self.in_reply_to = _get_in_reply_to(ap_object)
+        return ap_object
+
     @property
     def actor(self) -> BaseActor:
         return LOCAL_ACTOR
@@ -329,6 +394,34 @@ class Following(Base):
     ap_actor_id = Column(String, nullable=False, unique=True)
 
 
+class StreamEntry(Base):
+    """Materialized admin stream: a row per inbox object shown in the stream."""
+
+    __tablename__ = "stream_entry"
+    __table_args__ = (
+        # Covers the keyset pagination of the stream
+        Index(
+            "ix_stream_entry_ap_published_at_inbox_object_id",
+            "ap_published_at",
+            "inbox_object_id",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=now)
+
+    inbox_object_id = Column(
+        Integer,
+        ForeignKey("inbox.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    inbox_object: Mapped[InboxObject] = relationship(InboxObject, uselist=False)
+
+    actor_id = Column(Integer, ForeignKey("actor.id"), nullable=False, index=True)
+    ap_published_at = Column(DateTime(timezone=True), nullable=False)
+
+
 class IncomingActivity(Base):
     __tablename__ = "incoming_activity"
 
@@ -337,10 +430,11 @@ class IncomingActivity(Base):
 
     # An incoming activity can be a webmention
     webmention_source = Column(String, nullable=True)
+    webmention_target = Column(String, nullable=True)
     # or an AP object
     sent_by_ap_actor_id = Column(String, nullable=True)
     ap_id = Column(String, nullable=True, index=True)
-    ap_object: Mapped[ap.RawObject] = Column(JSON, nullable=True)
+    ap_object: Mapped[ap.RawObject] = Column(CompressedJSON, nullable=True)
 
     tries: Mapped[int] = Column(Integer, nullable=False, default=0)
     next_try = Column(DateTime(timezone=True), nullable=True, default=now)
@@ -351,6 +445,66 @@ class IncomingActivity(Base):
     is_errored = Column(Boolean, nullable=False, default=False)
     error = Column(String, nullable=True)
 
+    # Set while a worker process is processing the row (see `utils.workers`)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+
+class IncomingActivityTiming(Base):
+    """Processing time of the incoming activities (one row per try), see
+    `utils.timings`."""
+
+    __tablename__ = "incoming_activity_timing"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, default=now, index=True
+    )
+
+    # Not a foreign key as the incoming activities are pruned
+    incoming_activity_id = Column(Integer, nullable=False)
+    ap_type = Column(String, nullable=False)
+    server = Column(String, nullable=False)
+    handler = Column(String, nullable=False)
+    result = Column(String, nullable=False)
+
+    # In seconds
+    queue_wait = Column(Float, nullable=False)
+    total_time = Column(Float, nullable=False)
+    network_time = Column(Float, nullable=False)
+    db_time = Column(Float, nullable=False)
+    cpu_time = Column(Float, nullable=False)
+
+
+class IncomingActivityStageTiming(Base):
+    """Breakdown of the processing time by stage (one row per stage and try), so
+    the admin can aggregate it in SQL."""
+
+    __tablename__ = "incoming_activity_stage_timing"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, default=now, index=True
+    )
+
+    handler = Column(String, nullable=False)
+    stage = Column(String, nullable=False)
+
+    # In seconds
+    total_time = Column(Float, nullable=False)
+    network_time = Column(Float, nullable=False)
+    db_time = Column(Float, nullable=False)
+    cpu_time = Column(Float, nullable=False)
+
+
+@enum.unique
+class DeliveryPriority(enum.IntEnum):
+    """Lanes of the outgoing queue, lower values are delivered first."""
+
+    INTERACTIVE = 0  # DMs, replies, Follow/Accept/Reject...
+    NORMAL = 1
+    BULK = 2  # Actor updates, forwarded activities, Deletes to all known servers
+
 
 class OutgoingActivity(Base):
     __tablename__ = "outgoing_activity"
@@ -370,6 +524,14 @@ class OutgoingActivity(Base):
     # The source will be the outbox object URL
     webmention_target = Column(String, nullable=True)
 
+    priority: Mapped[int] = Column(
+        Integer,
+        nullable=False,
+        default=DeliveryPriority.NORMAL,
+        server_default=str(DeliveryPriority.NORMAL.value),
+        index=True,
+    )
+
     tries = Column(Integer, nullable=False, default=0)
     next_try = Column(DateTime(timezone=True), nullable=True, default=now)
 
@@ -381,6 +543,10 @@ class OutgoingActivity(Base):
     is_errored = Column(Boolean, nullable=False, default=False)
     error = Column(String, nullable=True)
 
+    # Set while a worker process is processing the row (see `utils.workers`)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
     @property
     def anybox_object(self) -> OutboxObject | InboxObject:
         if self.outbox_object_id:
@@ -391,6 +557,36 @@ class OutgoingActivity(Base):
             raise ValueError("Should never happen")
 
 
+@enum.unique
+class CircuitBreakerState(str, enum.Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class OutgoingHost(Base):
+    """Delivery health of a remote host, used as a circuit breaker."""
+
+    __tablename__ = "outgoing_host"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=now)
+
+    host = Column(String, nullable=False, unique=True, index=True)
+
+    state = Column(
+        Enum(CircuitBreakerState),
+        nullable=False,
+        default=CircuitBreakerState.CLOSED,
+    )
+    consecutive_failures: Mapped[int] = Column(Integer, nullable=False, default=0)
+    # No deliveries are attempted before this date while the breaker is open
+    next_probe_at = Column(DateTime(timezone=True), nullable=True)
+
+    last_failure_at = Column(DateTime(timezone=True), nullable=True)
+    last_success_at = Column(DateTime(timezone=True), nullable=True)
+
+
 class TaggedOutboxObject(Base):
     __tablename__ = "tagged_outbox_object"
     __table_args__ = (
@@ -405,6 +601,44 @@ class TaggedOutboxObject(Base):
     tag = Column(String, nullable=False, index=True)
 
 
+class TaggedInboxObject(Base):
+    """Hashtags of the inbox objects, populated at ingest."""
+
+    __tablename__ = "tagged_inbox_object"
+    __table_args__ = (
+        UniqueConstraint("inbox_object_id", "tag", name="uix_tagged_inbox_object"),
+        # Covers the keyset pagination of the tag timelines
+        Index(
+            "ix_tagged_inbox_object_tag_ap_published_at_inbox_object_id",
+            "tag",
+            "ap_published_at",
+            "inbox_object_id",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    inbox_object_id = Column(
+        Integer,
+        ForeignKey("inbox.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    inbox_object: Mapped[InboxObject] = relationship(InboxObject, uselist=False)
+
+    tag = Column(String, nullable=False)
+    ap_published_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class FollowedHashtag(Base):
+    __tablename__ = "followed_hashtag"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=now)
+
+    tag = Column(String, nullable=False, unique=True)
+
+
 class Upload(Base):
     __tablename__ = "upload"
 
@@ -519,7 +753,9 @@ class Webmention(Base):
     is_deleted = Column(Boolean, nullable=False, default=False)
 
     source: Mapped[str] = Column(String, nullable=False, index=True, unique=True)
-    source_microformats: Mapped[dict[str, Any] | None] = Column(JSON, nullable=True)
+    source_microformats: Mapped[dict[str, Any] | None] = Column(
+        CompressedJSON, nullable=True
+    )
 
     target = Column(String, nullable=False, index=True)
     outbox_object_id = Column(Integer, ForeignKey("outbox.id"), nullable=False)
@@ -560,6 +796,7 @@ class PollAnswer(Base):
             "actor_id",
             unique=True,
             sqlite_where=text('poll_type = "oneOf"'),
+            postgresql_where=text("poll_type = 'oneOf'"),
         ),
     )
 
@@ -613,6 +850,9 @@ class NotificationType(str, enum.Enum):
     BLOCK = "block"
     UNBLOCK = "unblock"
 
+    # The recipients of an outbox object could not be computed
+    FAN_OUT_FAILED = "fan_out_failed"
+
 
 class Notification(Base):
     __tablename__ = "notifications"
@@ -640,17 +880,30 @@ class Notification(Base):
     is_rejected = Column(Boolean, nullable=True)
 
 
-outbox_fts = Table(
-    "outbox_fts",
-    # TODO(tsileo): use Base.metadata
-    metadata_obj,
-    Column("rowid", Integer),
-    Column("outbox_fts", String),
-    Column("summary", String, nullable=True),
-    Column("name", String, nullable=True),
-    Column("source", String),
-)
-
-# db.execute(select(outbox_fts.c.rowid).where(outbox_fts.c.outbox_fts.op("MATCH")("toto AND omg"))).all()  # noqa
-# db.execute(select(models.OutboxObject).join(outbox_fts, outbox_fts.c.rowid == models.OutboxObject.id).where(outbox_fts.c.outbox_fts.op("MATCH")("toto2"))).scalars()  # noqa
-# db.execute(insert(outbox_fts).values({"outbox_fts": "delete", "rowid": 1, "source": dat[0].source}))  # noqa
+@enum.unique
+class DiscoveryCacheType(str, enum.Enum):
+    WEBFINGER_ACTOR_URL = "webfinger_actor_url"
+    WEBMENTION_ENDPOINT = "webmention_endpoint"
+
+
+class DiscoveryCacheEntry(Base):
+    __tablename__ = "discovery_cache"
+    __table_args__ = (
+        UniqueConstraint("cache_type", "key", name="uix_discovery_cache_type_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=now)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=now)
+
+    cache_type = Column(Enum(DiscoveryCacheType), nullable=False)
+    key = Column(String, nullable=False)
+    # `None` means nothing was discovered (negative entry)
+    value = Column(String, nullable=True)
+
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    last_hit_at = Column(DateTime(timezone=True), nullable=False, default=now)
+    # Consecutive failures (timeouts, server errors...) to refresh the entry
+    failed_attempts: Mapped[int] = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
@@ -1,33 +1,83 @@
 import asyncio
 import email
+import itertools
 import time
 import traceback
 from datetime import datetime
 from datetime import timedelta
+from typing import Any
+from typing import Iterable
 from typing import MutableMapping
+from urllib.parse import urlparse
 
 import httpx
 from cachetools import TTLCache
 from loguru import logger
 from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import or_
 from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
 from sqlalchemy.orm import joinedload
 
 from app import activitypub as ap
 from app import config
+from app import discovery_cache
 from app import ldsig
 from app import models
 from app.actor import LOCAL_ACTOR
 from app.actor import _actor_hash
 from app.config import KEY_PATH
 from app.database import AsyncSession
+from app.database import notify
 from app.key import Key
+from app.utils import metrics
+from app.utils.datetime import as_utc
 from app.utils.datetime import now
 from app.utils.url import check_url
+from app.utils.workers import LEASE_DURATION
+from app.utils.workers import WORKER_ID
 from app.utils.workers import Worker
+from app.utils.workers import acquire_lease
+from app.utils.workers import is_lease_available
+from app.utils.workers import release_lease
 
 _MAX_RETRIES = 16
 
+# Fan-outs are retried with an exponential backoff (30s, 1m, 2m... ~8h total)
+_MAX_FAN_OUT_TRIES = 10
+_FAN_OUT_BASE_BACKOFF = timedelta(seconds=30)
+
+# Number of candidates to try when racing with other workers
+_MAX_LEASE_ATTEMPTS = 3
+
+_NOTIFY_CHANNEL = "outgoing_activities"
+
+# Per-host circuit breaker: stop delivering to a host after too many consecutive
+# failures, and only send a single "probe" delivery once the cooldown is over
+_BREAKER_FAILURE_THRESHOLD = 5
+_BREAKER_BASE_COOLDOWN = timedelta(minutes=1)
+_BREAKER_MAX_COOLDOWN = timedelta(hours=6)
+_BREAKER_PROBE_TIMEOUT = timedelta(minutes=2)
+
+# Weighted round-robin between the delivery lanes: each slot gives precedence to a
+# lane (falling back to the most important lane with due deliveries), so higher
+# lanes get most of the throughput without starving the bulk lane
+_LANES_SCHEDULE = [
+    models.DeliveryPriority.INTERACTIVE,
+    models.DeliveryPriority.NORMAL,
+    models.DeliveryPriority.INTERACTIVE,
+    models.DeliveryPriority.NORMAL,
+    models.DeliveryPriority.INTERACTIVE,
+    models.DeliveryPriority.BULK,
+]
+
+# Only the start of the response is kept for debug (some servers return whole
+# HTML error pages)
+_LAST_RESPONSE_MAX_LENGTH = 2048
+
 _LD_SIG_CACHE: MutableMapping[str, ap.RawObject] = TTLCache(maxsize=5, ttl=60 * 5)
 
 
@@ -87,12 +137,12 @@ async def _send_actor_update_if_needed(
     # Send the update to the followers collection and all the actor we have ever
     # contacted
     recipients = await compute_all_known_recipients(db_session)
-    for rcp in recipients:
-        await new_outgoing_activity(
-            db_session,
-            recipient=rcp,
-            outbox_object_id=outbox_object.id,
-        )
+    await new_outgoing_activities(
+        db_session,
+        recipients,
+        outbox_object_id=outbox_object.id,
+        priority=models.DeliveryPriority.BULK,
+    )
 
     await db_session.commit()
 
@@ -103,6 +153,7 @@ async def new_outgoing_activity(
     outbox_object_id: int | None = None,
     inbox_object_id: int | None = None,
     webmention_target: str | None = None,
+    priority: models.DeliveryPriority = models.DeliveryPriority.NORMAL,
 ) -> models.OutgoingActivity:
     if outbox_object_id is None and inbox_object_id is None:
         raise ValueError("Must reference at least one inbox/outbox activity")
@@ -116,14 +167,45 @@ async def new_outgoing_activity(
         outbox_object_id=outbox_object_id,
         inbox_object_id=inbox_object_id,
         webmention_target=webmention_target,
+        priority=priority,
     )
 
     db_session.add(outgoing_activity)
     await db_session.flush()
     await db_session.refresh(outgoing_activity)
+    await notify(db_session, _NOTIFY_CHANNEL)
     return outgoing_activity
 
 
+async def new_outgoing_activities(
+    db_session: AsyncSession,
+    recipients: Iterable[str],
+    outbox_object_id: int | None = None,
+    inbox_object_id: int | None = None,
+    priority: models.DeliveryPriority = models.DeliveryPriority.NORMAL,
+) -> None:
+    """Queue the same activity for several recipients, using a single INSERT."""
+    if outbox_object_id is None and inbox_object_id is None:
+        raise ValueError("Must reference at least one inbox/outbox activity")
+    if outbox_object_id and inbox_object_id:
+        raise ValueError("Cannot reference both inbox/outbox activities")
+
+    values = [
+        {
+            "recipient": recipient,
+            "outbox_object_id": outbox_object_id,
+            "inbox_object_id": inbox_object_id,
+            "priority": priority,
+        }
+        for recipient in recipients
+    ]
+    if not values:
+        return None
+
+    await db_session.execute(insert(models.OutgoingActivity), values)
+    await notify(db_session, _NOTIFY_CHANNEL)
+
+
 def _parse_retry_after(retry_after: str) -> datetime | None:
     try:
         # Retry-After: 120
@@ -160,45 +242,215 @@ def _set_next_try(
 
 async def fetch_next_outgoing_activity(
     db_session: AsyncSession,
+    preferred_lane: models.DeliveryPriority | None = None,
 ) -> models.OutgoingActivity | None:
+    """Returns the next due delivery of the preferred lane, or of the most
+    important lane with due deliveries."""
     where = [
         models.OutgoingActivity.next_try <= now(),
         models.OutgoingActivity.is_errored.is_(False),
         models.OutgoingActivity.is_sent.is_(False),
+        is_lease_available(models.OutgoingActivity),
     ]
-    q_count = await db_session.scalar(
-        select(func.count(models.OutgoingActivity.id)).where(*where)
-    )
+    counts_by_lane: dict[int, int] = {
+        row.priority: row.total_count
+        for row in (
+            await db_session.execute(
+                select(
+                    models.OutgoingActivity.priority,
+                    func.count(models.OutgoingActivity.id).label("total_count"),
+                )
+                .where(*where)
+                .group_by(models.OutgoingActivity.priority)
+            )
+        ).all()
+    }
+    q_count = sum(counts_by_lane.values())
     if q_count > 0:
         logger.info(f"{q_count} outgoing activities ready to process")
     if not q_count:
         # logger.debug("No activities to process")
         return None
 
-    next_activity = (
-        await db_session.execute(
-            select(models.OutgoingActivity)
-            .where(*where)
-            .limit(1)
-            .options(
-                joinedload(models.OutgoingActivity.inbox_object),
-                joinedload(models.OutgoingActivity.outbox_object),
+    if preferred_lane is not None and counts_by_lane.get(preferred_lane):
+        lane = preferred_lane
+    else:
+        lane = models.DeliveryPriority(min(counts_by_lane))
+
+    # Keep the deliveries to the same inbox in order (e.g. a Create and its
+    # Delete) when another worker is sending a previous one
+    in_flight = aliased(models.OutgoingActivity)
+    is_recipient_busy = (
+        select(in_flight.id)
+        .where(
+            in_flight.recipient == models.OutgoingActivity.recipient,
+            in_flight.id < models.OutgoingActivity.id,
+            in_flight.is_sent.is_(False),
+            in_flight.is_errored.is_(False),
+            in_flight.lease_expires_at > now(),
+            in_flight.lease_owner != WORKER_ID,
+        )
+        .exists()
+    )
+
+    for _ in range(_MAX_LEASE_ATTEMPTS):
+        next_activity_id = await db_session.scalar(
+            select(models.OutgoingActivity.id)
+            .where(
+                *where,
+                models.OutgoingActivity.priority == lane,
+                ~is_recipient_busy,
             )
+            .limit(1)
             .order_by(models.OutgoingActivity.next_try)
+            # Skip the rows being leased by another worker (PostgreSQL only)
+            .with_for_update(skip_locked=True)
+        )
+        if not next_activity_id:
+            return None
+
+        if await acquire_lease(db_session, models.OutgoingActivity, next_activity_id):
+            return (
+                await db_session.execute(
+                    select(models.OutgoingActivity)
+                    .where(models.OutgoingActivity.id == next_activity_id)
+                    .options(
+                        joinedload(models.OutgoingActivity.inbox_object),
+                        joinedload(models.OutgoingActivity.outbox_object),
+                    )
+                    .execution_options(populate_existing=True)
+                )
+            ).scalar_one()
+
+        logger.info(f"{next_activity_id} was leased by another worker")
+
+    return None
+
+
+async def _get_outgoing_host(
+    db_session: AsyncSession,
+    host: str,
+) -> models.OutgoingHost:
+    outgoing_host = (
+        await db_session.execute(
+            select(models.OutgoingHost).where(models.OutgoingHost.host == host)
+        )
+    ).scalar_one_or_none()
+    if not outgoing_host:
+        try:
+            async with db_session.begin_nested():
+                outgoing_host = models.OutgoingHost(host=host)
+                db_session.add(outgoing_host)
+                await db_session.flush()
+        except IntegrityError:
+            # Created by another worker in the meantime
+            outgoing_host = (
+                await db_session.execute(
+                    select(models.OutgoingHost).where(models.OutgoingHost.host == host)
+                )
+            ).scalar_one()
+
+    return outgoing_host
+
+
+def _is_delivery_allowed(outgoing_host: models.OutgoingHost) -> bool:
+    if outgoing_host.state == models.CircuitBreakerState.CLOSED:
+        return True
+
+    if not outgoing_host.next_probe_at:
+        raise ValueError("Should never happen")
+
+    if now() < as_utc(outgoing_host.next_probe_at):
+        return False
+
+    # Let a single delivery through to check if the host is back
+    logger.info(f"Probing {outgoing_host.host}")
+    outgoing_host.state = models.CircuitBreakerState.HALF_OPEN
+    outgoing_host.next_probe_at = now() + _BREAKER_PROBE_TIMEOUT
+    return True
+
+
+def _record_host_success(outgoing_host: models.OutgoingHost) -> None:
+    if outgoing_host.state != models.CircuitBreakerState.CLOSED:
+        logger.info(f"Closing circuit breaker for {outgoing_host.host}")
+
+    outgoing_host.state = models.CircuitBreakerState.CLOSED
+    outgoing_host.consecutive_failures = 0
+    outgoing_host.next_probe_at = None
+    outgoing_host.last_success_at = now()
+
+
+async def _record_host_failure(
+    db_session: AsyncSession,
+    outgoing_host: models.OutgoingHost,
+    next_activity: models.OutgoingActivity,
+) -> None:
+    outgoing_host.consecutive_failures += 1
+    outgoing_host.last_failure_at = now()
+
+    if (
+        outgoing_host.state == models.CircuitBreakerState.CLOSED
+        and outgoing_host.consecutive_failures < _BREAKER_FAILURE_THRESHOLD
+    ):
+        return None
+
+    cooldown = min(
+        _BREAKER_BASE_COOLDOWN
+        * 2 ** (outgoing_host.consecutive_failures - _BREAKER_FAILURE_THRESHOLD),
+        _BREAKER_MAX_COOLDOWN,
+    )
+    next_probe_at = now() + cooldown
+    logger.warning(f"Opening circuit breaker for {outgoing_host.host} {cooldown=}")
+    outgoing_host.state = models.CircuitBreakerState.OPEN
+    outgoing_host.next_probe_at = next_probe_at
+
+    # Reschedule all the pending deliveries for this host at once
+    result = await db_session.execute(
+        update(models.OutgoingActivity)
+        .where(
+            or_(
+                models.OutgoingActivity.recipient.like(
+                    f"https://{outgoing_host.host}/%"
+                ),
+                models.OutgoingActivity.recipient.like(
+                    f"http://{outgoing_host.host}/%"
+                ),
+            ),
+            models.OutgoingActivity.id != next_activity.id,
+            models.OutgoingActivity.is_sent.is_(False),
+            models.OutgoingActivity.is_errored.is_(False),
+            models.OutgoingActivity.next_try < next_probe_at,
         )
-    ).scalar_one()
-    return next_activity
+        .values(next_try=next_probe_at)
+        .execution_options(synchronize_session=False)
+    )
+    logger.info(f"Rescheduled {result.rowcount} outgoing activities")  # type: ignore
+    if next_activity.next_try and next_activity.next_try < next_probe_at:
+        next_activity.next_try = next_probe_at
 
 
 async def process_next_outgoing_activity(
     db_session: AsyncSession,
     next_activity: models.OutgoingActivity,
 ) -> None:
+    outgoing_host = await _get_outgoing_host(
+        db_session,
+        urlparse(next_activity.recipient).netloc,  # type: ignore
+    )
+    if not _is_delivery_allowed(outgoing_host):
+        logger.info(f"Circuit breaker open for {outgoing_host.host}, skipping")
+        next_activity.next_try = outgoing_host.next_probe_at
+        release_lease(next_activity)
+        await db_session.commit()
+        return None
+
     next_activity.tries = next_activity.tries + 1  # type: ignore
     next_activity.last_try = now()
 
     logger.info(f"recipient={next_activity.recipient}")
 
+    ap_type = "Webmention"
+    started_at = time.perf_counter()
     try:
         if next_activity.webmention_target and next_activity.outbox_object:
             webmention_payload = {
@@ -218,6 +470,7 @@ async def process_next_outgoing_activity(
             resp.raise_for_status()
         else:
             payload = ap.wrap_object_if_needed(next_activity.anybox_object.ap_object)
+            ap_type = payload["type"]
 
             # Use LD sig if the activity may need to be forwarded by recipients
             if next_activity.anybox_object.is_from_outbox and payload["type"] in [
@@ -238,8 +491,11 @@ async def process_next_outgoing_activity(
             resp = await ap.post(next_activity.recipient, payload)  # type: ignore
     except httpx.HTTPStatusError as http_error:
         logger.exception("Failed")
+        result = "failure"
         next_activity.last_status_code = http_error.response.status_code
-        next_activity.last_response = http_error.response.text
+        next_activity.last_response = http_error.response.text[
+            :_LAST_RESPONSE_MAX_LENGTH
+        ]
         next_activity.error = traceback.format_exc()
 
         if http_error.response.status_code in [429, 503]:
@@ -255,21 +511,155 @@ async def process_next_outgoing_activity(
             next_activity.next_try = None
         else:
             _set_next_try(next_activity)
-    except Exception:
+
+        if (
+            http_error.response.status_code >= 500
+            or http_error.response.status_code == 429
+        ):
+            await _record_host_failure(db_session, outgoing_host, next_activity)
+        else:
+            # The host is up, the error is specific to this activity
+            _record_host_success(outgoing_host)
+    except Exception as exc:
         logger.exception("Failed")
+        result = "failure"
         next_activity.error = traceback.format_exc()
         _set_next_try(next_activity)
+
+        # Timeouts, connection errors...
+        if isinstance(exc, httpx.TransportError):
+            await _record_host_failure(db_session, outgoing_host, next_activity)
     else:
         logger.info("Success")
+        result = "success"
         next_activity.is_sent = True
         next_activity.last_status_code = resp.status_code
-        next_activity.last_response = resp.text
+        next_activity.last_response = resp.text[:_LAST_RESPONSE_MAX_LENGTH]
+        _record_host_success(outgoing_host)
+
+    metrics.OUTGOING_ACTIVITY_DELIVERY_DURATION.observe(
+        time.perf_counter() - started_at,
+        ap_type=ap_type,
+        result=result,
+    )
+    metrics.OUTGOING_DELIVERIES.inc(host=outgoing_host.host, result=result)
 
+    release_lease(next_activity)
     await db_session.commit()
     return None
 
 
+async def process_pending_fan_outs(
+    db_session: AsyncSession,
+) -> None:
+    from app.boxes import fan_out_outbox_object
+
+    outbox_objects = (
+        await db_session.scalars(
+            select(models.OutboxObject)
+            .where(
+                models.OutboxObject.fan_out_status.in_(
+                    [
+                        models.FanOutStatus.PENDING,
+                        models.FanOutStatus.PENDING_UPDATE,
+                    ]
+                ),
+                or_(
+                    models.OutboxObject.fan_out_after.is_(None),
+                    models.OutboxObject.fan_out_after <= now(),
+                ),
+            )
+            .order_by(models.OutboxObject.id.asc())
+        )
+    ).all()
+    for outbox_object in outbox_objects:
+        # Claim the object as other workers may be processing it too, the claim
+        # expires if the worker crashes
+        claimed_until = now() + LEASE_DURATION
+        result = await db_session.execute(
+            update(models.OutboxObject)
+            .where(
+                models.OutboxObject.id == outbox_object.id,
+                models.OutboxObject.fan_out_status == outbox_object.fan_out_status,
+                or_(
+                    models.OutboxObject.fan_out_after.is_(None),
+                    models.OutboxObject.fan_out_after <= now(),
+                ),
+            )
+            .values(fan_out_after=claimed_until)
+            .execution_options(synchronize_session=False)
+        )
+        await db_session.commit()
+        if result.rowcount != 1:  # type: ignore
+            logger.info(f"{outbox_object.ap_id} was claimed by another worker")
+            continue
+
+        logger.info(f"Computing recipients for {outbox_object.ap_id}")
+        values: dict[str, Any]
+        try:
+            async with db_session.begin_nested():
+                await fan_out_outbox_object(db_session, outbox_object)
+        except Exception:
+            logger.exception(f"Failed to fan out {outbox_object.ap_id}")
+            await db_session.rollback()
+            await db_session.refresh(outbox_object)
+            values = _next_fan_out_try(outbox_object)
+        else:
+            values = dict(
+                fan_out_status=models.FanOutStatus.DONE,
+                fan_out_tries=0,
+                last_fan_out_at=now(),
+            )
+
+        # The object may have been scheduled again while the claim was held (e.g.
+        # a new vote on a poll), it must stay pending in this case
+        result = await db_session.execute(
+            update(models.OutboxObject)
+            .where(
+                models.OutboxObject.id == outbox_object.id,
+                models.OutboxObject.fan_out_after == claimed_until,
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:  # type: ignore
+            logger.info(f"{outbox_object.ap_id} was scheduled again, keeping it")
+        elif values.get("fan_out_status") == models.FanOutStatus.FAILED:
+            db_session.add(
+                models.Notification(
+                    notification_type=models.NotificationType.FAN_OUT_FAILED,
+                    outbox_object_id=outbox_object.id,
+                )
+            )
+
+        await db_session.commit()
+
+
+def _next_fan_out_try(outbox_object: models.OutboxObject) -> dict[str, Any]:
+    fan_out_tries = outbox_object.fan_out_tries + 1
+    if fan_out_tries < _MAX_FAN_OUT_TRIES:
+        return dict(
+            fan_out_tries=fan_out_tries,
+            fan_out_after=now() + _FAN_OUT_BASE_BACKOFF * (2 ** (fan_out_tries - 1)),
+        )
+
+    logger.error(
+        f"Giving up on fanning out {outbox_object.ap_id} after "
+        f"{fan_out_tries} tries"
+    )
+    return dict(
+        fan_out_status=models.FanOutStatus.FAILED,
+        fan_out_tries=fan_out_tries,
+    )
+
+
 class OutgoingActivityWorker(Worker[models.OutgoingActivity]):
+    notify_channel = _NOTIFY_CHANNEL
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lanes = itertools.cycle(_LANES_SCHEDULE)
+
     async def process_message(
         self,
         db_session: AsyncSession,
@@ -281,7 +671,13 @@ class OutgoingActivityWorker(Worker[models.OutgoingActivity]):
         self,
         db_session: AsyncSession,
     ) -> models.OutgoingActivity | None:
-        return await fetch_next_outgoing_activity(db_session)
+        # Objects waiting for their recipients to be computed come first
+        await process_pending_fan_outs(db_session)
+        await discovery_cache.refresh_expiring_entries(db_session)
+        return await fetch_next_outgoing_activity(
+            db_session,
+            preferred_lane=next(self._lanes),
+        )
 
     async def startup(self, db_session: AsyncSession) -> None:
         await _send_actor_update_if_needed(db_session)
@@ -1,79 +1,168 @@
+import asyncio
+from datetime import datetime
 from datetime import timedelta
+from typing import Any
 
 from loguru import logger
 from sqlalchemy import and_
 from sqlalchemy import delete
+from sqlalchemy import exists
 from sqlalchemy import func
 from sqlalchemy import not_
 from sqlalchemy import or_
 from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy.sql.elements import ColumnElement
 
 from app import activitypub as ap
 from app import models
+from app import search
 from app.config import BASE_URL
 from app.config import INBOX_RETENTION_DAYS
+from app.config import PRUNE_INTERVAL_HOURS
+from app.database import IS_SQLITE
 from app.database import AsyncSession
 from app.database import async_session
 from app.utils.datetime import now
+from app.utils.workers import Worker
+
+# Rows are deleted in small transactions, with a pause in between to let the
+# inbox and the workers write to the DB
+_BATCH_SIZE = 500
+_PAUSE_BETWEEN_BATCHES = 0.1
+
+# Time budget of a scheduled run, the remaining rows are pruned on the next run
+_SCHEDULED_RUN_MAX_DURATION = timedelta(minutes=5)
+
+# Free pages returned to the filesystem per transaction
+_VACUUM_PAGES_PER_BATCH = 1000
+
+_AUTO_VACUUM_INCREMENTAL = 2
 
 
 async def prune_old_data(
     db_session: AsyncSession,
+    deadline: datetime | None = None,
 ) -> None:
     logger.info(f"Pruning old data with {INBOX_RETENTION_DAYS=}")
-    await _prune_old_incoming_activities(db_session)
-    await _prune_old_outgoing_activities(db_session)
-    await _prune_old_inbox_objects(db_session)
+    await _prune_old_incoming_activities(db_session, deadline)
+    await _prune_incoming_activity_timings(db_session, deadline)
+    await _prune_old_outgoing_activities(db_session, deadline)
+    await _prune_old_inbox_objects(db_session, deadline)
+    await _prune_stream_entries(db_session, deadline)
+    await _prune_tagged_inbox_objects(db_session, deadline)
+    await _prune_orphan_actors(db_session, deadline)
 
-    # TODO: delete actor with no remaining inbox objects
+    # Reclaim disk space (PostgreSQL relies on autovacuum)
+    if IS_SQLITE:
+        await _incremental_vacuum(db_session, deadline)
 
-    await db_session.commit()
-    # Reclaim disk space
-    await db_session.execute("VACUUM")  # type: ignore
+
+async def _delete_in_batches(
+    db_session: AsyncSession,
+    model: Any,
+    where: list[ColumnElement],
+    deadline: datetime | None,
+    search_kind: search.SearchKind | None = None,
+) -> int:
+    deleted_count = 0
+    while deadline is None or now() < deadline:
+        ids = (
+            await db_session.scalars(select(model.id).where(*where).limit(_BATCH_SIZE))
+        ).all()
+        if not ids:
+            break
+
+        await db_session.execute(
+            delete(model)
+            .where(model.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        if search_kind:
+            await search.remove_from_index(db_session, search_kind, list(ids))
+        await db_session.commit()
+        deleted_count += len(ids)
+
+        await asyncio.sleep(_PAUSE_BETWEEN_BATCHES)
+
+    return deleted_count
 
 
 async def _prune_old_incoming_activities(
     db_session: AsyncSession,
+    deadline: datetime | None,
 ) -> None:
-    result = await db_session.execute(
-        delete(models.IncomingActivity)
-        .where(
+    deleted_count = await _delete_in_batches(
+        db_session,
+        models.IncomingActivity,
+        [
             models.IncomingActivity.created_at
             < now() - timedelta(days=INBOX_RETENTION_DAYS),
             # Keep failed activity for debug
             models.IncomingActivity.is_errored.is_(False),
-        )
-        .execution_options(synchronize_session=False)
+        ],
+        deadline,
+    )
+    logger.info(f"Deleted {deleted_count} old incoming activities")
+
+
+async def _prune_incoming_activity_timings(
+    db_session: AsyncSession,
+    deadline: datetime | None,
+) -> None:
+    deleted_count = await _delete_in_batches(
+        db_session,
+        models.IncomingActivityTiming,
+        [
+            models.IncomingActivityTiming.created_at
+            < now() - timedelta(days=INBOX_RETENTION_DAYS),
+        ],
+        deadline,
     )
-    logger.info(f"Deleted {result.rowcount} old incoming activities")  # type: ignore
+    logger.info(f"Deleted {deleted_count} incoming activity timings")
+
+    deleted_count = await _delete_in_batches(
+        db_session,
+        models.IncomingActivityStageTiming,
+        [
+            models.IncomingActivityStageTiming.created_at
+            < now() - timedelta(days=INBOX_RETENTION_DAYS),
+        ],
+        deadline,
+    )
+    logger.info(f"Deleted {deleted_count} incoming activity stage timings")
 
 
 async def _prune_old_outgoing_activities(
     db_session: AsyncSession,
+    deadline: datetime | None,
 ) -> None:
-    result = await db_session.execute(
-        delete(models.OutgoingActivity)
-        .where(
+    deleted_count = await _delete_in_batches(
+        db_session,
+        models.OutgoingActivity,
+        [
             models.OutgoingActivity.created_at
             < now() - timedelta(days=INBOX_RETENTION_DAYS),
             # Keep failed activity for debug
             models.OutgoingActivity.is_errored.is_(False),
-        )
-        .execution_options(synchronize_session=False)
+        ],
+        deadline,
     )
-    logger.info(f"Deleted {result.rowcount} old outgoing activities")  # type: ignore
+    logger.info(f"Deleted {deleted_count} old outgoing activities")
 
 
 async def _prune_old_inbox_objects(
     db_session: AsyncSession,
+    deadline: datetime | None,
 ) -> None:
     outbox_conversation = select(func.distinct(models.OutboxObject.conversation)).where(
         models.OutboxObject.conversation.is_not(None),
         models.OutboxObject.conversation.not_like(f"{BASE_URL}%"),
     )
-    result = await db_session.execute(
-        delete(models.InboxObject)
-        .where(
+    deleted_count = await _delete_in_batches(
+        db_session,
+        models.InboxObject,
+        [
             # Keep bookmarked objects
             models.InboxObject.is_bookmarked.is_(False),
             # Keep liked objects
@@ -107,13 +196,161 @@ async def _prune_old_inbox_objects(
             # Filter by retention days
             models.InboxObject.ap_published_at
             < now() - timedelta(days=INBOX_RETENTION_DAYS),
-        )
-        .execution_options(synchronize_session=False)
+        ],
+        deadline,
+        search_kind=search.SearchKind.INBOX,
     )
-    logger.info(f"Deleted {result.rowcount} old inbox objects")  # type: ignore
+    logger.info(f"Deleted {deleted_count} old inbox objects")
+
+
+async def _prune_stream_entries(
+    db_session: AsyncSession,
+    deadline: datetime | None,
+) -> None:
+    deleted_count = await _delete_in_batches(
+        db_session,
+        models.StreamEntry,
+        [
+            # Pruned or deleted inbox objects
+            ~exists().where(
+                and_(
+                    models.InboxObject.id == models.StreamEntry.inbox_object_id,
+                    models.InboxObject.is_deleted.is_(False),
+                )
+            ),
+        ],
+        deadline,
+    )
+    logger.info(f"Deleted {deleted_count} stream entries")
+
+
+async def _prune_tagged_inbox_objects(
+    db_session: AsyncSession,
+    deadline: datetime | None,
+) -> None:
+    deleted_count = await _delete_in_batches(
+        db_session,
+        models.TaggedInboxObject,
+        [
+            # Pruned or deleted inbox objects
+            ~exists().where(
+                and_(
+                    models.InboxObject.id == models.TaggedInboxObject.inbox_object_id,
+                    models.InboxObject.is_deleted.is_(False),
+                )
+            ),
+        ],
+        deadline,
+    )
+    logger.info(f"Deleted {deleted_count} tagged inbox objects")
+
+
+async def _prune_orphan_actors(
+    db_session: AsyncSession,
+    deadline: datetime | None,
+) -> None:
+    deleted_count = await _delete_in_batches(
+        db_session,
+        models.Actor,
+        [
+            # Keep actors with custom settings
+            models.Actor.is_blocked.is_(False),
+            models.Actor.are_announces_hidden_from_stream.is_(False),
+            # Keep recently fetched actors
+            models.Actor.created_at < now() - timedelta(days=INBOX_RETENTION_DAYS),
+            # Keep actors still referenced
+            ~exists().where(models.InboxObject.actor_id == models.Actor.id),
+            ~exists().where(models.OutboxObject.relates_to_actor_id == models.Actor.id),
+            ~exists().where(models.Follower.actor_id == models.Actor.id),
+            ~exists().where(models.Following.actor_id == models.Actor.id),
+            ~exists().where(models.PollAnswer.actor_id == models.Actor.id),
+            ~exists().where(models.Notification.actor_id == models.Actor.id),
+            ~exists().where(models.StreamEntry.actor_id == models.Actor.id),
+        ],
+        deadline,
+        search_kind=search.SearchKind.ACTOR,
+    )
+    logger.info(f"Deleted {deleted_count} orphan actors")
+
+
+async def _get_pragma(db_session: AsyncSession, name: str) -> int:
+    return (await db_session.execute(text(f"PRAGMA {name}"))).scalar_one()
+
+
+async def _incremental_vacuum(
+    db_session: AsyncSession,
+    deadline: datetime | None,
+) -> None:
+    if await _get_pragma(db_session, "auto_vacuum") != _AUTO_VACUUM_INCREMENTAL:
+        logger.warning(
+            "Incremental vacuum is not enabled, run `inv prune-old-data` to enable it"
+        )
+        return None
+
+    freed_pages_count = 0
+    while deadline is None or now() < deadline:
+        free_pages_count = await _get_pragma(db_session, "freelist_count")
+        if not free_pages_count:
+            break
+
+        # Each step of the statement frees a single page
+        for _ in range(min(free_pages_count, _VACUUM_PAGES_PER_BATCH)):
+            await db_session.execute(text("PRAGMA incremental_vacuum(1)"))
+        await db_session.commit()
+        freed_pages_count += min(free_pages_count, _VACUUM_PAGES_PER_BATCH)
+
+        await asyncio.sleep(_PAUSE_BETWEEN_BATCHES)
+
+    logger.info(f"Freed {freed_pages_count} pages")
+
+
+async def _enable_incremental_vacuum(db_session: AsyncSession) -> None:
+    if await _get_pragma(db_session, "auto_vacuum") == _AUTO_VACUUM_INCREMENTAL:
+        return None
+
+    # Changing the mode of an existing DB requires a full VACUUM, done once
+    logger.info("Enabling incremental vacuum")
+    await db_session.commit()
+    await db_session.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+    await db_session.execute(text("VACUUM"))
 
 
 async def run_prune_old_data() -> None:
     """CLI entrypoint."""
     async with async_session() as db_session:
+        if IS_SQLITE:
+            await _enable_incremental_vacuum(db_session)
         await prune_old_data(db_session)
+
+
+class PruneWorker(Worker[datetime]):
+    def __init__(self) -> None:
+        super().__init__()
+        self._next_run_at = now()
+
+    async def get_next_message(self, db_session: AsyncSession) -> datetime | None:
+        if not PRUNE_INTERVAL_HOURS or now() < self._next_run_at:
+            return None
+
+        return self._next_run_at
+
+    async def process_message(
+        self,
+        db_session: AsyncSession,
+        scheduled_at: datetime,
+    ) -> None:
+        self._next_run_at = now() + timedelta(hours=PRUNE_INTERVAL_HOURS)
+        try:
+            await prune_old_data(
+                db_session,
+                deadline=now() + _SCHEDULED_RUN_MAX_DURATION,
+            )
+        except Exception:
+            logger.exception("Failed to prune old data")
+            await db_session.rollback()
+
+        logger.info(f"Next pruning at {self._next_run_at}")
+
+
+async def loop() -> None:
+    await PruneWorker().run_forever()
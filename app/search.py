@@ -0,0 +1,381 @@
+"""Full-text search over the outbox, the inbox and the actors.
+
+Backed by an SQLite FTS5 table, maintained at ingest (the inbox objects are
+stored compressed so triggers cannot read them). Search is disabled when using
+PostgreSQL.
+"""
+import base64
+import enum
+from dataclasses import dataclass
+from typing import Any
+
+from bs4 import BeautifulSoup  # type: ignore
+from loguru import logger
+from sqlalchemy import DDL
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy import Table
+from sqlalchemy import and_
+from sqlalchemy import delete
+from sqlalchemy import event
+from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import literal_column
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app import activitypub as ap
+from app import models
+from app.database import IS_SQLITE
+from app.database import AsyncSession
+from app.database import Base
+from app.database import async_session
+from app.database import metadata_obj
+
+# Not part of `Base.metadata` as alembic does not support virtual tables
+search_index = Table(
+    "search_index",
+    metadata_obj,
+    Column("rowid", Integer),
+    Column("search_index", String),
+    Column("kind", String),
+    Column("ref_id", Integer),
+    Column("title", String),
+    Column("content", String),
+    Column("tags", String),
+)
+
+CREATE_SEARCH_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "kind UNINDEXED, ref_id UNINDEXED, title, content, tags, "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+
+# Also created for the tests (that don't run the migrations)
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL(CREATE_SEARCH_INDEX).execute_if(dialect="sqlite"),
+)
+event.listen(
+    Base.metadata,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS search_index").execute_if(dialect="sqlite"),
+)
+
+# Matches in titles (names, handles, summaries) and hashtags rank higher
+_SCORE = func.bm25(literal_column("search_index"), 0.0, 0.0, 10.0, 1.0, 5.0)
+
+_INDEXED_OBJECT_TYPES = ["Note", "Article", "Question", "Page", "Video"]
+
+_PAGE_SIZE = 20
+_REBUILD_BATCH_SIZE = 500
+
+
+@enum.unique
+class SearchKind(str, enum.Enum):
+    OUTBOX = "outbox"
+    INBOX = "inbox"
+    ACTOR = "actor"
+
+
+_KINDS = list(SearchKind)
+
+
+def _rowid(kind: SearchKind, ref_id: int) -> int:
+    return ref_id * len(_KINDS) + _KINDS.index(kind)
+
+
+def _html_to_text(html: str | None) -> str:
+    if not html:
+        return ""
+    return BeautifulSoup(html, "html.parser").get_text(" ")
+
+
+def _hashtags(tags: list[ap.RawObject]) -> str:
+    return " ".join(
+        tag["name"].removeprefix("#")
+        for tag in tags
+        if tag.get("type") == "Hashtag" and tag.get("name")
+    )
+
+
+def _build_document(
+    obj: models.InboxObject | models.OutboxObject | models.Actor,
+) -> dict[str, Any] | None:
+    if isinstance(obj, models.Actor):
+        if obj.is_deleted:
+            return None
+        return {
+            "kind": SearchKind.ACTOR,
+            "title": " ".join(
+                filter(None, [obj.name, obj.preferred_username, obj.handle])
+            ),
+            "content": _html_to_text(obj.summary),
+            "tags": "",
+        }
+
+    if obj.ap_type not in _INDEXED_OBJECT_TYPES or obj.is_deleted:
+        return None
+
+    if isinstance(obj, models.OutboxObject):
+        kind = SearchKind.OUTBOX
+        content = obj.source or _html_to_text(obj.content)
+    else:
+        kind = SearchKind.INBOX
+        content = _html_to_text(obj.content)
+
+    return {
+        "kind": kind,
+        "title": " ".join(filter(None, [obj.name, obj.summary])),
+        "content": content,
+        "tags": _hashtags(obj.tags),
+    }
+
+
+async def index(
+    db_session: AsyncSession,
+    obj: models.InboxObject | models.OutboxObject | models.Actor,
+) -> None:
+    """Add, update or remove (if it's deleted) the object from the index."""
+    if not IS_SQLITE:
+        return None
+
+    if not obj.id:
+        raise ValueError("Should never happen")
+
+    if isinstance(obj, models.Actor):
+        kind = SearchKind.ACTOR
+    elif isinstance(obj, models.OutboxObject):
+        kind = SearchKind.OUTBOX
+    else:
+        kind = SearchKind.INBOX
+
+    await remove_from_index(db_session, kind, [obj.id])
+    if document := _build_document(obj):
+        await _insert_document(db_session, obj.id, document)
+
+
+async def _insert_document(
+    db_session: AsyncSession,
+    ref_id: int,
+    document: dict[str, Any],
+) -> None:
+    await db_session.execute(
+        insert(search_index).values(
+            rowid=_rowid(document["kind"], ref_id),
+            ref_id=ref_id,
+            **document,
+        )
+    )
+
+
+async def remove_from_index(
+    db_session: AsyncSession,
+    kind: SearchKind,
+    ref_ids: list[int],
+) -> None:
+    if not IS_SQLITE:
+        return None
+
+    await db_session.execute(
+        delete(search_index).where(
+            search_index.c.rowid.in_([_rowid(kind, ref_id) for ref_id in ref_ids])
+        )
+    )
+
+
+def _build_match_query(query: str) -> str | None:
+    """Turns the user query into a FTS5 query: all the terms are required,
+    `#tag` only matches hashtags and `term*` is a prefix search."""
+    terms = []
+    for term in query.split():
+        is_hashtag = term.startswith("#")
+        is_prefix = term.endswith("*")
+        term = term.removeprefix("#").rstrip("*")
+        if not term:
+            continue
+
+        fts_term = '"' + term.replace('"', '""') + '"'
+        if is_prefix:
+            fts_term += " *"
+        if is_hashtag:
+            fts_term = f"tags : {fts_term}"
+        terms.append(fts_term)
+
+    return " ".join(terms) or None
+
+
+class InvalidCursorError(Exception):
+    pass
+
+
+def _encode_cursor(score: float, rowid: int) -> str:
+    return base64.urlsafe_b64encode(f"{score!r}:{rowid}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        score, rowid = base64.urlsafe_b64decode(cursor).decode().split(":")
+        return float(score), int(rowid)
+    except ValueError as exc:
+        raise InvalidCursorError(cursor) from exc
+
+
+@dataclass
+class SearchResult:
+    kind: SearchKind
+    ref_id: int
+    score: float
+
+
+async def search(
+    db_session: AsyncSession,
+    query: str,
+    cursor: str | None = None,
+) -> tuple[list[SearchResult], str | None]:
+    """Returns the best matches first, and the cursor of the next page."""
+    if not IS_SQLITE:
+        return [], None
+
+    match_query = _build_match_query(query)
+    if not match_query:
+        return [], None
+
+    where = [search_index.c.search_index.op("MATCH")(match_query)]
+    if cursor:
+        score, rowid = _decode_cursor(cursor)
+        where.append(
+            or_(
+                _SCORE > score,
+                and_(_SCORE == score, search_index.c.rowid > rowid),
+            )
+        )
+
+    rows = (
+        await db_session.execute(
+            select(
+                search_index.c.rowid,
+                search_index.c.kind,
+                search_index.c.ref_id,
+                _SCORE.label("score"),
+            )
+            .where(*where)
+            .order_by(_SCORE, search_index.c.rowid)
+            .limit(_PAGE_SIZE + 1)
+        )
+    ).all()
+
+    next_cursor = None
+    if len(rows) > _PAGE_SIZE:
+        last_row = rows[_PAGE_SIZE - 1]
+        next_cursor = _encode_cursor(last_row.score, last_row.rowid)
+
+    return [
+        SearchResult(kind=SearchKind(row.kind), ref_id=row.ref_id, score=row.score)
+        for row in rows[:_PAGE_SIZE]
+    ], next_cursor
+
+
+async def load_results(
+    db_session: AsyncSession,
+    results: list[SearchResult],
+) -> list[models.InboxObject | models.OutboxObject | models.Actor]:
+    """Fetch the matching objects, in the results order."""
+    ids_by_kind: dict[SearchKind, list[int]] = {kind: [] for kind in SearchKind}
+    for result in results:
+        ids_by_kind[result.kind].append(result.ref_id)
+
+    objects: dict[
+        tuple[SearchKind, int],
+        models.InboxObject | models.OutboxObject | models.Actor,
+    ] = {}
+    if ids := ids_by_kind[SearchKind.OUTBOX]:
+        for outbox_object in (
+            await db_session.scalars(
+                select(models.OutboxObject)
+                .where(
+                    models.OutboxObject.id.in_(ids),
+                    models.OutboxObject.is_deleted.is_(False),
+                )
+                .options(
+                    joinedload(models.OutboxObject.outbox_object_attachments).options(
+                        joinedload(models.OutboxObjectAttachment.upload)
+                    ),
+                )
+            )
+        ).unique():
+            objects[(SearchKind.OUTBOX, outbox_object.id)] = outbox_object
+    if ids := ids_by_kind[SearchKind.INBOX]:
+        for inbox_object in await db_session.scalars(
+            select(models.InboxObject)
+            .where(
+                models.InboxObject.id.in_(ids),
+                models.InboxObject.is_deleted.is_(False),
+            )
+            .options(joinedload(models.InboxObject.actor))
+        ):
+            objects[(SearchKind.INBOX, inbox_object.id)] = inbox_object
+    if ids := ids_by_kind[SearchKind.ACTOR]:
+        for actor in await db_session.scalars(
+            select(models.Actor).where(
+                models.Actor.id.in_(ids),
+                models.Actor.is_deleted.is_(False),
+            )
+        ):
+            objects[(SearchKind.ACTOR, actor.id)] = actor
+
+    return [
+        objects[(result.kind, result.ref_id)]
+        for result in results
+        if (result.kind, result.ref_id) in objects
+    ]
+
+
+async def is_index_empty(db_session: AsyncSession) -> bool:
+    if not IS_SQLITE:
+        return True
+
+    return (await db_session.scalar(select(search_index.c.rowid).limit(1))) is None
+
+
+async def rebuild_search_index() -> None:
+    """CLI entrypoint."""
+    if not IS_SQLITE:
+        raise ValueError("Search requires SQLite")
+
+    async with async_session() as db_session:
+        await db_session.execute(delete(search_index))
+        await db_session.commit()
+
+        indexed_models: list[Any] = [
+            models.OutboxObject,
+            models.InboxObject,
+            models.Actor,
+        ]
+        for model in indexed_models:
+            indexed_count = 0
+            last_id = 0
+            while True:
+                objs = (
+                    await db_session.scalars(
+                        select(model)
+                        .where(model.id > last_id)
+                        .order_by(model.id)
+                        .limit(_REBUILD_BATCH_SIZE)
+                    )
+                ).all()
+                if not objs:
+                    break
+
+                for obj in objs:
+                    if document := _build_document(obj):
+                        await _insert_document(db_session, obj.id, document)
+                        indexed_count += 1
+                await db_session.commit()
+                db_session.expunge_all()
+                last_id = objs[-1].id
+
+            logger.info(f"Indexed {indexed_count} {model.__tablename__} rows")
@@ -11,7 +11,6 @@ from pygments.lexers import get_lexer_by_name as get_lexer  # type: ignore
 from pygments.util import ClassNotFound  # type: ignore
 from sqlalchemy import select
 
-from app import webfinger
 from app.config import BASE_URL
 from app.config import CODE_HIGHLIGHTING_THEME
 from app.database import AsyncSession
@@ -120,6 +119,7 @@ async def _prefetch_mentioned_actors(
     db_session: AsyncSession,
     content: str,
 ) -> dict[str, "Actor"]:
+    from app import discovery_cache
     from app import models
     from app.actor import fetch_actor
 
@@ -144,7 +144,7 @@ async def _prefetch_mentioned_actors(
                 )
             ).scalar_one_or_none()
             if not actor:
-                actor_url = await webfinger.get_actor_url(mention)
+                actor_url = await discovery_cache.get_actor_url(db_session, mention)
                 if not actor_url:
                     # FIXME(ts): raise an error?
                     continue
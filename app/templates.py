@@ -1,3 +1,4 @@
+import time
 from datetime import datetime
 from datetime import timezone
 from functools import lru_cache
@@ -33,7 +34,9 @@ from app.config import generate_csrf_token
 from app.config import session_serializer
 from app.database import AsyncSession
 from app.media import proxied_media_url
+from app.utils import metrics
 from app.utils import privacy_replace
+from app.utils import profiler
 from app.utils.datetime import now
 from app.utils.highlight import HIGHLIGHT_CSS
 from app.utils.highlight import highlight
@@ -94,45 +97,58 @@ async def render_template(
     is_admin = False
     is_admin = is_current_user_admin(request)
 
-    return _templates.TemplateResponse(
-        template,
-        {
-            "request": request,
-            "debug": DEBUG,
-            "microblogpub_version": VERSION,
-            "is_admin": is_admin,
-            "csrf_token": generate_csrf_token(),
-            "highlight_css": HIGHLIGHT_CSS,
-            "visibility_enum": ap.VisibilityEnum,
-            "notifications_count": await db_session.scalar(
-                select(func.count(models.Notification.id)).where(
-                    models.Notification.is_new.is_(True)
-                )
+    context = {
+        "request": request,
+        "debug": DEBUG,
+        "microblogpub_version": VERSION,
+        "is_admin": is_admin,
+        "csrf_token": generate_csrf_token(),
+        "highlight_css": HIGHLIGHT_CSS,
+        "visibility_enum": ap.VisibilityEnum,
+        "notifications_count": await db_session.scalar(
+            select(func.count(models.Notification.id)).where(
+                models.Notification.is_new.is_(True)
             )
-            if is_admin
-            else 0,
-            "articles_count": await db_session.scalar(
-                select(func.count(models.OutboxObject.id)).where(
-                    models.OutboxObject.visibility == ap.VisibilityEnum.PUBLIC,
-                    models.OutboxObject.is_deleted.is_(False),
-                    models.OutboxObject.is_hidden_from_homepage.is_(False),
-                    models.OutboxObject.ap_type == "Article",
-                )
-            ),
-            "local_actor": LOCAL_ACTOR,
-            "followers_count": await db_session.scalar(
-                select(func.count(models.Follower.id))
-            ),
-            "following_count": await db_session.scalar(
-                select(func.count(models.Following.id))
-            ),
-            "actor_types": ap.ACTOR_TYPES,
-            "custom_footer": CUSTOM_FOOTER,
-            **template_args,
-        },
+        )
+        if is_admin
+        else 0,
+        "articles_count": await db_session.scalar(
+            select(func.count(models.OutboxObject.id)).where(
+                models.OutboxObject.visibility == ap.VisibilityEnum.PUBLIC,
+                models.OutboxObject.is_deleted.is_(False),
+                models.OutboxObject.is_hidden_from_homepage.is_(False),
+                models.OutboxObject.ap_type == "Article",
+            )
+        ),
+        "local_actor": LOCAL_ACTOR,
+        "followers_count": await db_session.scalar(
+            select(func.count(models.Follower.id))
+        ),
+        "following_count": await db_session.scalar(
+            select(func.count(models.Following.id))
+        ),
+        "actor_types": ap.ACTOR_TYPES,
+        "custom_footer": CUSTOM_FOOTER,
+        **template_args,
+    }
+
+    started_at = time.perf_counter()
+    response = _templates.TemplateResponse(
+        template,
+        context,
         status_code=status_code,
         headers=headers,
     )
+    profiler.record_template_render(time.perf_counter() - started_at)
+    return response
+
+
+def render_profile_report(profile: profiler.Profile) -> str:
+    return _templates.get_template("profile_report.html").render(
+        profile=profile,
+        flame_graph=profiler.build_flame_graph(profile),
+        flame_graph_children=profiler.flame_graph_children,
+    )
 
 
 # HTML/templates helper
@@ -309,6 +325,9 @@ def _update_inline_imgs(content):
     return soup.find("body").decode_contents()
 
 
+metrics.register_lru_cache("inline_imgs", _update_inline_imgs)
+
+
 def _clean_html(html: str, note: Object) -> str:
     if html is None:
         logger.error(f"{html=} for {note.ap_id}/{note.ap_object}")
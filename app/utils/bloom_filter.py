@@ -0,0 +1,35 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Probabilistic set: membership tests can return false positives, but
+    never false negatives."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.bits_count = math.ceil(
+            -self.capacity * math.log(error_rate) / (math.log(2) ** 2)
+        )
+        self.hashes_count = max(1, round(self.bits_count / self.capacity * math.log(2)))
+        self.items_count = 0
+        self._bits = bytearray(math.ceil(self.bits_count / 8))
+
+    def _positions(self, item: str) -> list[int]:
+        # Double hashing, the positions are derived from a single digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits_count for i in range(self.hashes_count)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.items_count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
@@ -9,6 +9,7 @@ from pygments.lexers import get_lexer_by_name  # type: ignore
 from pygments.lexers import guess_lexer  # type: ignore
 
 from app.config import CODE_HIGHLIGHTING_THEME
+from app.utils import metrics
 
 _FORMATTER = HtmlFormatter(style=CODE_HIGHLIGHTING_THEME)
 
@@ -51,3 +52,6 @@ def highlight(html: str) -> str:
             code["class"] = code.get("class", []) + ["highlight"]
 
     return soup.body.encode_contents().decode()
+
+
+metrics.register_lru_cache("highlight", highlight)
@@ -0,0 +1,27 @@
+"""JSON encoding/decoding, using orjson (a dependency, the stdlib json module is
+only used on platforms without orjson wheels)."""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+def dumps(obj: Any) -> str:
+    return dumps_bytes(obj).decode()
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data: str | bytes) -> Any:
+    if orjson:
+        return orjson.loads(data)
+
+    return json.loads(data)
@@ -0,0 +1,335 @@
+"""Prometheus metrics, rendered in the text exposition format.
+
+Each process (the app and the workers) keeps its counters and histograms in
+memory and periodically writes a snapshot in `data/metrics/`, `/metrics` merges
+the snapshots of all the running processes.
+"""
+import json
+import math
+import os
+import time
+from typing import Any
+from typing import Callable
+
+from loguru import logger
+
+from app.config import ROOT_DIR
+
+_METRICS_DIR = ROOT_DIR / "data" / "metrics"
+
+_SNAPSHOT_INTERVAL = 15.0  # in seconds
+
+# Snapshots of processes that were stopped are ignored (and deleted)
+_SNAPSHOT_MAX_AGE = 5 * 60.0
+
+_DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+_Labels = tuple[str, ...]
+
+
+class _Metric:
+    type_: str
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+    ) -> None:
+        if name in _REGISTRY:
+            raise ValueError(f"{name} is already registered")
+
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: dict[_Labels, Any] = {}
+        _REGISTRY[name] = self
+
+    def _key(self, labels: dict[str, Any]) -> _Labels:
+        return tuple(str(labels[label_name]) for label_name in self.label_names)
+
+    def _merge(self, values: dict[_Labels, Any], other: dict[_Labels, Any]) -> None:
+        for key, value in other.items():
+            values[key] = values.get(key, 0.0) + value
+
+    def _render_samples(self, values: dict[_Labels, Any]) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Counter(_Metric):
+    type_ = "counter"
+
+    def inc(self, value: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + value
+
+    def set_total(self, value: float, **labels: Any) -> None:
+        """For counters maintained elsewhere, like `lru_cache` statistics."""
+        self._values[self._key(labels)] = float(value)
+
+
+class Gauge(_Metric):
+    """Gauges are set when rendering the metrics, they're not aggregated."""
+
+    type_ = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    type_ = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = _DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels: Any) -> None:
+        # Per-bucket counts (the last one is +Inf), then the sum
+        key = self._key(labels)
+        if not (values := self._values.get(key)):
+            values = self._values[key] = [0.0] * (len(self.buckets) + 2)
+
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                values[i] += 1
+                break
+        else:
+            values[len(self.buckets)] += 1
+        values[-1] += value
+
+    def _merge(self, values: dict[_Labels, Any], other: dict[_Labels, Any]) -> None:
+        for key, other_values in other.items():
+            if key in values:
+                values[key] = [a + b for a, b in zip(values[key], other_values)]
+            else:
+                values[key] = list(other_values)
+
+    def _render_samples(self, values: dict[_Labels, Any]) -> list[str]:
+        lines = []
+        for key, bucket_values in sorted(values.items()):
+            cumulative_count = 0.0
+            for bucket, bucket_count in zip(
+                [*self.buckets, math.inf],
+                bucket_values[:-1],
+            ):
+                cumulative_count += bucket_count
+                labels = _format_labels(
+                    (*self.label_names, "le"),
+                    (*key, _format_value(bucket)),
+                )
+                lines.append(
+                    f"{self.name}_bucket{labels} {_format_value(cumulative_count)}"
+                )
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(bucket_values[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative_count)}")
+        return lines
+
+
+_REGISTRY: dict[str, _Metric] = {}
+
+# Called before taking a snapshot, to refresh the metrics maintained elsewhere
+_COLLECTORS: list[Callable[[], None]] = []
+
+_last_snapshot_at = time.monotonic()
+
+
+def _format_labels(label_names: tuple[str, ...], values: _Labels) -> str:
+    if not label_names:
+        return ""
+
+    formatted_labels = ",".join(
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for name, value in zip(label_names, values)
+    )
+    return "{" + formatted_labels + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value)) + ".0"
+    return repr(float(value))
+
+
+def register_lru_cache(cache_name: str, func: Any) -> None:
+    """Expose the hits/misses of a `functools.lru_cache` decorated function."""
+
+    def _collect() -> None:
+        cache_info = func.cache_info()
+        CACHE_REQUESTS.set_total(cache_info.hits, cache=cache_name, result="hit")
+        CACHE_REQUESTS.set_total(cache_info.misses, cache=cache_name, result="miss")
+
+    _COLLECTORS.append(_collect)
+
+
+def record_cache_lookup(cache_name: str, is_hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache_name, result="hit" if is_hit else "miss")
+
+
+def _collect() -> None:
+    for collector in _COLLECTORS:
+        collector()
+
+
+def _snapshot() -> dict[str, Any]:
+    _collect()
+    return {
+        "pid": os.getpid(),
+        "written_at": time.time(),
+        "metrics": {
+            name: [[list(key), value] for key, value in metric._values.items()]
+            for name, metric in _REGISTRY.items()
+            if not isinstance(metric, Gauge)
+        },
+    }
+
+
+def write_snapshot() -> None:
+    _METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    snapshot_path = _METRICS_DIR / f"{os.getpid()}.json"
+    tmp_path = snapshot_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(_snapshot()))
+    tmp_path.replace(snapshot_path)
+
+
+def maybe_write_snapshot() -> None:
+    """Called by the processes on a regular basis, rate-limited."""
+    global _last_snapshot_at
+    if time.monotonic() - _last_snapshot_at < _SNAPSHOT_INTERVAL:
+        return None
+
+    _last_snapshot_at = time.monotonic()
+    try:
+        write_snapshot()
+    except Exception:
+        logger.exception("Failed to write the metrics snapshot")
+
+
+def _load_snapshots() -> list[dict[str, Any]]:
+    snapshots = [_snapshot()]
+    if not _METRICS_DIR.exists():
+        return snapshots
+
+    for snapshot_path in _METRICS_DIR.glob("*.json"):
+        if snapshot_path.stem == str(os.getpid()):
+            continue
+
+        try:
+            snapshot = json.loads(snapshot_path.read_text())
+        except (OSError, ValueError):
+            logger.warning(f"Failed to load metrics from {snapshot_path}")
+            continue
+
+        if time.time() - snapshot["written_at"] > _SNAPSHOT_MAX_AGE:
+            snapshot_path.unlink(missing_ok=True)
+            continue
+
+        snapshots.append(snapshot)
+
+    return snapshots
+
+
+def render() -> str:
+    """Render the metrics of all the processes."""
+    merged: dict[str, dict[_Labels, Any]] = {name: {} for name in _REGISTRY}
+    for snapshot in _load_snapshots():
+        for name, samples in snapshot["metrics"].items():
+            if metric := _REGISTRY.get(name):
+                metric._merge(
+                    merged[name],
+                    {tuple(key): value for key, value in samples},
+                )
+
+    lines = []
+    for name, metric in _REGISTRY.items():
+        values = metric._values if isinstance(metric, Gauge) else merged[name]
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.type_}")
+        lines.extend(metric._render_samples(values))
+
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUESTS = Counter(
+    "microblogpub_http_requests_total",
+    "HTTP requests by route template and status code.",
+    ("method", "route", "status_code"),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "microblogpub_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route"),
+)
+
+DB_QUERIES = Counter(
+    "microblogpub_db_queries_total",
+    "SQL statements executed.",
+    ("operation",),
+)
+DB_QUERY_DURATION = Histogram(
+    "microblogpub_db_query_duration_seconds",
+    "SQL statements execution time.",
+    ("operation",),
+)
+
+INCOMING_ACTIVITY_PROCESSING_DURATION = Histogram(
+    "microblogpub_incoming_activity_processing_duration_seconds",
+    "Processing time of the incoming activities by type and result.",
+    ("ap_type", "result"),
+)
+OUTGOING_ACTIVITY_DELIVERY_DURATION = Histogram(
+    "microblogpub_outgoing_activity_delivery_duration_seconds",
+    "Delivery time of the outgoing activities by type and result.",
+    ("ap_type", "result"),
+)
+OUTGOING_DELIVERIES = Counter(
+    "microblogpub_outgoing_deliveries_total",
+    "Delivery attempts by recipient host and result.",
+    ("host", "result"),
+)
+
+QUEUE_SIZE = Gauge(
+    "microblogpub_queue_size",
+    "Activities waiting to be processed.",
+    ("queue",),
+)
+QUEUE_OLDEST_AGE = Gauge(
+    "microblogpub_queue_oldest_age_seconds",
+    "Age of the oldest activity waiting to be processed.",
+    ("queue",),
+)
+
+CACHE_REQUESTS = Counter(
+    "microblogpub_cache_requests_total",
+    "In-memory cache lookups by result.",
+    ("cache", "result"),
+)
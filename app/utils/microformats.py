@@ -5,6 +5,7 @@ import mf2py  # type: ignore
 from loguru import logger
 
 from app import config
+from app.utils import timings
 
 
 class URLNotFoundOrGone(Exception):
@@ -13,13 +14,14 @@ class URLNotFoundOrGone(Exception):
 
 async def fetch_and_parse(url: str) -> tuple[dict[str, Any], str]:
     async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            url,
-            headers={
-                "User-Agent": config.USER_AGENT,
-            },
-            follow_redirects=True,
-        )
+        with timings.network():
+            resp = await client.get(
+                url,
+                headers={
+                    "User-Agent": config.USER_AGENT,
+                },
+                follow_redirects=True,
+            )
         if resp.status_code in [404, 410]:
             raise URLNotFoundOrGone
 
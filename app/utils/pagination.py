@@ -10,3 +10,13 @@ def encode_cursor(val: datetime) -> str:
 
 def decode_cursor(cursor: str) -> datetime:
     return isoparse(base64.urlsafe_b64decode(cursor).decode())
+
+
+def encode_keyset_cursor(val: datetime, row_id: int) -> str:
+    """Cursor with an ID as a tiebreaker, for rows sharing the same date."""
+    return base64.urlsafe_b64encode(f"{val.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_keyset_cursor(cursor: str) -> tuple[datetime, int]:
+    val, row_id = base64.urlsafe_b64decode(cursor).decode().rsplit("|", 1)
+    return isoparse(val), int(row_id)
@@ -0,0 +1,226 @@
+"""Sampling profiler, to see where the time goes in slow requests or workers.
+
+A background thread samples the call stack of the profiled thread (the one
+running the event loop). Other tasks running concurrently on the loop end up
+in the samples, and the time spent waiting for I/O shows up as the event loop
+waiting in `select`.
+"""
+import contextvars
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextlib import nullcontext
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Iterator
+
+from app.config import ROOT_DIR
+from app.utils import query_tracker
+
+_SAMPLING_INTERVAL = 0.001  # in seconds
+
+# Nodes below this share of the samples are not displayed in the HTML report
+_MIN_NODE_SHARE = 0.005
+
+_Frame = tuple[str, str, int]  # function name, file, line
+
+_current_profile: contextvars.ContextVar["Profile | None"] = contextvars.ContextVar(
+    "profile", default=None
+)
+
+
+@dataclass
+class Profile:
+    name: str
+    duration: float = 0.0  # in seconds
+    samples: Counter[tuple[_Frame, ...]] = field(default_factory=Counter)
+    sql_queries_count: int = 0
+    sql_time: float = 0.0
+    template_time: float = 0.0
+
+    @property
+    def samples_count(self) -> int:
+        return sum(self.samples.values())
+
+    @property
+    def other_time(self) -> float:
+        return max(self.duration - self.sql_time - self.template_time, 0.0)
+
+
+@dataclass
+class FlameNode:
+    name: str
+    file: str
+    samples: int = 0
+    children: dict[_Frame, "FlameNode"] = field(default_factory=dict)
+
+
+def _short_filename(filename: str) -> str:
+    if "site-packages/" in filename:
+        return filename.split("site-packages/", 1)[1]
+    return filename.removeprefix(str(ROOT_DIR) + "/")
+
+
+def _get_stack(frame: Any) -> tuple[_Frame, ...]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(
+            (code.co_name, _short_filename(code.co_filename), code.co_firstlineno)
+        )
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, profile: Profile, thread_id: int, interval: float) -> None:
+        super().__init__(name="profiler", daemon=True)
+        self._profile = profile
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            if frame := sys._current_frames().get(self._thread_id):
+                self._profile.samples[_get_stack(frame)] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+@contextmanager
+def profile(name: str, interval: float = _SAMPLING_INTERVAL) -> Iterator[Profile]:
+    """Profile the current thread, along with the SQL queries and the templates
+    rendering time."""
+    current_profile = Profile(name=name)
+    token = _current_profile.set(current_profile)
+    tracker = query_tracker.current_tracker()
+    with (
+        nullcontext(tracker)
+        if tracker
+        else query_tracker.track_queries(name, check=False)
+    ) as tracker:
+        queries_count_before = tracker.queries_count
+        db_time_before = tracker.db_time
+        sampler = _Sampler(current_profile, threading.get_ident(), interval)
+        started_at = time.perf_counter()
+        sampler.start()
+        try:
+            yield current_profile
+        finally:
+            sampler.stop()
+            _current_profile.reset(token)
+            current_profile.duration = time.perf_counter() - started_at
+            current_profile.sql_queries_count = (
+                tracker.queries_count - queries_count_before
+            )
+            current_profile.sql_time = tracker.db_time - db_time_before
+
+
+def record_template_render(elapsed_time: float) -> None:
+    if current_profile := _current_profile.get():
+        current_profile.template_time += elapsed_time
+
+
+def build_flame_graph(profile: Profile) -> FlameNode:
+    root = FlameNode(name=profile.name, file="")
+    for stack, count in profile.samples.items():
+        root.samples += count
+        node = root
+        for frame in stack:
+            if frame not in node.children:
+                node.children[frame] = FlameNode(
+                    name=frame[0],
+                    file=f"{frame[1]}:{frame[2]}",
+                )
+            node = node.children[frame]
+            node.samples += count
+
+    return root
+
+
+def flame_graph_children(
+    node: FlameNode,
+    total_samples: int,
+) -> list[FlameNode]:
+    """Children of the node to display, the biggest first."""
+    return sorted(
+        (
+            child
+            for child in node.children.values()
+            if total_samples and child.samples / total_samples >= _MIN_NODE_SHARE
+        ),
+        key=lambda child: child.samples,
+        reverse=True,
+    )
+
+
+def to_speedscope(profile: Profile) -> dict[str, Any]:
+    """Export the profile in the speedscope format (https://speedscope.app)."""
+    frames: dict[_Frame, int] = {}
+    samples = []
+    weights = []
+    sample_duration = profile.duration / (profile.samples_count or 1)
+    for stack, count in profile.samples.items():
+        samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+        weights.append(count * sample_duration)
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "exporter": "microblogpub",
+        "name": profile.name,
+        "activeProfileIndex": 0,
+        "shared": {
+            "frames": [
+                {"name": name, "file": file, "line": line}
+                for name, file, line in frames
+            ]
+        },
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": (
+                    f"{profile.name} - {profile.sql_queries_count} SQL queries "
+                    f"({profile.sql_time:.3f}s), "
+                    f"templates: {profile.template_time:.3f}s"
+                ),
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+        ],
+    }
+
+
+async def profile_worker(worker_name: str, iterations: int) -> Profile:
+    """Process the next N messages of the incoming/outgoing activities queue."""
+    from app.database import async_session
+    from app.incoming_activities import IncomingActivityWorker
+    from app.outgoing_activities import OutgoingActivityWorker
+    from app.utils.workers import Worker
+
+    worker: Worker[Any]
+    if worker_name == "incoming":
+        worker = IncomingActivityWorker()
+    elif worker_name == "outgoing":
+        worker = OutgoingActivityWorker()
+    else:
+        raise ValueError(f"Unknown worker {worker_name}")
+
+    async with async_session() as db_session:
+        await worker.startup(db_session)
+        with profile(f"{worker_name} worker") as worker_profile:
+            for _ in range(iterations):
+                next_message = await worker.get_next_message(db_session)
+                if not next_message:
+                    break
+                await worker.process_message(db_session, next_message)
+
+    return worker_profile
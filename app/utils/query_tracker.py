@@ -0,0 +1,102 @@
+"""Per-request SQL queries tracking, to spot the N+1 queries.
+
+The queries executed while handling a request are counted (by statement shape,
+the statement with its bind parameters collapsed) and a warning is logged when
+a request runs too many queries or the same statement too many times.
+"""
+import contextvars
+import re
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Iterator
+
+from loguru import logger
+
+from app.config import SQL_QUERIES_THRESHOLD
+from app.config import SQL_REPEATED_QUERIES_THRESHOLD
+
+# Raise instead of logging a warning when a threshold is exceeded (the tests
+# enable it)
+STRICT_MODE = False
+
+_STATEMENT_MAX_LENGTH = 200
+
+_WHITESPACES = re.compile(r"\s+")
+# `IN (?, ?, ?)` (or `$1, $2` for asyncpg), the number of values does not matter
+_PARAMS_LIST = re.compile(r"\((?:\s*(?:\?|\$\d+)\s*,)*\s*(?:\?|\$\d+)\s*\)")
+
+_current_tracker: contextvars.ContextVar[
+    "QueryTracker | None"
+] = contextvars.ContextVar("query_tracker", default=None)
+
+
+class TooManyQueriesError(Exception):
+    pass
+
+
+@dataclass
+class QueryTracker:
+    name: str
+    queries_count: int = 0
+    db_time: float = 0.0  # in seconds
+    statements: Counter[str] = field(default_factory=Counter)
+
+    def record(self, statement: str, elapsed_time: float) -> None:
+        self.queries_count += 1
+        self.db_time += elapsed_time
+        self.statements[statement_shape(statement)] += 1
+
+    def repeated_statements(self) -> list[tuple[str, int]]:
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count > SQL_REPEATED_QUERIES_THRESHOLD
+        ]
+
+    def check(self) -> None:
+        problems = []
+        if self.queries_count > SQL_QUERIES_THRESHOLD:
+            problems.append(f"{self.queries_count} queries")
+        for statement, count in self.repeated_statements():
+            problems.append(
+                f"{count} times {statement[:_STATEMENT_MAX_LENGTH]!r} (N+1?)"
+            )
+
+        if not problems:
+            return None
+
+        message = f"{self.name}: " + ", ".join(problems)
+        if STRICT_MODE:
+            raise TooManyQueriesError(message)
+
+        logger.warning(message)
+
+
+def statement_shape(statement: str) -> str:
+    return _PARAMS_LIST.sub("(?)", _WHITESPACES.sub(" ", statement).strip())
+
+
+@contextmanager
+def track_queries(name: str, check: bool = True) -> Iterator[QueryTracker]:
+    """Count the queries executed within the block (in the current context)."""
+    tracker = QueryTracker(name=name)
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+
+    if check:
+        tracker.check()
+
+
+def current_tracker() -> QueryTracker | None:
+    return _current_tracker.get()
+
+
+def record_query(statement: str, elapsed_time: float) -> None:
+    """Called from the engine events."""
+    if tracker := _current_tracker.get():
+        tracker.record(statement, elapsed_time)
@@ -1,5 +1,8 @@
 import asyncio
 from dataclasses import dataclass
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
 
 import humanize
 from sqlalchemy import case
@@ -7,6 +10,7 @@ from sqlalchemy import func
 from sqlalchemy import or_
 from sqlalchemy import select
 from sqlalchemy.orm import joinedload
+from sqlalchemy.sql.elements import ColumnElement
 from tabulate import tabulate
 
 from app import models
@@ -14,6 +18,7 @@ from app.config import ROOT_DIR
 from app.database import AsyncSession
 from app.database import async_session
 from app.utils.datetime import now
+from app.utils.timings import StageTimings
 
 _DATA_DIR = ROOT_DIR / "data"
 
@@ -119,10 +124,149 @@ async def get_outgoing_activity_stats(
     )
 
 
+@dataclass
+class QueueStats:
+    size: int
+    oldest_created_at: datetime | None
+
+
+async def get_queue_stats(db_session: AsyncSession) -> dict[str, QueueStats]:
+    """Activities waiting to be processed (including the ones being retried)."""
+    queues: dict[str, tuple[Any, ColumnElement]] = {
+        "incoming": (
+            models.IncomingActivity,
+            models.IncomingActivity.is_processed.is_(False),
+        ),
+        "outgoing": (
+            models.OutgoingActivity,
+            models.OutgoingActivity.is_sent.is_(False),
+        ),
+    }
+    queue_stats = {}
+    for queue, (model, is_pending) in queues.items():
+        row = (
+            await db_session.execute(
+                select(
+                    func.count(model.id).label("size"),
+                    func.min(model.created_at).label("oldest_created_at"),
+                ).where(is_pending, model.is_errored.is_(False))
+            )
+        ).one()
+        queue_stats[queue] = QueueStats(
+            size=row.size,
+            oldest_created_at=row.oldest_created_at,
+        )
+
+    return queue_stats
+
+
+# The incoming activities processing time stats cover the last 24 hours
+_PROCESSING_STATS_WINDOW = timedelta(days=1)
+
+
+@dataclass
+class ProcessingTimeStatsItem:
+    name: str
+    count: int
+    errored_count: int
+    # In seconds
+    total_time: float
+    avg_time: float
+    max_time: float
+    avg_queue_wait: float
+    network_time: float
+    db_time: float
+    cpu_time: float
+
+
+@dataclass
+class IncomingProcessingStats:
+    since: datetime
+    by_server: list[ProcessingTimeStatsItem]
+    by_ap_type: list[ProcessingTimeStatsItem]
+    by_handler: list[ProcessingTimeStatsItem]
+    stages_by_handler: dict[str, dict[str, StageTimings]]
+
+
+async def get_incoming_processing_stats(
+    db_session: AsyncSession,
+    limit: int = 10,
+) -> IncomingProcessingStats:
+    """Rank the servers, activity types and handlers by total processing time."""
+    since = now() - _PROCESSING_STATS_WINDOW
+    timing = models.IncomingActivityTiming
+
+    async def _get_stats(column: Any) -> list[ProcessingTimeStatsItem]:
+        rows = await db_session.execute(
+            select(
+                column.label("name"),
+                func.count(timing.id).label("count"),
+                func.sum(case([(timing.result != "success", 1)], else_=0)).label(
+                    "errored_count"
+                ),
+                func.sum(timing.total_time).label("total_time"),
+                func.avg(timing.total_time).label("avg_time"),
+                func.max(timing.total_time).label("max_time"),
+                func.avg(timing.queue_wait).label("avg_queue_wait"),
+                func.sum(timing.network_time).label("network_time"),
+                func.sum(timing.db_time).label("db_time"),
+                func.sum(timing.cpu_time).label("cpu_time"),
+            )
+            .where(timing.created_at > since)
+            .group_by(column)
+            .order_by(func.sum(timing.total_time).desc())
+            .limit(limit)
+        )
+        return [ProcessingTimeStatsItem(**row._asdict()) for row in rows]
+
+    stage_timing = models.IncomingActivityStageTiming
+    stages_by_handler: dict[str, dict[str, StageTimings]] = {}
+    for row in await db_session.execute(
+        select(
+            stage_timing.handler,
+            stage_timing.stage,
+            func.sum(stage_timing.total_time).label("total"),
+            func.sum(stage_timing.network_time).label("network"),
+            func.sum(stage_timing.db_time).label("db"),
+            func.sum(stage_timing.cpu_time).label("cpu"),
+        )
+        .where(stage_timing.created_at > since)
+        .group_by(stage_timing.handler, stage_timing.stage)
+    ):
+        stages_by_handler.setdefault(row.handler, {})[row.stage] = StageTimings(
+            total=row.total,
+            network=row.network,
+            db=row.db,
+            cpu=row.cpu,
+        )
+
+    return IncomingProcessingStats(
+        since=since,
+        by_server=await _get_stats(timing.server),
+        by_ap_type=await _get_stats(timing.ap_type),
+        by_handler=await _get_stats(timing.handler),
+        stages_by_handler=stages_by_handler,
+    )
+
+
+async def get_unhealthy_outgoing_hosts(
+    db_session: AsyncSession,
+) -> list[models.OutgoingHost]:
+    return (
+        await db_session.scalars(
+            select(models.OutgoingHost)
+            .where(models.OutgoingHost.state != models.CircuitBreakerState.CLOSED)
+            .order_by(models.OutgoingHost.next_probe_at.asc())
+        )
+    ).all()
+
+
 def print_stats() -> None:
     async def _get_stats():
         async with async_session() as db_session:
             outgoing_activity_stats = await get_outgoing_activity_stats(db_session)
+            unhealthy_hosts = await get_unhealthy_outgoing_hosts(db_session)
+            incoming_processing_stats = await get_incoming_processing_stats(db_session)
 
             outgoing_activities = (
                 (
@@ -140,9 +284,19 @@ def print_stats() -> None:
                 .all()
             )
 
-        return outgoing_activity_stats, outgoing_activities
+        return (
+            outgoing_activity_stats,
+            outgoing_activities,
+            unhealthy_hosts,
+            incoming_processing_stats,
+        )
 
-    outgoing_activity_stats, outgoing_activities = asyncio.run(_get_stats())
+    (
+        outgoing_activity_stats,
+        outgoing_activities,
+        unhealthy_hosts,
+        incoming_processing_stats,
+    ) = asyncio.run(_get_stats())
     disk_usage_stats = get_disk_usage_stats()
 
     print()
@@ -176,6 +330,68 @@ def print_stats() -> None:
         )
     )
     print()
+    print(
+        tabulate(
+            [
+                (
+                    host.host,
+                    host.state.value,
+                    host.consecutive_failures,
+                    humanize.naturaltime(host.last_failure_at),
+                    humanize.naturaltime(host.next_probe_at),
+                )
+                for host in unhealthy_hosts
+            ],
+            headers=[
+                "Unhealthy hosts",
+                "circuit breaker",
+                "failures",
+                "last failure",
+                "next probe",
+            ],
+        )
+    )
+    print()
+    print("Incoming activities processing time (last 24 hours)")
+    print("===================================================")
+    for title, items in [
+        ("Server", incoming_processing_stats.by_server),
+        ("Activity type", incoming_processing_stats.by_ap_type),
+        ("Handler", incoming_processing_stats.by_handler),
+    ]:
+        print()
+        print(
+            tabulate(
+                [
+                    (
+                        item.name,
+                        item.count,
+                        item.errored_count,
+                        f"{item.total_time:.2f}s",
+                        f"{item.avg_time:.2f}s",
+                        f"{item.max_time:.2f}s",
+                        f"{item.avg_queue_wait:.2f}s",
+                        f"{item.network_time:.2f}s",
+                        f"{item.db_time:.2f}s",
+                        f"{item.cpu_time:.2f}s",
+                    )
+                    for item in items
+                ],
+                headers=[
+                    title,
+                    "count",
+                    "errored",
+                    "total",
+                    "avg",
+                    "max",
+                    "avg queue wait",
+                    "network",
+                    "DB",
+                    "CPU",
+                ],
+            )
+        )
+    print()
     print("Outgoing activities log")
     print("=======================")
     print()
@@ -0,0 +1,120 @@
+"""Breakdown of the processing time of the incoming activities.
+
+The time is split by stage (the functions decorated with `stage`, like the
+`_handle_*_activity` handlers) and, within each stage, between the network
+(the `network` blocks), the database (the SQL queries) and the CPU (of the
+thread running the event loop). The time of nested stages is only counted
+in the innermost one.
+"""
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Iterator
+from typing import TypeVar
+
+_F = TypeVar("_F", bound=Callable[..., Awaitable[Any]])
+
+_current_timings: contextvars.ContextVar["Timings | None"] = contextvars.ContextVar(
+    "timings", default=None
+)
+
+
+@dataclass
+class StageTimings:
+    total: float = 0.0  # in seconds
+    network: float = 0.0
+    db: float = 0.0
+    cpu: float = 0.0
+
+
+@dataclass
+class Timings:
+    stages: dict[str, StageTimings] = field(default_factory=dict)
+    # The first `_handle_*` stage
+    handler: str | None = None
+
+    _stack: list[str] = field(default_factory=list)
+    _checkpoint: float = field(default_factory=time.perf_counter)
+    _cpu_checkpoint: float = field(default_factory=time.thread_time)
+
+    @property
+    def total(self) -> StageTimings:
+        return StageTimings(
+            total=sum(stage.total for stage in self.stages.values()),
+            network=sum(stage.network for stage in self.stages.values()),
+            db=sum(stage.db for stage in self.stages.values()),
+            cpu=sum(stage.cpu for stage in self.stages.values()),
+        )
+
+    def _current_stage(self) -> StageTimings:
+        return self.stages.setdefault(self._stack[-1], StageTimings())
+
+    def _flush(self) -> None:
+        checkpoint = time.perf_counter()
+        cpu_checkpoint = time.thread_time()
+        current_stage = self._current_stage()
+        current_stage.total += checkpoint - self._checkpoint
+        current_stage.cpu += cpu_checkpoint - self._cpu_checkpoint
+        self._checkpoint = checkpoint
+        self._cpu_checkpoint = cpu_checkpoint
+
+    def enter_stage(self, name: str) -> None:
+        self._flush()
+        self._stack.append(name)
+        if self.handler is None and name.startswith("_handle_"):
+            self.handler = name
+
+    def exit_stage(self) -> None:
+        self._flush()
+        self._stack.pop()
+
+
+@contextmanager
+def measure(name: str) -> Iterator[Timings]:
+    """Measure the time spent within the block (in the current context)."""
+    timings = Timings(_stack=[name])
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        timings._flush()
+        _current_timings.reset(token)
+
+
+def stage(func: _F) -> _F:
+    """Measure the decorated coroutine function as a separate stage."""
+
+    @functools.wraps(func)
+    async def _wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not (timings := _current_timings.get()):
+            return await func(*args, **kwargs)
+
+        timings.enter_stage(func.__name__)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            timings.exit_stage()
+
+    return _wrapper  # type: ignore
+
+
+@contextmanager
+def network() -> Iterator[None]:
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings := _current_timings.get():
+            timings._current_stage().network += time.perf_counter() - started_at
+
+
+def record_db_time(elapsed_time: float) -> None:
+    """Called from the engine events."""
+    if timings := _current_timings.get():
+        timings._current_stage().db += elapsed_time
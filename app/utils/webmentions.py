@@ -24,7 +24,13 @@ async def _discover_webmention_endoint(url: str) -> str | None:
                 follow_redirects=True,
             )
             resp.raise_for_status()
-        except Exception:
+        except httpx.HTTPStatusError as http_error:
+            # Server errors may be temporary, let the caller retry later
+            if (
+                http_error.response.status_code >= 500
+                or http_error.response.status_code == 429
+            ):
+                raise
             logger.exception(f"Failed to discover webmention endpoint for {url}")
             return None
 
@@ -46,6 +52,7 @@ async def discover_webmention_endpoint(url: str) -> str | None:
 
     Passes all the tests at https://webmention.rocks!
 
+    Raises `httpx.HTTPError` on server errors and timeouts/connection errors.
     """
     check_url(url)
 
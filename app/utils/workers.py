@@ -1,20 +1,70 @@
 import asyncio
+import os
 import signal
+import socket
+from datetime import timedelta
+from typing import Any
 from typing import Generic
 from typing import TypeVar
 
 from loguru import logger
+from sqlalchemy import or_
+from sqlalchemy import update
+from sqlalchemy.sql.elements import ColumnElement
 
+from app.database import IS_POSTGRESQL
 from app.database import AsyncSession
+from app.database import async_engine
 from app.database import async_session
+from app.utils import metrics
+from app.utils.datetime import now
 
 T = TypeVar("T")
 
+# Rows are leased by a worker process before being processed, so several
+# processes can consume the same queue. Leases of crashed workers expire.
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+LEASE_DURATION = timedelta(minutes=5)
+
+
+def is_lease_available(model: Any) -> ColumnElement:
+    return or_(
+        model.lease_expires_at.is_(None),
+        model.lease_expires_at < now(),
+        model.lease_owner == WORKER_ID,
+    )
+
+
+async def acquire_lease(db_session: AsyncSession, model: Any, row_id: int) -> bool:
+    """Try to lease the row for the current worker, returns False if another
+    worker was faster."""
+    result = await db_session.execute(
+        update(model)
+        .where(model.id == row_id, is_lease_available(model))
+        .values(lease_owner=WORKER_ID, lease_expires_at=now() + LEASE_DURATION)
+        .execution_options(synchronize_session=False)
+    )
+    await db_session.commit()
+    return result.rowcount == 1  # type: ignore
+
+
+def release_lease(row: Any) -> None:
+    row.lease_owner = None
+    row.lease_expires_at = None
+
 
 class Worker(Generic[T]):
+    # Channel notified (`app.database.notify`) when new messages are queued,
+    # PostgreSQL only, the worker polls the DB every few seconds otherwise
+    notify_channel: str | None = None
+
     def __init__(self) -> None:
         self._loop = asyncio.get_event_loop()
         self._stop_event = asyncio.Event()
+        self._notified_event = asyncio.Event()
+        self._poll_interval = 2.0
+        if IS_POSTGRESQL and self.notify_channel:
+            self._poll_interval = 10.0
 
     async def process_message(self, db_session: AsyncSession, message: T) -> None:
         raise NotImplementedError
@@ -27,12 +77,32 @@ class Worker(Generic[T]):
 
     async def _main_loop(self, db_session: AsyncSession) -> None:
         while not self._stop_event.is_set():
+            metrics.maybe_write_snapshot()
             next_message = await self.get_next_message(db_session)
             if next_message:
                 await self.process_message(db_session, next_message)
                 await asyncio.sleep(0.5)
             else:
-                await asyncio.sleep(2)
+                await self._wait_for_notification()
+
+    async def _wait_for_notification(self) -> None:
+        try:
+            await asyncio.wait_for(
+                self._notified_event.wait(), timeout=self._poll_interval
+            )
+        except asyncio.TimeoutError:
+            pass
+        self._notified_event.clear()
+
+    async def _listen(self, channel: str) -> None:
+        async with async_engine.connect() as conn:
+            raw_connection = await conn.get_raw_connection()
+            await raw_connection.driver_connection.add_listener(
+                channel,
+                lambda *args: self._notified_event.set(),
+            )
+            logger.info(f"Listening on {channel=}")
+            await self._stop_event.wait()
 
     async def _until_stopped(self) -> None:
         await self._stop_event.wait()
@@ -48,6 +118,8 @@ class Worker(Generic[T]):
         async with async_session() as db_session:
             await self.startup(db_session)
             task = self._loop.create_task(self._main_loop(db_session))
+            if IS_POSTGRESQL and self.notify_channel:
+                self._loop.create_task(self._listen(self.notify_channel))
             stop_task = self._loop.create_task(self._until_stopped())
 
             done, pending = await asyncio.wait(
@@ -12,6 +12,7 @@ from app.utils.url import check_url
 async def get_webfinger_via_host_meta(host: str) -> str | None:
     resp: httpx.Response | None = None
     is_404 = False
+    transport_error: httpx.HTTPError | None = None
     async with httpx.AsyncClient() as client:
         for i, proto in enumerate({"http", "https"}):
             try:
@@ -32,8 +33,9 @@ async def get_webfinger_via_host_meta(host: str) -> str | None:
                     is_404 = True
                     continue
                 raise
-            except httpx.HTTPError:
+            except httpx.HTTPError as http_error:
                 logger.exception("req failed")
+                transport_error = http_error
                 # If we tried https first and the domain is "http only"
                 if i == 0:
                     continue
@@ -42,6 +44,10 @@ async def get_webfinger_via_host_meta(host: str) -> str | None:
         if is_404:
             return None
 
+    # Timeouts, connection errors... are not a definitive answer
+    if resp is None and transport_error:
+        raise transport_error
+
     if resp:
         tree = ET.fromstring(resp.text)
         maybe_link = tree.find(
@@ -83,6 +89,7 @@ async def webfinger(
     resource = "acct:" + resource
 
     is_404 = False
+    transport_error: httpx.HTTPError | None = None
 
     resp: httpx.Response | None = None
     async with httpx.AsyncClient() as client:
@@ -105,8 +112,9 @@ async def webfinger(
                     is_404 = True
                     continue
                 raise
-            except httpx.HTTPError:
+            except httpx.HTTPError as http_error:
                 logger.exception("req failed")
+                transport_error = http_error
                 # If we tried https first and the domain is "http only"
                 if i == 0:
                     continue
@@ -121,6 +129,9 @@ async def webfinger(
                 )
         return None
 
+    if resp is None and transport_error:
+        raise transport_error
+
     if resp:
         return resp.json()
     else:
@@ -142,6 +153,9 @@ async def get_actor_url(resource: str) -> str | None:
 
     Returns:
         the Actor URL or None if the resolution failed.
+
+    Raises:
+        httpx.HTTPError on server errors and timeouts/connection errors.
     """
     data = await webfinger(resource)
     if data is None:
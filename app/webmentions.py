@@ -1,6 +1,5 @@
 from urllib.parse import urlparse
 
-import httpx
 from bs4 import BeautifulSoup  # type: ignore
 from fastapi import APIRouter
 from fastapi import Depends
@@ -18,6 +17,7 @@ from app.boxes import _get_outbox_replies_count
 from app.boxes import get_outbox_object_by_ap_id
 from app.boxes import get_outbox_object_by_slug_and_short_id
 from app.boxes import is_notification_enabled
+from app.config import BASE_URL
 from app.database import AsyncSession
 from app.database import get_db_session
 from app.utils import microformats
@@ -57,13 +57,50 @@ async def webmention_endpoint(
 
         check_url(source)
         check_url(target)
-        parsed_target_url = urlparse(target)
     except Exception:
         logger.exception("Invalid webmention request")
         raise HTTPException(status_code=400, detail="Invalid payload")
 
+    if not target.startswith(BASE_URL):
+        logger.info(f"Invalid target {target=}")
+        raise HTTPException(status_code=400, detail="Invalid target")
+
     logger.info(f"Received webmention {source=} {target=}")
 
+    # Coalesce repeated pings for the same source/target pair, the worker will
+    # fetch the latest version of the source anyway
+    pending_webmention = (
+        await db_session.scalars(
+            select(models.IncomingActivity).where(
+                models.IncomingActivity.webmention_source == source,
+                models.IncomingActivity.webmention_target == target,
+                models.IncomingActivity.is_processed.is_(False),
+                models.IncomingActivity.is_errored.is_(False),
+            )
+        )
+    ).first()
+    if pending_webmention:
+        logger.info(f"Webmention already queued as {pending_webmention.id}")
+    else:
+        db_session.add(
+            models.IncomingActivity(
+                webmention_source=source,
+                webmention_target=target,
+            )
+        )
+        await db_session.commit()
+
+    return JSONResponse(content={}, status_code=202)
+
+
+async def process_webmention(
+    db_session: AsyncSession,
+    source: str,
+    target: str,
+) -> None:
+    """Verify and parse a queued webmention (called by the incoming worker)."""
+    parsed_target_url = urlparse(target)
+
     existing_webmention_in_db = (
         await db_session.execute(
             select(models.Webmention).where(
@@ -92,21 +129,18 @@ async def webmention_endpoint(
         if existing_webmention_in_db:
             logger.info("Deleting existing Webmention")
             existing_webmention_in_db.is_deleted = True
-            await db_session.commit()
-        raise HTTPException(status_code=400, detail="Invalid target")
+            await db_session.flush()
+        return None
 
     is_webmention_deleted = False
+    is_target_found_in_source = False
     try:
-        data_and_html = await microformats.fetch_and_parse(source)
+        data, html = await microformats.fetch_and_parse(source)
     except microformats.URLNotFoundOrGone:
         is_webmention_deleted = True
-    except httpx.HTTPError:
-        raise HTTPException(status_code=500, detail=f"Fetch to process {source}")
-
-    data, html = data_and_html
-    is_target_found_in_source = is_source_containing_target(html, target)
+    else:
+        is_target_found_in_source = is_source_containing_target(html, target)
 
-    data, html = data_and_html
     if is_webmention_deleted or not is_target_found_in_source:
         logger.warning(f"target {target=} not found in source")
         if existing_webmention_in_db:
@@ -127,15 +161,9 @@ async def webmention_endpoint(
                 )
                 db_session.add(notif)
 
-            await db_session.commit()
+            await db_session.flush()
 
-        if not is_target_found_in_source:
-            raise HTTPException(
-                status_code=400,
-                detail="target not found in source",
-            )
-        else:
-            return JSONResponse(content={}, status_code=200)
+        return None
 
     webmention_type = models.WebmentionType.UNKNOWN
     webmention: models.Webmention
@@ -197,9 +225,7 @@ async def webmention_endpoint(
 
     # Handle side effect
     await _handle_webmention_side_effects(db_session, webmention, mentioned_object)
-    await db_session.commit()
-
-    return JSONResponse(content={}, status_code=200)
+    await db_session.flush()
 
 
 async def _handle_webmention_side_effects(
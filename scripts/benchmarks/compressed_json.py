@@ -0,0 +1,211 @@
+"""Size savings and read/write overhead of the compressed JSON columns.
+
+Typical documents are stored as plain JSON, with zlib, and with zlib primed
+with the ActivityPub dictionary (`app.utils.compressed_json`).
+
+Run with `inv benchmark compressed_json`.
+"""
+import time
+import zlib
+from typing import Any
+from typing import Callable
+
+from tabulate import tabulate
+
+from app.utils import json_codec
+from app.utils.compressed_json import compress
+from app.utils.compressed_json import decompress
+
+_ITERATIONS = 2000
+
+_ACTOR = "https://mastodon.example/users/toto"
+
+
+def _note_id(i: int) -> str:
+    return f"{_ACTOR}/statuses/10960231855{i:07d}"
+
+
+def _create_note() -> dict[str, Any]:
+    note_id = _note_id(1)
+    note: dict[str, Any] = {
+        "id": note_id,
+        "type": "Note",
+        "summary": None,
+        "inReplyTo": _note_id(2),
+        "published": "2023-01-07T10:02:11Z",
+        "url": "https://mastodon.example/@toto/109602318551234567",
+        "attributedTo": _ACTOR,
+        "to": ["https://www.w3.org/ns/activitystreams#Public"],
+        "cc": [f"{_ACTOR}/followers", "https://remote.example/users/alice"],
+        "sensitive": False,
+        "atomUri": note_id,
+        "inReplyToAtomUri": _note_id(2),
+        "conversation": "tag:mastodon.example,2023-01-07:objectId=1234:objectType=Conversation",  # noqa: E501
+        "content": (
+            '<p><span class="h-card"><a href="https://remote.example/@alice" '
+            'class="u-url mention">@<span>alice</span></a></span> Thanks for '
+            "sharing, I had the same issue with my instance last week. The fix "
+            'is in the latest release: <a href="https://example.org/release" '
+            'rel="nofollow noopener noreferrer" target="_blank">'
+            "https://example.org/release</a></p><p>Let me know if it helps!</p>"
+        ),
+        "attachment": [
+            {
+                "type": "Document",
+                "mediaType": "image/jpeg",
+                "url": "https://files.mastodon.example/media/original/1.jpg",
+                "name": "A screenshot of the release notes",
+                "blurhash": "UBL_:rOpGG-oBUNG,qRj2so|=eE1w^n4S5NH",
+                "focalPoint": [0.0, 0.0],
+                "width": 1200,
+                "height": 800,
+            }
+        ],
+        "tag": [
+            {
+                "type": "Mention",
+                "href": "https://remote.example/users/alice",
+                "name": "@alice@remote.example",
+            },
+            {
+                "type": "Hashtag",
+                "href": "https://mastodon.example/tags/fediverse",
+                "name": "#fediverse",
+            },
+        ],
+        "replies": {
+            "id": f"{note_id}/replies",
+            "type": "Collection",
+            "first": {
+                "type": "CollectionPage",
+                "next": f"{note_id}/replies?only_other_accounts=true&page=true",
+                "partOf": f"{note_id}/replies",
+                "items": [],
+            },
+        },
+    }
+    note["contentMap"] = {"en": note["content"]}
+    return {
+        "@context": [
+            "https://www.w3.org/ns/activitystreams",
+            {
+                "ostatus": "http://ostatus.org#",
+                "atomUri": "ostatus:atomUri",
+                "inReplyToAtomUri": "ostatus:inReplyToAtomUri",
+                "conversation": "ostatus:conversation",
+                "sensitive": "as:sensitive",
+                "toot": "http://joinmastodon.org/ns#",
+                "votersCount": "toot:votersCount",
+                "blurhash": "toot:blurhash",
+                "focalPoint": {"@container": "@list", "@id": "toot:focalPoint"},
+                "Hashtag": "as:Hashtag",
+            },
+        ],
+        "id": f"{note_id}/activity",
+        "type": "Create",
+        "actor": _ACTOR,
+        "published": note["published"],
+        "to": note["to"],
+        "cc": note["cc"],
+        "object": note,
+        "signature": {
+            "type": "RsaSignature2017",
+            "creator": f"{_ACTOR}#main-key",
+            "created": "2023-01-07T10:02:12Z",
+            "signatureValue": "dGhpcyBpcyBub3QgYSByZWFsIHNpZ25hdHVyZQ==" * 8,
+        },
+    }
+
+
+def _like() -> dict[str, Any]:
+    return {
+        "@context": "https://www.w3.org/ns/activitystreams",
+        "id": f"{_ACTOR}#likes/123456",
+        "type": "Like",
+        "actor": _ACTOR,
+        "object": "https://microblog.example/o/2b4f1a8e9c7d4e5f",
+    }
+
+
+def _source_microformats() -> dict[str, Any]:
+    return {
+        "items": [
+            {
+                "type": ["h-entry"],
+                "properties": {
+                    "author": [
+                        {
+                            "type": ["h-card"],
+                            "properties": {
+                                "name": ["Alice"],
+                                "photo": ["https://alice.example/photo.jpg"],
+                                "url": ["https://alice.example/"],
+                            },
+                        }
+                    ],
+                    "content": [
+                        {
+                            "html": "<p>Great post, I wrote a reply on my blog.</p>",
+                            "value": "Great post, I wrote a reply on my blog.",
+                        }
+                    ],
+                    "in-reply-to": ["https://microblog.example/o/2b4f1a8e9c7d4e5f"],
+                    "published": ["2023-01-07T10:02:11+00:00"],
+                    "url": ["https://alice.example/2023/01/reply"],
+                },
+            }
+        ],
+        "rels": {"webmention": ["https://alice.example/webmention"]},
+        "rel-urls": {},
+    }
+
+
+def _timeit(func: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    for _ in range(_ITERATIONS):
+        func()
+    return (time.perf_counter() - start) / _ITERATIONS * 1_000_000
+
+
+def main() -> None:
+    rows = []
+    for name, doc in [
+        ("Create(Note)", _create_note()),
+        ("Like", _like()),
+        ("webmention microformats", _source_microformats()),
+    ]:
+        raw = json_codec.dumps_bytes(doc)
+        compressed = compress(doc)
+        rows.append(
+            (
+                name,
+                len(raw),
+                f"{len(zlib.compress(raw)) / len(raw):.0%}",
+                f"{len(compressed) / len(raw):.0%}",
+                f"{_timeit(lambda: json_codec.dumps_bytes(doc)):.1f}",
+                f"{_timeit(lambda: compress(doc)):.1f}",
+                f"{_timeit(lambda: json_codec.loads(raw)):.1f}",
+                f"{_timeit(lambda: decompress(compressed)):.1f}",
+            )
+        )
+
+    print(f"orjson installed: {json_codec.orjson is not None}")
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "document",
+                "JSON (bytes)",
+                "zlib",
+                "zlib + dict",
+                "write JSON (µs)",
+                "write compressed (µs)",
+                "read JSON (µs)",
+                "read compressed (µs)",
+            ],
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
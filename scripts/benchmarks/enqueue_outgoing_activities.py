@@ -0,0 +1,104 @@
+"""Compare queuing outgoing activities row by row vs. in bulk.
+
+Run with `inv benchmark enqueue_outgoing_activities`.
+"""
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from tabulate import tabulate
+
+from app import activitypub as ap
+from app import models
+from app.database import Base
+from app.outgoing_activities import new_outgoing_activities
+from app.outgoing_activities import new_outgoing_activity
+from app.utils.datetime import now
+
+_RECIPIENTS_COUNTS = [10, 100, 1000, 3000]
+
+
+async def _setup_outbox_object(db_session: AsyncSession) -> int:
+    outbox_object = models.OutboxObject(
+        public_id="benchmark",
+        ap_type="Note",
+        ap_id="https://example.com/o/benchmark",
+        ap_object={},
+        visibility=ap.VisibilityEnum.PUBLIC,
+        ap_published_at=now(),
+    )
+    db_session.add(outbox_object)
+    await db_session.commit()
+    if not outbox_object.id:
+        raise ValueError("Should never happen")
+    return outbox_object.id
+
+
+async def _one_by_one(
+    db_session: AsyncSession,
+    recipients: list[str],
+    outbox_object_id: int,
+) -> None:
+    for recipient in recipients:
+        await new_outgoing_activity(db_session, recipient, outbox_object_id)
+    await db_session.commit()
+
+
+async def _bulk(
+    db_session: AsyncSession,
+    recipients: list[str],
+    outbox_object_id: int,
+) -> None:
+    await new_outgoing_activities(
+        db_session, recipients, outbox_object_id=outbox_object_id
+    )
+    await db_session.commit()
+
+
+async def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{Path(tmp_dir) / 'benchmark.db'}"
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        rows = []
+        async with AsyncSession(engine, expire_on_commit=False) as db_session:
+            outbox_object_id = await _setup_outbox_object(db_session)
+            for count in _RECIPIENTS_COUNTS:
+                recipients = [f"https://example{i}.com/inbox" for i in range(count)]
+                timings = []
+                for enqueue in [_one_by_one, _bulk]:
+                    start = time.perf_counter()
+                    await enqueue(db_session, recipients, outbox_object_id)
+                    timings.append(time.perf_counter() - start)
+
+                    await db_session.execute(delete(models.OutgoingActivity))
+                    await db_session.commit()
+
+                rows.append(
+                    (
+                        count,
+                        f"{timings[0] * 1000:.1f}",
+                        f"{timings[1] * 1000:.1f}",
+                        f"{timings[0] / timings[1]:.1f}x",
+                    )
+                )
+
+        await engine.dispose()
+
+    print(
+        tabulate(
+            rows,
+            headers=["recipients", "one by one (ms)", "bulk (ms)", "speedup"],
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+"""Sustained inbox enqueue throughput, with and without the write buffer.
+
+Simulates concurrent inbox requests saving their activity (the HTTP signature
+verification is not included) against a SQLite DB file.
+
+Run with `inv benchmark inbox_write_buffer`.
+"""
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable
+from typing import Callable
+
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from tabulate import tabulate
+
+from app import models
+from app.database import Base
+from app.httpsig import HTTPSigInfo
+from app.incoming_activities import WriteBuffer
+from app.incoming_activities import new_ap_incoming_activity
+
+_REQUESTS_COUNT = 2000
+_CONCURRENCY = [1, 10, 50]
+_WINDOW_MS = 5
+
+_HTTPSIG_INFO = HTTPSigInfo(
+    has_valid_signature=True,
+    signed_by_ap_actor_id="https://example.com/users/toto",
+)
+
+
+def _build_activity(i: int) -> dict:
+    return {
+        "@context": "https://www.w3.org/ns/activitystreams",
+        "id": f"https://example.com/activities/{i}",
+        "type": "Create",
+        "actor": "https://example.com/users/toto",
+        "object": {
+            "id": f"https://example.com/notes/{i}",
+            "type": "Note",
+            "content": "Hello " * 50,
+        },
+    }
+
+
+async def _run(
+    concurrency: int,
+    save: Callable[[dict], Awaitable[None]],
+) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _request(i: int) -> None:
+        async with semaphore:
+            await save(_build_activity(i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[_request(i) for i in range(_REQUESTS_COUNT)])
+    return _REQUESTS_COUNT / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    rows = []
+    for concurrency in _CONCURRENCY:
+        results = []
+        for buffered in [False, True]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                engine = create_async_engine(
+                    f"sqlite+aiosqlite:///{Path(tmp_dir) / 'benchmark.db'}",
+                    connect_args={"timeout": 15},
+                )
+                async with engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.create_all)
+
+                session_maker = sessionmaker(
+                    engine, class_=AsyncSession, expire_on_commit=False
+                )
+                write_buffer = WriteBuffer(
+                    window=_WINDOW_MS / 1000,
+                    session_maker=session_maker,
+                )
+
+                async def _save(raw_object: dict) -> None:
+                    if buffered:
+                        await write_buffer.add(
+                            {
+                                "sent_by_ap_actor_id": (
+                                    _HTTPSIG_INFO.signed_by_ap_actor_id
+                                ),
+                                "ap_id": raw_object["id"],
+                                "ap_object": raw_object,
+                            }
+                        )
+                    else:
+                        async with session_maker() as db_session:
+                            await new_ap_incoming_activity(
+                                db_session, _HTTPSIG_INFO, raw_object
+                            )
+
+                results.append(await _run(concurrency, _save))
+                await write_buffer.stop()
+
+                async with session_maker() as db_session:
+                    count = await db_session.scalar(
+                        select(func.count(models.IncomingActivity.id))
+                    )
+                if count != _REQUESTS_COUNT:
+                    raise ValueError(f"Expected {_REQUESTS_COUNT} rows, got {count}")
+
+                await engine.dispose()
+
+        rows.append(
+            (
+                concurrency,
+                f"{results[0]:.0f}",
+                f"{results[1]:.0f}",
+                f"{results[1] / results[0]:.1f}x",
+            )
+        )
+
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "concurrent requests",
+                "commit per request (req/s)",
+                f"write buffer {_WINDOW_MS}ms (req/s)",
+                "speedup",
+            ],
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
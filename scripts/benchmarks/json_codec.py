@@ -0,0 +1,125 @@
+"""JSON handling cost of an inbox request, before and after the single parse.
+
+The previous code path parsed the body twice (the HTTP signature checker and
+the inbox handler) and serialized it once with the stdlib `json` module, the
+new one parses it once and serializes it once with `app.utils.json_codec`.
+
+Run with `inv benchmark json_codec`.
+"""
+import json
+import time
+from typing import Any
+from typing import Callable
+
+from tabulate import tabulate
+
+from app.utils import json_codec
+
+_ITERATIONS = 500
+_SIZES_KB = [10, 25, 50]
+
+
+def _build_payload(size_kb: int) -> bytes:
+    actor = "https://example.com/users/toto"
+    note: dict[str, Any] = {
+        "id": "https://example.com/users/toto/statuses/109",
+        "type": "Note",
+        "attributedTo": actor,
+        "to": ["https://www.w3.org/ns/activitystreams#Public"],
+        "cc": [f"{actor}/followers"],
+        "published": "2023-01-02T10:00:00Z",
+        "sensitive": False,
+        "content": "",
+        "contentMap": {"en": ""},
+        "tag": [],
+        "attachment": [],
+    }
+    payload = {
+        "@context": [
+            "https://www.w3.org/ns/activitystreams",
+            {"ostatus": "http://ostatus.org#", "sensitive": "as:sensitive"},
+        ],
+        "id": f"{note['id']}/activity",
+        "type": "Create",
+        "actor": actor,
+        "published": note["published"],
+        "to": note["to"],
+        "cc": note["cc"],
+        "object": note,
+        "signature": {"type": "RsaSignature2017", "signatureValue": "A" * 344},
+    }
+
+    i = 0
+    while len(json.dumps(payload)) < size_kb * 1024:
+        note["tag"].append(
+            {
+                "type": "Mention",
+                "href": f"https://remote{i}.example/users/user{i}",
+                "name": f"@user{i}@remote{i}.example",
+            }
+        )
+        note["attachment"].append(
+            {
+                "type": "Document",
+                "mediaType": "image/jpeg",
+                "url": f"https://example.com/media/{i}.jpg",
+                "name": "Alt text with ünïcödé " * 3,
+                "blurhash": "UBL_:rOpGG-oBUNG,qRj2so|=eE1w^n4S5NH",
+            }
+        )
+        note["content"] += f"<p>Paragraph {i} with some émojis 🎉 and text.</p>"
+        note["contentMap"]["en"] = note["content"]
+        i += 1
+
+    return json.dumps(payload).encode()
+
+
+def _stdlib_path(body: bytes) -> None:
+    json.loads(body)  # HTTP signature checker
+    payload = json.loads(body)  # inbox handler
+    json.dumps(payload)  # SQLAlchemy JSON column
+
+
+def _codec_path(body: bytes) -> None:
+    payload = json_codec.loads(body)
+    json_codec.dumps(payload)
+
+
+def _timeit(func: Callable[[bytes], None], body: bytes) -> float:
+    start = time.perf_counter()
+    for _ in range(_ITERATIONS):
+        func(body)
+    return (time.perf_counter() - start) / _ITERATIONS * 1_000_000
+
+
+def main() -> None:
+    rows = []
+    for size_kb in _SIZES_KB:
+        body = _build_payload(size_kb)
+        before = _timeit(_stdlib_path, body)
+        after = _timeit(_codec_path, body)
+        rows.append(
+            (
+                f"{len(body) / 1024:.0f}KB",
+                f"{before:.0f}",
+                f"{after:.0f}",
+                f"{before / after:.1f}x",
+            )
+        )
+
+    print(f"orjson installed: {json_codec.orjson is not None}")
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "payload",
+                "2 parses + dump, stdlib (µs)",
+                "1 parse + dump, json_codec (µs)",
+                "speedup",
+            ],
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
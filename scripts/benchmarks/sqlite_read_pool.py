@@ -0,0 +1,160 @@
+"""Page latency under a concurrent inbox load, with and without the tuned
+SQLite engines (pragmas on connect and a pooled read-only engine).
+
+Pages are simulated by the queries of the notes page (latest public notes and
+the counters of the layout), while writers save incoming activities with a
+commit per activity like the inbox does.
+
+Run with `inv benchmark sqlite_read_pool`.
+"""
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from tabulate import tabulate
+
+from app import activitypub as ap
+from app import models
+from app.database import DEFAULT_SQLITE_PRAGMAS
+from app.database import Base
+from app.database import apply_sqlite_pragmas
+
+_NOTES_COUNT = 5000
+_PAGES_COUNT = 1000
+_READERS_COUNT = 10
+_WRITERS_COUNT = 4
+_READ_POOL_SIZE = 8
+
+
+async def _seed(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(text("PRAGMA journal_mode=WAL"))
+        await conn.run_sync(Base.metadata.create_all)
+
+    session_maker = sessionmaker(engine, class_=AsyncSession)
+    async with session_maker() as db_session:
+        for i in range(_NOTES_COUNT):
+            ap_id = f"https://example.com/o/{i}"
+            db_session.add(
+                models.OutboxObject(
+                    public_id=str(i),
+                    ap_type="Note",
+                    ap_id=ap_id,
+                    ap_object={"id": ap_id, "type": "Note", "content": "Hello " * 100},
+                    visibility=ap.VisibilityEnum.PUBLIC,
+                )
+            )
+        await db_session.commit()
+
+
+async def _render_page(db_session: AsyncSession) -> None:
+    (
+        await db_session.scalars(
+            select(models.OutboxObject)
+            .where(
+                models.OutboxObject.visibility == ap.VisibilityEnum.PUBLIC,
+                models.OutboxObject.is_deleted.is_(False),
+                models.OutboxObject.ap_type == "Note",
+            )
+            .order_by(models.OutboxObject.ap_published_at.desc())
+            .limit(20)
+        )
+    ).all()
+    for column in [models.OutboxObject.id, models.Follower.id, models.Following.id]:
+        await db_session.scalar(select(func.count(column)))
+
+
+async def _run(
+    write_session_maker: sessionmaker,
+    read_session_maker: sessionmaker,
+) -> list[float]:
+    latencies: list[float] = []
+    pages = iter(range(_PAGES_COUNT))
+    is_done = asyncio.Event()
+
+    async def _reader() -> None:
+        for _ in pages:
+            start = time.perf_counter()
+            async with read_session_maker() as db_session:
+                await _render_page(db_session)
+            latencies.append(time.perf_counter() - start)
+
+    async def _writer(writer_id: int) -> None:
+        i = 0
+        while not is_done.is_set():
+            async with write_session_maker() as db_session:
+                ap_id = f"https://remote.example/activities/{writer_id}-{i}"
+                db_session.add(
+                    models.IncomingActivity(
+                        ap_id=ap_id,
+                        ap_object={"id": ap_id, "type": "Create"},
+                    )
+                )
+                await db_session.commit()
+            i += 1
+
+    writers = [asyncio.create_task(_writer(i)) for i in range(_WRITERS_COUNT)]
+    await asyncio.gather(*[_reader() for _ in range(_READERS_COUNT)])
+    is_done.set()
+    await asyncio.gather(*writers)
+    return latencies
+
+
+async def main() -> None:
+    rows = []
+    for tuned in [False, True]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            url = f"sqlite+aiosqlite:///{Path(tmp_dir) / 'benchmark.db'}"
+            engine = create_async_engine(url, connect_args={"timeout": 15})
+            await _seed(engine)
+
+            read_engine = engine
+            if tuned:
+                apply_sqlite_pragmas(engine.sync_engine, DEFAULT_SQLITE_PRAGMAS)
+                read_engine = create_async_engine(
+                    url,
+                    connect_args={"timeout": 15},
+                    poolclass=AsyncAdaptedQueuePool,
+                    pool_size=_READ_POOL_SIZE,
+                    max_overflow=-1,
+                )
+                apply_sqlite_pragmas(
+                    read_engine.sync_engine,
+                    {**DEFAULT_SQLITE_PRAGMAS, "query_only": "ON"},
+                )
+
+            latencies = await _run(
+                sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+                sessionmaker(read_engine, class_=AsyncSession),
+            )
+            await engine.dispose()
+            await read_engine.dispose()
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        rows.append(
+            (
+                "tuned + read pool" if tuned else "default",
+                f"{quantiles[49] * 1000:.1f}",
+                f"{quantiles[98] * 1000:.1f}",
+            )
+        )
+
+    print(
+        f"{_PAGES_COUNT} pages, {_READERS_COUNT} concurrent readers, "
+        f"{_WRITERS_COUNT} concurrent inbox writers"
+    )
+    print(tabulate(rows, headers=["engines", "p50 (ms)", "p99 (ms)"]))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -117,13 +117,23 @@ def process_incoming_activities(ctx):
 
 
 @task
-def tests(ctx, k=None):
-    # type: (Context, Optional[str]) -> None
+def tests(ctx, k=None, config="tests.toml"):
+    # type: (Context, Optional[str], str) -> None
     pytest_args = " -vvv"
     if k:
         pytest_args += f" -k {k}"
     run(
-        f"MICROBLOGPUB_CONFIG_FILE=tests.toml pytest tests{pytest_args}",
+        f"MICROBLOGPUB_CONFIG_FILE={config} pytest tests{pytest_args}",
+        pty=True,
+        echo=True,
+    )
+
+
+@task
+def benchmark(ctx, name):
+    # type: (Context, str) -> None
+    run(
+        f"MICROBLOGPUB_CONFIG_FILE=tests.toml PYTHONPATH=. python scripts/benchmarks/{name}.py",  # noqa: E501
         pty=True,
         echo=True,
     )
@@ -199,6 +209,38 @@ def stats(ctx):
     print_stats()
 
 
+@task
+def rebuild_search_index(ctx):
+    # type: (Context) -> None
+    from app.search import rebuild_search_index
+
+    asyncio.run(rebuild_search_index())
+
+
+@task
+def profile_worker(ctx, worker, iterations=100, output=None):
+    # type: (Context, str, int, Optional[str]) -> None
+    import json
+
+    from app.templates import render_profile_report
+    from app.utils.profiler import profile_worker
+    from app.utils.profiler import to_speedscope
+
+    worker_profile = asyncio.run(profile_worker(worker, int(iterations)))
+
+    output_path = Path(output or f"data/{worker}_worker.speedscope.json")
+    if output_path.suffix == ".html":
+        output_path.write_text(render_profile_report(worker_profile))
+    else:
+        output_path.write_text(json.dumps(to_speedscope(worker_profile)))
+
+    print(
+        f"{worker_profile.duration:.2f}s, "
+        f"{worker_profile.sql_queries_count} SQL queries "
+        f"({worker_profile.sql_time:.2f}s), profile saved to {output_path}"
+    )
+
+
 @contextmanager
 def embed_version() -> Generator[None, None, None]:
     from app.utils.version import get_version_commit
@@ -221,11 +263,16 @@ def build_docker_image(ctx):
 
 
 @task
-def prune_old_data(ctx):
-    # type: (Context) -> None
-    from app.prune import run_prune_old_data
+def prune_old_data(ctx, loop=False):
+    # type: (Context, bool) -> None
+    if loop:
+        from app.prune import loop as prune_loop
+
+        asyncio.run(prune_loop())
+    else:
+        from app.prune import run_prune_old_data
 
-    asyncio.run(run_prune_old_data())
+        asyncio.run(run_prune_old_data())
 
 
 @task
@@ -392,7 +439,7 @@ def import_mastodon_following_accounts(ctx, path):
     # type: (Context, str) -> None
     from loguru import logger
 
-    from app.boxes import _get_following
+    from app.boxes import _get_following_ap_actor_ids
     from app.boxes import _send_follow
     from app.database import async_session
     from app.utils.mastodon import get_actor_urls_from_following_accounts_csv_file
@@ -400,9 +447,7 @@ def import_mastodon_following_accounts(ctx, path):
     async def _import_following() -> int:
         count = 0
         async with async_session() as db_session:
-            followings = {
-                following.ap_actor_id for following in await _get_following(db_session)
-            }
+            followings = await _get_following_ap_actor_ids(db_session)
             for (
                 handle,
                 actor_url,
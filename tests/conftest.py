@@ -9,9 +9,18 @@ from app.database import async_engine
 from app.database import async_session
 from app.database import engine
 from app.main import app
+from app.utils import query_tracker
 from tests.factories import _Session
 
 
+@pytest.fixture(autouse=True, scope="session")
+def strict_query_tracker() -> Generator:
+    # Fail the tests on N+1 queries instead of logging a warning
+    query_tracker.STRICT_MODE = True
+    yield
+    query_tracker.STRICT_MODE = False
+
+
 @pytest_asyncio.fixture
 async def async_db_session():
     async with async_session() as session:
@@ -1,9 +1,18 @@
+import re
 import typing
 
+import respx
 import starlette
 from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
 
+from app import models
 from app.main import app
+from app.utils.datetime import now
+from tests.utils import generate_admin_session_cookies
+from tests.utils import setup_inbox_note
+from tests.utils import setup_remote_actor
+from tests.utils import setup_remote_actor_as_following
 
 
 def test_admin_endpoints_are_authenticated(client: TestClient) -> None:
@@ -25,3 +34,110 @@ def test_admin_endpoints_are_authenticated(client: TestClient) -> None:
             routes_tested.append((method, route.path))
 
     assert len(routes_tested) > 0
+
+
+def test_profiler__html(db: Session, client: TestClient) -> None:
+    response = client.get(
+        "/admin/inbox?profiler=html",
+        cookies=generate_admin_session_cookies(),
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    assert "style-src 'unsafe-inline'" in response.headers["content-security-policy"]
+    assert "<h1>GET /admin/inbox</h1>" in response.text
+    assert "queries" in response.text
+
+
+def test_profiler__speedscope(db: Session, client: TestClient) -> None:
+    response = client.get(
+        "/admin/inbox?profiler=speedscope",
+        cookies=generate_admin_session_cookies(),
+    )
+
+    assert response.status_code == 200
+    assert response.json()["profiles"][0]["type"] == "sampled"
+
+
+def test_profiler__requires_admin(db: Session, client: TestClient) -> None:
+    response = client.get("/?profiler=html")
+
+    # The page is returned as is
+    assert response.status_code == 200
+    assert "<h1>GET /</h1>" not in response.text
+
+
+def test_admin_stream__pagination_with_same_date(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a followed actor
+    ra = setup_remote_actor(respx_mock)
+    following = setup_remote_actor_as_following(ra)
+    assert following.actor
+
+    # And more stream entries than a page, all published at the same time
+    published_at = now()
+    for i in range(25):
+        inbox_object = setup_inbox_note(following.actor, content=f"stream-note-{i}")
+        db.add(
+            models.StreamEntry(
+                inbox_object_id=inbox_object.id,
+                actor_id=following.actor_id,
+                ap_published_at=published_at,
+            )
+        )
+    db.commit()
+
+    # When browsing the stream
+    seen_notes = []
+    url = "/admin/stream"
+    for _ in range(3):
+        response = client.get(url, cookies=generate_admin_session_cookies())
+        assert response.status_code == 200
+        seen_notes.extend(re.findall(r"stream-note-\d+", response.text))
+        next_cursor = re.search(r"\?cursor=([^\"&]+)\">See more", response.text)
+        if not next_cursor:
+            break
+        url = f"/admin/stream?cursor={next_cursor.group(1)}"
+
+    # Then every note is displayed exactly once
+    assert sorted(seen_notes) == sorted(f"stream-note-{i}" for i in range(25))
+
+
+def test_admin_tags__pagination_with_same_date(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given more tagged objects than a page, all published at the same time
+    ra = setup_remote_actor(respx_mock)
+    following = setup_remote_actor_as_following(ra)
+    assert following.actor
+    published_at = now()
+    for i in range(25):
+        inbox_object = setup_inbox_note(following.actor, content=f"tagged-note-{i}")
+        db.add(
+            models.TaggedInboxObject(
+                inbox_object_id=inbox_object.id,
+                tag="fediverse",
+                ap_published_at=published_at,
+            )
+        )
+    db.commit()
+
+    # When browsing the tag timeline
+    seen_notes = []
+    url = "/admin/tags?tag=fediverse"
+    for _ in range(3):
+        response = client.get(url, cookies=generate_admin_session_cookies())
+        assert response.status_code == 200
+        seen_notes.extend(re.findall(r"tagged-note-\d+", response.text))
+        next_cursor = re.search(r"cursor=([^\"&]+)\">See more", response.text)
+        if not next_cursor:
+            break
+        url = f"/admin/tags?tag=fediverse&cursor={next_cursor.group(1)}"
+
+    # Then every note is displayed exactly once
+    assert sorted(seen_notes) == sorted(f"tagged-note-{i}" for i in range(25))
@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+import httpx
+import pytest
+import respx
+from sqlalchemy import select
+
+from app import discovery_cache
+from app import models
+from app.database import AsyncSession
+from app.utils.datetime import as_utc
+from app.utils.datetime import now
+
+
+@pytest.mark.asyncio
+async def test_discovery_cache__webmention_endpoint(
+    async_db_session: AsyncSession,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a page with a webmention endpoint
+    respx_mock.get("https://example.com/post").mock(
+        return_value=httpx.Response(
+            200,
+            headers={"Link": '<https://example.com/wm>; rel="webmention"'},
+            html="<html></html>",
+        )
+    )
+
+    # When discovering the endpoint twice
+    for _ in range(2):
+        endpoint = await discovery_cache.get_webmention_endpoint(
+            async_db_session, "https://example.com/post"
+        )
+        assert endpoint == "https://example.com/wm"
+
+    # Then the page was only fetched once
+    assert respx.calls.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_discovery_cache__negative_entry(
+    async_db_session: AsyncSession,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a page without webmention endpoint
+    respx_mock.get("https://example.com/post").mock(
+        return_value=httpx.Response(200, html="<html></html>")
+    )
+
+    # When discovering the endpoint twice
+    for _ in range(2):
+        endpoint = await discovery_cache.get_webmention_endpoint(
+            async_db_session, "https://example.com/post"
+        )
+        assert endpoint is None
+
+    # Then the negative result was cached
+    assert respx.calls.call_count == 1
+    entry = (
+        await async_db_session.execute(select(models.DiscoveryCacheEntry))
+    ).scalar_one()
+    assert entry.value is None
+
+
+@pytest.mark.asyncio
+async def test_discovery_cache__refresh_expiring_entries(
+    async_db_session: AsyncSession,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a cached entry about to expire
+    async_db_session.add(
+        models.DiscoveryCacheEntry(
+            cache_type=models.DiscoveryCacheType.WEBMENTION_ENDPOINT,
+            key="https://example.com/post",
+            value=None,
+            expires_at=now() + timedelta(minutes=5),
+        )
+    )
+    await async_db_session.commit()
+    respx_mock.get("https://example.com/post").mock(
+        return_value=httpx.Response(
+            200,
+            headers={"Link": '<https://example.com/wm>; rel="webmention"'},
+            html="<html></html>",
+        )
+    )
+
+    # When the worker refreshes the cache
+    await discovery_cache.refresh_expiring_entries(async_db_session)
+
+    # Then the entry is updated
+    entry = (
+        await async_db_session.execute(select(models.DiscoveryCacheEntry))
+    ).scalar_one()
+    assert entry.value == "https://example.com/wm"
+    assert respx.calls.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_discovery_cache__refresh_failure_keeps_the_value(
+    async_db_session: AsyncSession,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a cached entry about to expire
+    async_db_session.add(
+        models.DiscoveryCacheEntry(
+            cache_type=models.DiscoveryCacheType.WEBMENTION_ENDPOINT,
+            key="https://example.com/post",
+            value="https://example.com/wm",
+            expires_at=now() + timedelta(minutes=5),
+        )
+    )
+    await async_db_session.commit()
+    respx_mock.get("https://example.com/post").mock(
+        side_effect=httpx.ConnectTimeout("timeout")
+    )
+
+    # When the worker fails to refresh the cache
+    await discovery_cache.refresh_expiring_entries(async_db_session)
+
+    # Then the cached value is kept, and the refresh is retried later
+    entry = (
+        await async_db_session.execute(select(models.DiscoveryCacheEntry))
+    ).scalar_one()
+    assert entry.value == "https://example.com/wm"
+    assert entry.failed_attempts == 1
+    assert now() < as_utc(entry.expires_at) < now() + timedelta(minutes=10)
+
+    # And the value is still served once expired
+    entry.expires_at = now() - timedelta(minutes=1)
+    await async_db_session.commit()
+    endpoint = await discovery_cache.get_webmention_endpoint(
+        async_db_session, "https://example.com/post"
+    )
+    assert endpoint == "https://example.com/wm"
+    assert entry.failed_attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_discovery_cache__server_error_is_not_cached(
+    async_db_session: AsyncSession,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a page returning a server error
+    respx_mock.get("https://example.com/post").mock(return_value=httpx.Response(503))
+
+    # When discovering the endpoint
+    with pytest.raises(httpx.HTTPStatusError):
+        await discovery_cache.get_webmention_endpoint(
+            async_db_session, "https://example.com/post"
+        )
+
+    # Then no negative entry was cached
+    entries = (await async_db_session.scalars(select(models.DiscoveryCacheEntry))).all()
+    assert entries == []
@@ -8,6 +8,7 @@ from fastapi.testclient import TestClient
 
 from app import activitypub as ap
 from app import httpsig
+from app import known_actors
 from app.database import AsyncSession
 from app.httpsig import _KEY_CACHE
 from app.httpsig import HTTPSigInfo
@@ -40,6 +41,13 @@ async def post_enforce_httpsig(
     return _httpsig_info_to_dict(httpsig_info)
 
 
+@_test_app.post("/inbox")
+async def post_inbox(
+    httpsig_info: httpsig.HTTPSigInfo = fastapi.Depends(httpsig.httpsig_checker),
+):
+    return _httpsig_info_to_dict(httpsig_info)
+
+
 def test_enforce_httpsig__no_signature(
     client: TestClient,
     respx_mock: respx.MockRouter,
@@ -177,3 +185,101 @@ async def test_httpsig_checker__with_invvalid_signature(
 
     assert json_response["has_valid_signature"] is False
     assert json_response["signed_by_ap_actor_id"] == ra.ap_id
+
+
+@pytest.mark.asyncio
+async def test_httpsig_checker__drops_delete_from_unknown_actor(
+    respx_mock: respx.MockRouter,
+    async_db_session: AsyncSession,
+) -> None:
+    # Given a remote actor that is not in the DB
+    privkey, pubkey = factories.generate_key()
+    ra = factories.RemoteActorFactory(
+        base_url="https://example.com",
+        username="toto",
+        public_key=pubkey,
+    )
+    respx_mock.get(ra.ap_id).mock(return_value=httpx.Response(200, json=ra.ap_actor))
+    k = Key(ra.ap_id, f"{ra.ap_id}#main-key")
+    k.load(privkey)
+    auth = httpsig.HTTPXSigAuth(k)
+    delete_activity = factories.build_delete_activity(ra, ra.ap_id)
+
+    _KEY_CACHE.clear()
+    known_actors._STATE = known_actors._State()
+
+    # When it sends a Delete
+    async with httpx.AsyncClient(app=_test_app, base_url="http://test") as client:
+        response = await client.post(
+            "/inbox",
+            headers={"Content-Type": ap.AS_CTX},
+            json=delete_activity,
+            auth=auth,  # type: ignore
+        )
+
+    # Then it's dropped without fetching the actor
+    assert response.status_code == 202
+    assert not respx_mock.calls
+    assert known_actors.get_dropped_activities_count()[0] == 1
+
+    # Given the actor is known
+    factories.ActorFactory.from_remote_actor(ra)
+    known_actors._STATE.bloom_filter = None
+
+    # When it sends a Delete
+    async with httpx.AsyncClient(app=_test_app, base_url="http://test") as client:
+        response = await client.post(
+            "/inbox",
+            headers={"Content-Type": ap.AS_CTX},
+            json=delete_activity,
+            auth=auth,  # type: ignore
+        )
+
+    # Then the HTTP signature is verified
+    assert response.status_code == 200
+    assert response.json()["has_valid_signature"] is True
+    assert known_actors.get_dropped_activities_count()[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_httpsig_checker__keeps_delete_of_object_from_unknown_actor(
+    respx_mock: respx.MockRouter,
+    async_db_session: AsyncSession,
+) -> None:
+    # Given a remote actor that is not in the DB
+    privkey, pubkey = factories.generate_key()
+    ra = factories.RemoteActorFactory(
+        base_url="https://example.com",
+        username="toto",
+        public_key=pubkey,
+    )
+    respx_mock.get(ra.ap_id).mock(return_value=httpx.Response(200, json=ra.ap_actor))
+    k = Key(ra.ap_id, f"{ra.ap_id}#main-key")
+    k.load(privkey)
+    auth = httpsig.HTTPXSigAuth(k)
+
+    _KEY_CACHE.clear()
+    known_actors._STATE = known_actors._State()
+
+    # When it sends a Create (still waiting in the incoming activities queue)
+    # followed by a Delete of the created note
+    note = factories.build_note_object(from_remote_actor=ra)
+    async with httpx.AsyncClient(app=_test_app, base_url="http://test") as client:
+        responses = [
+            await client.post(
+                "/inbox",
+                headers={"Content-Type": ap.AS_CTX},
+                json=activity,
+                auth=auth,  # type: ignore
+            )
+            for activity in [
+                factories.build_create_activity(note),
+                factories.build_delete_activity(ra, note["id"]),
+            ]
+        ]
+
+    # Then the Delete is not dropped, the HTTP signatures are verified
+    for response in responses:
+        assert response.status_code == 200
+        assert response.json()["has_valid_signature"] is True
+    assert known_actors.get_dropped_activities_count()[0] == 0
@@ -1,6 +1,9 @@
+from contextlib import contextmanager
 from unittest import mock
+from urllib.parse import urlparse
 from uuid import uuid4
 
+import fastapi
 import httpx
 import respx
 from fastapi.testclient import TestClient
@@ -9,11 +12,23 @@ from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app import activitypub as ap
+from app import actor
+from app import backpressure
+from app import boxes
+from app import config
+from app import httpsig
+from app import incoming_activities
 from app import models
 from app.actor import LOCAL_ACTOR
 from app.ap_object import RemoteObject
+from app.config import generate_csrf_token
+from app.database import AsyncSession
+from app.main import app
+from app.utils.datetime import now
 from tests import factories
+from tests.utils import generate_admin_session_cookies
 from tests.utils import mock_httpsig_checker
+from tests.utils import run_async
 from tests.utils import run_process_next_incoming_activity
 from tests.utils import setup_inbox_delete
 from tests.utils import setup_remote_actor
@@ -90,6 +105,183 @@ def test_inbox_incoming_follow_request(
     assert outgoing_activity.outbox_object_id == outbox_object.id
 
 
+def test_inbox__write_buffer(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a remote actor
+    ra = setup_remote_actor(respx_mock)
+
+    # And the inbox write buffer enabled
+    follow_activity = RemoteObject(
+        factories.build_follow_activity(
+            from_remote_actor=ra,
+            for_remote_actor=LOCAL_ACTOR,
+        ),
+        ra,
+    )
+    with mock_httpsig_checker(ra), mock.patch.object(
+        config, "INBOX_WRITE_BUFFER_MS", 5
+    ), mock.patch.object(
+        incoming_activities,
+        "inbox_write_buffer",
+        incoming_activities.WriteBuffer(window=0.005),
+    ):
+        # When receiving a Follow activity
+        response = client.post(
+            "/inbox",
+            headers={"Content-Type": ap.AS_CTX},
+            json=follow_activity.ap_object,
+        )
+
+    # Then the server returns a 202
+    assert response.status_code == 202
+
+    # And the activity was committed before the response
+    incoming_activity = db.execute(select(models.IncomingActivity)).scalar_one()
+    assert incoming_activity.ap_id == follow_activity.ap_id
+    assert incoming_activity.sent_by_ap_actor_id == ra.ap_id
+    assert incoming_activity.ap_object == follow_activity.ap_object
+
+
+def _post_follow_activity(
+    client: TestClient,
+    ra: actor.RemoteActor,
+    signature: str,
+):
+    return client.post(
+        "/inbox",
+        headers={
+            "Content-Type": ap.AS_CTX,
+            "Signature": f'keyId="{ra.ap_id}#main-key",signature="{signature}"',
+        },
+        json=RemoteObject(
+            factories.build_follow_activity(
+                from_remote_actor=ra,
+                for_remote_actor=LOCAL_ACTOR,
+            ),
+            ra,
+        ).ap_object,
+    )
+
+
+@contextmanager
+def _mock_httpsig_checker_for_signature(
+    ra: actor.RemoteActor,
+):
+    # Only the requests signed with "valid" have a valid signature
+    httpsig_checks: list[fastapi.Request] = []
+
+    async def httpsig_checker(request: fastapi.Request) -> httpsig.HTTPSigInfo:
+        httpsig_checks.append(request)
+        if 'signature="valid"' not in request.headers["Signature"]:
+            return httpsig.HTTPSigInfo(has_valid_signature=False)
+
+        return httpsig.HTTPSigInfo(
+            has_valid_signature=True,
+            signed_by_ap_actor_id=ra.ap_id,
+            server=urlparse(ra.ap_id).hostname,
+        )
+
+    backpressure._BUCKETS.clear()
+    app.dependency_overrides[httpsig.httpsig_checker] = httpsig_checker
+    try:
+        yield httpsig_checks
+    finally:
+        del app.dependency_overrides[httpsig.httpsig_checker]
+        backpressure._BUCKETS.clear()
+
+
+def test_inbox__rate_limited(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a remote actor
+    ra = setup_remote_actor(respx_mock)
+
+    # And a rate limit of 1 activity per minute
+    with _mock_httpsig_checker_for_signature(ra) as httpsig_checks, mock.patch.object(
+        config, "INBOX_RATE_LIMIT", 1
+    ):
+        # When receiving two activities
+        responses = [_post_follow_activity(client, ra, "valid") for _ in range(2)]
+
+    # Then the second one is rejected
+    assert responses[0].status_code == 202
+    assert responses[1].status_code == 429
+    assert int(responses[1].headers["Retry-After"]) > 0
+    assert db.scalar(select(func.count(models.IncomingActivity.id))) == 1
+
+    # And the limit was charged after verifying the signatures
+    assert len(httpsig_checks) == 2
+
+
+def test_inbox__rate_limited__invalid_signatures_limited_by_client_ip(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a remote actor
+    ra = setup_remote_actor(respx_mock)
+
+    # And a rate limit of 1 activity per minute
+    with _mock_httpsig_checker_for_signature(ra), mock.patch.object(
+        config, "INBOX_RATE_LIMIT", 1
+    ):
+        # When receiving two activities with a forged keyId of the remote actor
+        forged_responses = [
+            _post_follow_activity(client, ra, "forged") for _ in range(2)
+        ]
+
+        # And then an activity signed by the remote actor
+        response = _post_follow_activity(client, ra, "valid")
+
+    # Then the forged activities are limited by client IP
+    assert forged_responses[0].status_code == 401
+    assert forged_responses[1].status_code == 429
+
+    # And they did not charge the limit of the remote actor server
+    assert response.status_code == 202
+    assert db.scalar(select(func.count(models.IncomingActivity.id))) == 1
+
+
+def test_inbox__queue_full(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a remote actor
+    ra = setup_remote_actor(respx_mock)
+
+    # And an incoming queue that can only hold 1 activity
+    backpressure._CACHE.clear()
+    with mock_httpsig_checker(ra), mock.patch.object(config, "INBOX_MAX_QUEUE_SIZE", 1):
+        # When receiving two activities
+        responses = []
+        for _ in range(2):
+            responses.append(
+                client.post(
+                    "/inbox",
+                    headers={"Content-Type": ap.AS_CTX},
+                    json=RemoteObject(
+                        factories.build_follow_activity(
+                            from_remote_actor=ra,
+                            for_remote_actor=LOCAL_ACTOR,
+                        ),
+                        ra,
+                    ).ap_object,
+                )
+            )
+            backpressure._CACHE.clear()
+
+    # Then the second one is rejected until the queue is processed
+    assert responses[0].status_code == 202
+    assert responses[1].status_code == 429
+    assert responses[1].headers["Retry-After"] == "60"
+
+
 def test_inbox_incoming_follow_request__manually_approves_followers(
     db: Session,
     client: TestClient,
@@ -241,6 +433,59 @@ def test_inbox__create_from_follower(
     assert note_activity_from_inbox.ap_id == ro.activity_object_ap_id
 
 
+def test_inbox__processing_time_is_recorded(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a remote actor
+    ra = setup_remote_actor(respx_mock)
+    setup_remote_actor_as_follower(ra)
+
+    # When receiving and processing a Create activity
+    create_activity = factories.build_create_activity(
+        factories.build_note_object(
+            from_remote_actor=ra,
+            outbox_public_id=str(uuid4()),
+            content="Hello",
+            to=[LOCAL_ACTOR.ap_id],
+        )
+    )
+    with mock_httpsig_checker(ra):
+        response = client.post(
+            "/inbox",
+            headers={"Content-Type": ap.AS_CTX},
+            json=create_activity,
+        )
+    assert response.status_code == 202
+    run_process_next_incoming_activity()
+
+    # Then the processing time is recorded, by stage
+    timing = db.execute(select(models.IncomingActivityTiming)).scalar_one()
+    assert timing.ap_type == "Create"
+    assert timing.server == "example.com"
+    assert timing.handler == "_handle_create_activity"
+    assert timing.result == "success"
+    assert timing.total_time > 0
+    assert timing.db_time > 0
+    assert {"save_to_inbox", "fetch_actor", "_handle_create_activity"} <= {
+        stage_timing.stage
+        for stage_timing in db.execute(
+            select(models.IncomingActivityStageTiming)
+        ).scalars()
+        if stage_timing.handler == "_handle_create_activity"
+    }
+
+    # And it's displayed in the admin
+    response = client.get(
+        "/admin/processing",
+        cookies=generate_admin_session_cookies(),
+    )
+    assert response.status_code == 200
+    assert "_handle_create_activity" in response.text
+    assert "fetch_actor" in response.text
+
+
 def test_inbox__create_already_deleted_object(
     db: Session,
     client: TestClient,
@@ -473,3 +718,232 @@ def test_inbox__block_activity(
     ).scalar_one()
     assert notif.actor.ap_id == ra.ap_id
     assert notif.inbox_object_id == inbox_activity.id
+
+
+def test_inbox__create_from_following__added_to_stream(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a remote actor (the route of the Create activity, fetched when
+    # prefetching the outbox, must be set up before the one of the actor)
+    note_public_id = str(uuid4())
+    create_activity_route = respx_mock.get(
+        f"https://example.com/note/{note_public_id}/activity"
+    )
+    ra = setup_remote_actor(respx_mock)
+
+    # Which is followed by the local actor
+    following = setup_remote_actor_as_following(ra)
+
+    # When receiving a Create activity
+    create_activity = factories.build_create_activity(
+        factories.build_note_object(
+            from_remote_actor=ra,
+            outbox_public_id=note_public_id,
+            content="Hello from the stream",
+        )
+    )
+    with mock_httpsig_checker(ra):
+        response = client.post(
+            "/inbox",
+            headers={"Content-Type": ap.AS_CTX},
+            json=create_activity,
+        )
+    assert response.status_code == 202
+    run_process_next_incoming_activity()
+
+    # Then the Note was added to the stream
+    note = db.execute(
+        select(models.InboxObject).where(models.InboxObject.ap_type == "Note")
+    ).scalar_one()
+    stream_entry = db.execute(select(models.StreamEntry)).scalar_one()
+    assert stream_entry.inbox_object_id == note.id
+    assert stream_entry.actor_id == following.actor_id
+
+    # And it's displayed in the admin stream
+    response = client.get("/admin/stream", cookies=generate_admin_session_cookies())
+    assert response.status_code == 200
+    assert "Hello from the stream" in response.text
+
+    # When unfollowing the actor
+    async def _unfollow(db_session: AsyncSession) -> None:
+        actor = await db_session.get(models.Actor, following.actor_id)
+        assert actor
+        await boxes._remove_actor_from_stream(db_session, actor)
+        await db_session.commit()
+
+    run_async(_unfollow)
+
+    # Then the Note was removed from the stream
+    db.expire_all()
+    assert db.scalar(select(func.count(models.StreamEntry.id))) == 0
+
+    # And the Note itself is left untouched
+    assert (
+        db.execute(select(models.InboxObject).where(models.InboxObject.id == note.id))
+        .scalar_one()
+        .is_hidden_from_stream
+        is False
+    )
+
+    # When another followed actor boosts the Note
+    ra2 = setup_remote_actor(respx_mock, base_url="https://example.org")
+    setup_remote_actor_as_following(ra2)
+    announce_activity = {
+        "@context": ap.AS_CTX,
+        "type": "Announce",
+        "id": ra2.ap_id + "/announce/" + uuid4().hex,
+        "actor": ra2.ap_id,
+        "object": note.ap_id,
+        "to": [ap.AS_PUBLIC],
+        "published": now().replace(microsecond=0).isoformat().replace("+00:00", "Z"),
+    }
+    with mock_httpsig_checker(ra2):
+        response = client.post(
+            "/inbox",
+            headers={"Content-Type": ap.AS_CTX},
+            json=announce_activity,
+        )
+    assert response.status_code == 202
+    run_process_next_incoming_activity()
+
+    # Then the boost is not deduped, as the Note is not in the stream anymore
+    announce = db.execute(
+        select(models.InboxObject).where(models.InboxObject.ap_type == "Announce")
+    ).scalar_one()
+    assert announce.is_hidden_from_stream is False
+    assert db.execute(select(models.StreamEntry)).scalar_one().inbox_object_id == (
+        announce.id
+    )
+
+    # When following the actor again
+    respx_mock.get(ra.ap_id + "/outbox").mock(
+        return_value=httpx.Response(
+            200,
+            json={
+                "@context": ap.AS_EXTENDED_CTX,
+                "id": f"{ra.ap_id}/outbox",
+                "type": "OrderedCollection",
+                "totalItems": 1,
+                "orderedItems": [create_activity["id"]],
+            },
+        )
+    )
+    create_activity_route.mock(return_value=httpx.Response(200, json=create_activity))
+
+    async def _refollow(db_session: AsyncSession) -> None:
+        actor = await db_session.get(models.Actor, following.actor_id)
+        assert actor
+        await boxes._prefetch_actor_outbox(db_session, actor)
+        await db_session.commit()
+
+    run_async(_refollow)
+
+    # Then the Note is back in the stream
+    assert {
+        stream_entry.inbox_object_id
+        for stream_entry in db.execute(select(models.StreamEntry)).scalars()
+    } == {note.id, announce.id}
+
+
+def test_inbox__create_with_followed_hashtag__added_to_stream(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a remote actor that is not followed
+    ra = setup_remote_actor(respx_mock)
+
+    # And a followed hashtag
+    response = client.post(
+        "/admin/actions/follow_hashtag",
+        data={
+            "redirect_url": "http://testserver/",
+            "tag": "#MicroblogPub",
+            "csrf_token": generate_csrf_token(),
+        },
+        cookies=generate_admin_session_cookies(),
+    )
+    assert response.status_code == 302
+    assert db.execute(select(models.FollowedHashtag)).scalar_one().tag == (
+        "microblogpub"
+    )
+
+    # When receiving a Create activity with this hashtag
+    create_activity = factories.build_create_activity(
+        factories.build_note_object(
+            from_remote_actor=ra,
+            outbox_public_id=str(uuid4()),
+            content="Hello #MicroblogPub",
+            tags=[
+                {
+                    "type": "Hashtag",
+                    "href": "https://example.com/tags/microblogpub",
+                    "name": "#MicroblogPub",
+                },
+                {
+                    "type": "Hashtag",
+                    "href": "https://example.com/tags/fediverse",
+                    "name": "#fediverse",
+                },
+            ],
+        )
+    )
+    with mock_httpsig_checker(ra):
+        response = client.post(
+            "/inbox",
+            headers={"Content-Type": ap.AS_CTX},
+            json=create_activity,
+        )
+    assert response.status_code == 202
+    run_process_next_incoming_activity()
+
+    # Then the hashtags were indexed
+    note = db.execute(
+        select(models.InboxObject).where(models.InboxObject.ap_type == "Note")
+    ).scalar_one()
+    assert {
+        tagged_object.tag
+        for tagged_object in db.execute(select(models.TaggedInboxObject)).scalars()
+        if tagged_object.inbox_object_id == note.id
+    } == {"microblogpub", "fediverse"}
+
+    # And the Note was added to the stream
+    assert note.is_hidden_from_stream is False
+    assert db.execute(select(models.StreamEntry)).scalar_one().inbox_object_id == (
+        note.id
+    )
+
+    # And it's displayed in the tag timelines
+    for tag in ["microblogpub", "#Fediverse"]:
+        response = client.get(
+            "/admin/tags",
+            params={"tag": tag},
+            cookies=generate_admin_session_cookies(),
+        )
+        assert response.status_code == 200
+        assert "Hello #MicroblogPub" in response.text
+
+    response = client.get(
+        "/admin/tags",
+        params={"tag": "python"},
+        cookies=generate_admin_session_cookies(),
+    )
+    assert response.status_code == 200
+    assert "Hello #MicroblogPub" not in response.text
+
+    # When unfollowing the hashtag (using the same case as when following it)
+    response = client.post(
+        "/admin/actions/unfollow_hashtag",
+        data={
+            "redirect_url": "http://testserver/",
+            "tag": "#MicroblogPub",
+            "csrf_token": generate_csrf_token(),
+        },
+        cookies=generate_admin_session_cookies(),
+    )
+    assert response.status_code == 302
+
+    # Then it's not followed anymore
+    assert db.execute(select(models.FollowedHashtag)).scalar_one_or_none() is None
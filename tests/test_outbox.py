@@ -1,3 +1,4 @@
+from datetime import timedelta
 from unittest import mock
 
 import respx
@@ -9,8 +10,17 @@ from app import activitypub as ap
 from app import models
 from app import webfinger
 from app.actor import LOCAL_ACTOR
+from app.boxes import _compute_recipients
+from app.boxes import fan_out_outbox_object
+from app.boxes import send_update
 from app.config import generate_csrf_token
+from app.database import AsyncSession
+from app.utils.datetime import as_utc
+from app.utils.datetime import now
+from tests import factories
 from tests.utils import generate_admin_session_cookies
+from tests.utils import run_async
+from tests.utils import run_process_pending_fan_outs
 from tests.utils import setup_inbox_note
 from tests.utils import setup_outbox_note
 from tests.utils import setup_remote_actor
@@ -258,6 +268,13 @@ def test_send_create_activity__no_followers_and_with_mention(
     outbox_object = db.execute(select(models.OutboxObject)).scalar_one()
     assert outbox_object.ap_type == "Note"
 
+    # And the recipients are computed by the outgoing worker
+    assert outbox_object.fan_out_status == models.FanOutStatus.PENDING
+    run_process_pending_fan_outs()
+
+    db.refresh(outbox_object)
+    assert outbox_object.fan_out_status == models.FanOutStatus.DONE
+
     # And an outgoing activity was queued
     outgoing_activity = db.execute(select(models.OutgoingActivity)).scalar_one()
     assert outgoing_activity.outbox_object_id == outbox_object.id
@@ -294,12 +311,170 @@ def test_send_create_activity__with_followers(
     outbox_object = db.execute(select(models.OutboxObject)).scalar_one()
     assert outbox_object.ap_type == "Note"
 
+    # And the recipients are computed by the outgoing worker
+    assert outbox_object.fan_out_status == models.FanOutStatus.PENDING
+    run_process_pending_fan_outs()
+
     # And an outgoing activity was queued
     outgoing_activity = db.execute(select(models.OutgoingActivity)).scalar_one()
     assert outgoing_activity.outbox_object_id == outbox_object.id
     assert outgoing_activity.recipient == follower.actor.inbox_url
 
 
+def test_send_update__debounced(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # given a remote actor
+    ra = setup_remote_actor(respx_mock)
+
+    # who is a follower
+    follower = setup_remote_actor_as_follower(ra)
+
+    # And a note already fanned out, but not delivered yet
+    with mock.patch.object(webfinger, "get_actor_url", return_value=ra.ap_id):
+        response = client.post(
+            "/admin/actions/new",
+            data={
+                "redirect_url": "http://testserver/",
+                "content": "hi followers",
+                "visibility": ap.VisibilityEnum.PUBLIC.name,
+                "csrf_token": generate_csrf_token(),
+            },
+            cookies=generate_admin_session_cookies(),
+        )
+    assert response.status_code == 302
+    run_process_pending_fan_outs()
+    outbox_object = db.execute(select(models.OutboxObject)).scalar_one()
+
+    # When the note is edited twice
+    run_async(send_update, outbox_object.ap_id, "hi followers, edited")
+    run_async(send_update, outbox_object.ap_id, "hi followers, edited again")
+
+    # Then the fan-out is delayed until the end of the debounce window
+    db.refresh(outbox_object)
+    assert outbox_object.fan_out_status == models.FanOutStatus.PENDING
+    assert as_utc(outbox_object.fan_out_after) > now()
+    run_process_pending_fan_outs()
+    db.refresh(outbox_object)
+    assert outbox_object.fan_out_status == models.FanOutStatus.PENDING
+
+    # When the window is over
+    outbox_object.fan_out_after = now() - timedelta(seconds=1)
+    db.commit()
+    run_process_pending_fan_outs()
+
+    # Then the pending delivery was reused for the latest revision
+    db.refresh(outbox_object)
+    assert outbox_object.fan_out_status == models.FanOutStatus.DONE
+    assert "edited again" in outbox_object.ap_object["content"]
+    outgoing_activity = db.execute(select(models.OutgoingActivity)).scalar_one()
+    assert outgoing_activity.recipient == follower.actor.inbox_url
+
+
+def test_send_update__scheduled_during_fan_out(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # given a remote actor
+    ra = setup_remote_actor(respx_mock)
+
+    # who is a follower
+    setup_remote_actor_as_follower(ra)
+
+    # And a note waiting to be fanned out
+    response = client.post(
+        "/admin/actions/new",
+        data={
+            "redirect_url": "http://testserver/",
+            "content": "hi followers",
+            "visibility": ap.VisibilityEnum.PUBLIC.name,
+            "csrf_token": generate_csrf_token(),
+        },
+        cookies=generate_admin_session_cookies(),
+    )
+    assert response.status_code == 302
+
+    # When the note is scheduled again while its fan-out is in progress
+    async def _fan_out_and_schedule(
+        db_session: AsyncSession,
+        outbox_object: models.OutboxObject,
+    ) -> None:
+        await fan_out_outbox_object(db_session, outbox_object)
+        outbox_object.fan_out_status = models.FanOutStatus.PENDING_UPDATE
+        outbox_object.fan_out_after = now() + timedelta(seconds=30)
+        await db_session.flush()
+
+    with mock.patch(
+        "app.boxes.fan_out_outbox_object", side_effect=_fan_out_and_schedule
+    ):
+        run_process_pending_fan_outs()
+
+    # Then the new fan-out is still pending
+    outbox_object = db.execute(select(models.OutboxObject)).scalar_one()
+    assert outbox_object.fan_out_status == models.FanOutStatus.PENDING_UPDATE
+    assert as_utc(outbox_object.fan_out_after) > now()
+    assert db.execute(select(models.OutgoingActivity)).scalar_one()
+
+
+def test_send_create_activity__fan_out_retried(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # given a remote actor
+    ra = setup_remote_actor(respx_mock)
+
+    # who is a follower
+    setup_remote_actor_as_follower(ra)
+
+    # When creating a note and the fan-out fails
+    response = client.post(
+        "/admin/actions/new",
+        data={
+            "redirect_url": "http://testserver/",
+            "content": "hi followers",
+            "visibility": ap.VisibilityEnum.PUBLIC.name,
+            "csrf_token": generate_csrf_token(),
+        },
+        cookies=generate_admin_session_cookies(),
+    )
+    assert response.status_code == 302
+    with mock.patch(
+        "app.boxes.fan_out_outbox_object", side_effect=Exception("db is locked")
+    ):
+        run_process_pending_fan_outs()
+
+    # Then the fan-out is retried later
+    outbox_object = db.execute(select(models.OutboxObject)).scalar_one()
+    assert outbox_object.fan_out_status == models.FanOutStatus.PENDING
+    assert outbox_object.fan_out_tries == 1
+    assert as_utc(outbox_object.fan_out_after) > now()
+
+    # When the last try fails too
+    outbox_object.fan_out_tries = 9
+    outbox_object.fan_out_after = now() - timedelta(seconds=1)
+    db.commit()
+    with mock.patch(
+        "app.boxes.fan_out_outbox_object", side_effect=Exception("db is locked")
+    ):
+        run_process_pending_fan_outs()
+
+    # Then the fan-out is marked as failed, and the admin is notified
+    db.refresh(outbox_object)
+    assert outbox_object.fan_out_status == models.FanOutStatus.FAILED
+    notification = db.execute(select(models.Notification)).scalar_one()
+    assert notification.notification_type == models.NotificationType.FAN_OUT_FAILED
+    assert notification.outbox_object_id == outbox_object.id
+    response = client.get(
+        "/admin/notifications", cookies=generate_admin_session_cookies()
+    )
+    assert response.status_code == 200
+    assert "failed to send a post" in response.text
+
+
 def test_send_create_activity__question__one_of(
     db: Session,
     client: TestClient,
@@ -338,6 +513,10 @@ def test_send_create_activity__question__one_of(
     assert {pi["name"] for pi in outbox_object.poll_items} == {"A", "B"}
     assert outbox_object.is_poll_ended is False
 
+    # And the recipients are computed by the outgoing worker
+    assert outbox_object.fan_out_status == models.FanOutStatus.PENDING
+    run_process_pending_fan_outs()
+
     # And an outgoing activity was queued
     outgoing_activity = db.execute(select(models.OutgoingActivity)).scalar_one()
     assert outgoing_activity.outbox_object_id == outbox_object.id
@@ -384,6 +563,10 @@ def test_send_create_activity__question__any_of(
     assert {pi["name"] for pi in outbox_object.poll_items} == {"A", "B", "C", "D"}
     assert outbox_object.is_poll_ended is False
 
+    # And the recipients are computed by the outgoing worker
+    assert outbox_object.fan_out_status == models.FanOutStatus.PENDING
+    run_process_pending_fan_outs()
+
     # And an outgoing activity was queued
     outgoing_activity = db.execute(select(models.OutgoingActivity)).scalar_one()
     assert outgoing_activity.outbox_object_id == outbox_object.id
@@ -422,7 +605,52 @@ def test_send_create_activity__article(
     assert outbox_object.ap_type == "Article"
     assert outbox_object.ap_object["name"] == "Article"
 
+    # And the recipients are computed by the outgoing worker
+    assert outbox_object.fan_out_status == models.FanOutStatus.PENDING
+    run_process_pending_fan_outs()
+
     # And an outgoing activity was queued
     outgoing_activity = db.execute(select(models.OutgoingActivity)).scalar_one()
     assert outgoing_activity.outbox_object_id == outbox_object.id
     assert outgoing_activity.recipient == follower.actor.inbox_url
+
+
+def test_compute_recipients(
+    db: Session,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a follower
+    follower = setup_remote_actor_as_follower(
+        setup_remote_actor(respx_mock, base_url="https://follower.com")
+    )
+
+    # And a known actor
+    known_actor = factories.ActorFactory.from_remote_actor(
+        setup_remote_actor(respx_mock, base_url="https://known.com")
+    )
+
+    # And an unknown actor
+    unknown_ra = setup_remote_actor(respx_mock, base_url="https://unknown.com")
+
+    # When computing the recipients of a note mentioning both actors
+    recipients = run_async(
+        _compute_recipients,
+        {
+            "to": [ap.AS_PUBLIC],
+            "cc": [
+                f"{LOCAL_ACTOR.ap_id}/followers",
+                known_actor.ap_id,
+                unknown_ra.ap_id,
+            ],
+        },
+    )
+
+    # Then all the inboxes are returned
+    assert recipients == {
+        follower.actor.shared_inbox_url,
+        known_actor.shared_inbox_url,
+        unknown_ra.shared_inbox_url,
+    }
+
+    # And only the unknown actor was fetched
+    assert {call.request.url.host for call in respx.calls} == {"unknown.com"}
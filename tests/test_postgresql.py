@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from alembic import command
+from alembic.config import Config as AlembicConfig
+from fastapi.testclient import TestClient
+from sqlalchemy import Enum
+from sqlalchemy import select
+from sqlalchemy import text
+
+from app import models
+from app.actor import LOCAL_ACTOR
+from app.ap_object import RemoteObject
+from app.config import ROOT_DIR
+from app.database import AsyncSession
+from app.database import Base
+from app.database import async_session
+from app.database import engine
+from app.database import notify
+from app.outgoing_activities import fetch_next_outgoing_activity
+from app.utils.workers import Worker
+from tests import factories
+from tests.utils import requires_postgresql
+
+
+class _Worker(Worker[None]):
+    notify_channel = "tests_channel"
+
+
+@requires_postgresql
+@pytest.mark.asyncio
+async def test_fetch_next_outgoing_activity__skips_locked_rows(
+    async_db_session: AsyncSession,
+    client: TestClient,
+) -> None:
+    # Given an outbox object sent to two inboxes
+    ra = factories.RemoteActorFactory(
+        base_url="https://example.com",
+        username="toto",
+        public_key="pk",
+    )
+    follow_from_outbox = RemoteObject(
+        factories.build_follow_activity(
+            from_remote_actor=LOCAL_ACTOR,
+            for_remote_actor=ra,
+            outbox_public_id="follow",
+        ),
+        LOCAL_ACTOR,
+    )
+    outbox_object = factories.OutboxObjectFactory.from_remote_object(
+        "follow", follow_from_outbox
+    )
+    first_activity = factories.OutgoingActivityFactory(
+        recipient="https://example.com/inbox",
+        outbox_object_id=outbox_object.id,
+    )
+    second_activity = factories.OutgoingActivityFactory(
+        recipient="https://example.org/inbox",
+        outbox_object_id=outbox_object.id,
+    )
+
+    # When the first one is locked by another worker
+    async with async_session() as other_db_session:
+        await other_db_session.execute(
+            select(models.OutgoingActivity)
+            .where(models.OutgoingActivity.id == first_activity.id)
+            .with_for_update()
+        )
+
+        # Then the next activity is fetched without waiting for the lock
+        next_activity = await asyncio.wait_for(
+            fetch_next_outgoing_activity(async_db_session),
+            timeout=5,
+        )
+        await other_db_session.rollback()
+
+    assert next_activity
+    assert next_activity.id == second_activity.id
+
+
+@requires_postgresql
+@pytest.mark.asyncio
+async def test_worker__woken_up_by_notify(
+    async_db_session: AsyncSession,
+) -> None:
+    # Given a worker listening on a channel
+    worker = _Worker()
+    listen_task = asyncio.create_task(worker._listen("tests_channel"))
+
+    # When the channel is notified (until the worker is listening)
+    try:
+        for _ in range(50):
+            await notify(async_db_session, "tests_channel")
+            await async_db_session.commit()
+            try:
+                await asyncio.wait_for(worker._notified_event.wait(), timeout=0.1)
+                break
+            except asyncio.TimeoutError:
+                pass
+
+        # Then the worker is woken up
+        assert worker._notified_event.is_set()
+    finally:
+        worker._stop_event.set()
+        await listen_task
+
+
+@requires_postgresql
+def test_migrations__enum_values() -> None:
+    # When running the migrations on an empty DB
+    alembic_config = AlembicConfig(str(ROOT_DIR / "alembic.ini"))
+    alembic_config.set_main_option("script_location", str(ROOT_DIR / "alembic"))
+    command.upgrade(alembic_config, "head")
+
+    # Then the enum types have all the values used by the models
+    try:
+        with engine.connect() as conn:
+            for table in Base.metadata.tables.values():
+                for column in table.columns:
+                    if not isinstance(column.type, Enum):
+                        continue
+
+                    values = conn.scalars(
+                        text(
+                            "SELECT unnest(enum_range(NULL::"
+                            f"{column.type.name}))::text"
+                        )
+                    ).all()
+                    expected_values = set(column.type.enums)  # type: ignore
+                    assert expected_values <= set(values), column
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DROP SCHEMA public CASCADE"))
+            conn.execute(text("CREATE SCHEMA public"))
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from uuid import uuid4
 
 import httpx
@@ -5,18 +6,37 @@ import pytest
 import respx
 from fastapi.testclient import TestClient
 from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 
 from app import models
 from app.actor import LOCAL_ACTOR
 from app.ap_object import RemoteObject
 from app.database import AsyncSession
+from app.outgoing_activities import _BREAKER_FAILURE_THRESHOLD
 from app.outgoing_activities import _MAX_RETRIES
 from app.outgoing_activities import fetch_next_outgoing_activity
+from app.outgoing_activities import new_outgoing_activities
 from app.outgoing_activities import new_outgoing_activity
 from app.outgoing_activities import process_next_outgoing_activity
+from app.utils.datetime import as_utc
+from app.utils.datetime import now
+from app.utils.workers import WORKER_ID
 from tests import factories
 
 
+async def _get_outgoing_activity(
+    db_session: AsyncSession,
+    outgoing_activity_id: int,
+) -> models.OutgoingActivity:
+    return (
+        await db_session.execute(
+            select(models.OutgoingActivity)
+            .where(models.OutgoingActivity.id == outgoing_activity_id)
+            .options(joinedload(models.OutgoingActivity.outbox_object))
+        )
+    ).scalar_one()
+
+
 def _setup_outbox_object() -> models.OutboxObject:
     ra = factories.RemoteActorFactory(
         base_url="https://example.com",
@@ -65,6 +85,33 @@ async def test_new_outgoing_activity(
     assert outgoing_activity.recipient == inbox_url
 
 
+@pytest.mark.asyncio
+async def test_new_outgoing_activities(
+    async_db_session: AsyncSession,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    outbox_object = _setup_outbox_object()
+    inbox_urls = {f"https://example{i}.com/inbox" for i in range(5)}
+
+    # When queuing the activity for several recipients
+    await new_outgoing_activities(
+        async_db_session, inbox_urls, outbox_object_id=outbox_object.id
+    )
+    await async_db_session.commit()
+
+    # Then one outgoing activity per recipient is ready to be sent
+    outgoing_activities = (
+        await async_db_session.scalars(select(models.OutgoingActivity))
+    ).all()
+    assert {oa.recipient for oa in outgoing_activities} == inbox_urls
+    for outgoing_activity in outgoing_activities:
+        assert outgoing_activity.outbox_object_id == outbox_object.id
+        assert outgoing_activity.tries == 0
+        assert outgoing_activity.next_try is not None
+        assert outgoing_activity.is_sent is False
+
+
 @pytest.mark.asyncio
 async def test_process_next_outgoing_activity__no_next_activity(
     respx_mock: respx.MockRouter,
@@ -74,6 +121,53 @@ async def test_process_next_outgoing_activity__no_next_activity(
     assert next_activity is None
 
 
+@pytest.mark.asyncio
+async def test_fetch_next_outgoing_activity__priority_lanes(
+    async_db_session: AsyncSession,
+) -> None:
+    outbox_object = _setup_outbox_object()
+
+    # Given a large bulk fan-out queued before an interactive delivery
+    for i in range(5):
+        factories.OutgoingActivityFactory(
+            recipient=f"https://example{i}.com/inbox",
+            outbox_object_id=outbox_object.id,
+            inbox_object_id=None,
+            webmention_target=None,
+            priority=models.DeliveryPriority.BULK,
+        )
+    interactive_activity = factories.OutgoingActivityFactory(
+        recipient="https://example.com/inbox",
+        outbox_object_id=outbox_object.id,
+        inbox_object_id=None,
+        webmention_target=None,
+        priority=models.DeliveryPriority.INTERACTIVE,
+    )
+
+    # When fetching the next delivery
+    next_activity = await fetch_next_outgoing_activity(async_db_session)
+
+    # Then the interactive one comes first
+    assert next_activity
+    assert next_activity.id == interactive_activity.id
+
+    # And the bulk lane is still served when it's its turn
+    next_activity = await fetch_next_outgoing_activity(
+        async_db_session,
+        preferred_lane=models.DeliveryPriority.BULK,
+    )
+    assert next_activity
+    assert next_activity.priority == models.DeliveryPriority.BULK
+
+    # And a preferred lane without due deliveries falls back to the others
+    next_activity = await fetch_next_outgoing_activity(
+        async_db_session,
+        preferred_lane=models.DeliveryPriority.NORMAL,
+    )
+    assert next_activity
+    assert next_activity.id == interactive_activity.id
+
+
 @pytest.mark.asyncio
 async def test_process_next_outgoing_activity__server_200(
     async_db_session: AsyncSession,
@@ -255,5 +349,108 @@ async def test_process_next_outgoing_activity__connect_error(
     assert outgoing_activity.tries == 1
 
 
+@pytest.mark.asyncio
+async def test_process_next_outgoing_activity__circuit_breaker(
+    async_db_session: AsyncSession,
+    respx_mock: respx.MockRouter,
+) -> None:
+    outbox_object = _setup_outbox_object()
+    recipient_inbox_url = "https://example.com/inbox"
+    respx_mock.post(recipient_inbox_url).mock(side_effect=httpx.ConnectError)
+    other_recipient_inbox_url = "https://example.com/users/toto/inbox"
+    respx_mock.post(other_recipient_inbox_url).mock(return_value=httpx.Response(204))
+
+    # And two outgoing activities for the same host
+    outgoing_activity = factories.OutgoingActivityFactory(
+        recipient=recipient_inbox_url,
+        outbox_object_id=outbox_object.id,
+        inbox_object_id=None,
+        webmention_target=None,
+    )
+    other_outgoing_activity = factories.OutgoingActivityFactory(
+        recipient=other_recipient_inbox_url,
+        outbox_object_id=outbox_object.id,
+        inbox_object_id=None,
+        webmention_target=None,
+    )
+
+    # When the host keeps failing
+    next_activity = await _get_outgoing_activity(async_db_session, outgoing_activity.id)
+    for _ in range(_BREAKER_FAILURE_THRESHOLD):
+        await process_next_outgoing_activity(async_db_session, next_activity)
+
+    # Then the circuit breaker is open
+    outgoing_host = (
+        await async_db_session.execute(select(models.OutgoingHost))
+    ).scalar_one()
+    assert outgoing_host.host == "example.com"
+    assert outgoing_host.state == models.CircuitBreakerState.OPEN
+    assert outgoing_host.next_probe_at
+
+    # And the other deliveries for the host are rescheduled after the cooldown
+    other_activity = await _get_outgoing_activity(
+        async_db_session, other_outgoing_activity.id
+    )
+    assert other_activity.next_try
+    assert as_utc(other_activity.next_try) == as_utc(outgoing_host.next_probe_at)
+
+    # And no request is sent to the host while the breaker is open
+    await process_next_outgoing_activity(async_db_session, other_activity)
+    assert respx_mock.calls.call_count == _BREAKER_FAILURE_THRESHOLD
+    assert other_activity.tries == 0
+
+    # When the cooldown is over and the probe succeeds
+    outgoing_host.next_probe_at = now() - timedelta(seconds=1)
+    await async_db_session.commit()
+    await process_next_outgoing_activity(async_db_session, other_activity)
+
+    # Then the circuit breaker is closed again
+    await async_db_session.refresh(outgoing_host)
+    assert other_activity.is_sent is True
+    assert outgoing_host.state == models.CircuitBreakerState.CLOSED
+    assert outgoing_host.consecutive_failures == 0
+
+
+@pytest.mark.asyncio
+async def test_fetch_next_outgoing_activity__leases(
+    async_db_session: AsyncSession,
+    respx_mock: respx.MockRouter,
+) -> None:
+    outbox_object = _setup_outbox_object()
+    recipient_inbox_url = "https://example.com/inbox"
+    respx_mock.post(recipient_inbox_url).mock(return_value=httpx.Response(204))
+
+    # Given an outgoing activity leased by another worker
+    outgoing_activity = factories.OutgoingActivityFactory(
+        recipient=recipient_inbox_url,
+        outbox_object_id=outbox_object.id,
+        inbox_object_id=None,
+        webmention_target=None,
+        lease_owner="another-worker",
+        lease_expires_at=now() + timedelta(minutes=1),
+    )
+
+    # Then it is skipped
+    assert await fetch_next_outgoing_activity(async_db_session) is None
+
+    # When the other worker crashed and the lease expired
+    leased_activity = await _get_outgoing_activity(
+        async_db_session, outgoing_activity.id
+    )
+    leased_activity.lease_expires_at = now() - timedelta(seconds=1)
+    await async_db_session.commit()
+
+    # Then the activity is leased by the current worker
+    next_activity = await fetch_next_outgoing_activity(async_db_session)
+    assert next_activity
+    assert next_activity.id == outgoing_activity.id
+    assert next_activity.lease_owner == WORKER_ID
+
+    # And the lease is released once processed
+    await process_next_outgoing_activity(async_db_session, next_activity)
+    assert next_activity.is_sent is True
+    assert next_activity.lease_owner is None
+
+
 # TODO(ts):
 # - parse retry after
@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy import select
+
+from app import models
+from app import prune
+from app.database import AsyncSession
+from app.utils.datetime import now
+from tests import factories
+
+
+@pytest.mark.asyncio
+async def test_prune_old_data(
+    async_db_session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(prune, "_BATCH_SIZE", 2)
+    monkeypatch.setattr(prune, "_PAUSE_BETWEEN_BATCHES", 0)
+    old_date = now() - timedelta(days=prune.INBOX_RETENTION_DAYS + 1)
+
+    # Given old and recent incoming activities
+    for i in range(5):
+        async_db_session.add(
+            models.IncomingActivity(
+                created_at=old_date,
+                ap_id=f"https://example.com/activities/old-{i}",
+                ap_object={},
+            )
+        )
+    async_db_session.add(
+        models.IncomingActivity(
+            ap_id="https://example.com/activities/new", ap_object={}
+        )
+    )
+
+    # And an orphan actor and an actor linked to a notification
+    factories.ActorFactory.from_remote_actor(
+        factories.RemoteActorFactory(
+            base_url="https://orphan.example.com",
+            username="orphan",
+            public_key="pk",
+        )
+    )
+    notifying_actor = factories.ActorFactory.from_remote_actor(
+        factories.RemoteActorFactory(
+            base_url="https://notifying.example.com",
+            username="notifying",
+            public_key="pk",
+        )
+    )
+    async_db_session.add(
+        models.Notification(
+            notification_type=models.NotificationType.NEW_FOLLOWER,
+            actor_id=notifying_actor.id,
+        )
+    )
+    await async_db_session.commit()
+    await async_db_session.execute(
+        models.Actor.__table__.update().values(created_at=old_date)  # type: ignore
+    )
+    await async_db_session.commit()
+
+    # When pruning old data
+    await prune.prune_old_data(async_db_session)
+
+    # Then the old incoming activities are deleted in batches
+    assert (
+        await async_db_session.scalars(select(models.IncomingActivity.ap_id))
+    ).all() == ["https://example.com/activities/new"]
+
+    # And the orphan actor is deleted
+    assert (await async_db_session.scalars(select(models.Actor.ap_id))).all() == [
+        notifying_actor.ap_id
+    ]
+
+
+@pytest.mark.asyncio
+async def test_prune_old_data__deadline(
+    async_db_session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(prune, "_PAUSE_BETWEEN_BATCHES", 0)
+    old_date = now() - timedelta(days=prune.INBOX_RETENTION_DAYS + 1)
+
+    # Given an old incoming activity
+    async_db_session.add(
+        models.IncomingActivity(
+            created_at=old_date,
+            ap_id="https://example.com/activities/old",
+            ap_object={},
+        )
+    )
+    await async_db_session.commit()
+
+    # When pruning old data with an expired deadline
+    await prune.prune_old_data(async_db_session, deadline=now())
+
+    # Then nothing is deleted
+    assert (
+        await async_db_session.scalar(select(func.count(models.IncomingActivity.id)))
+        == 1
+    )
@@ -1,11 +1,37 @@
+import asyncio
+import sqlite3
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+from typing import AsyncGenerator
+from typing import Callable
 from unittest import mock
 
 import pytest
+import respx
 from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import Session
 
 from app import activitypub as ap
+from app import models
 from app.actor import LOCAL_ACTOR
+from app.actor import RemoteActor
+from app.database import AsyncSession
+from app.database import apply_sqlite_pragmas
+from app.database import engine
+from app.database import get_db_session
+from app.database import get_read_db_session
+from app.main import app
+from app.utils import metrics
+from app.utils.datetime import now
+from tests import factories
+from tests.utils import generate_admin_session_cookies
+from tests.utils import requires_sqlite
+from tests.utils import setup_remote_actor
+from tests.utils import setup_remote_actor_as_follower
+from tests.utils import setup_remote_actor_as_following
 
 _ACCEPTED_AP_HEADERS = [
     "application/activity+json",
@@ -91,3 +117,104 @@ def test_following__html_hides_following(client, db) -> None:
         response = client.get("/following", headers={"Accept": "text/html"})
     assert response.status_code == 404
     assert response.headers["content-type"].startswith("text/html")
+
+
+def test_metrics__requires_admin(client, db) -> None:
+    response = client.get("/metrics")
+    assert response.status_code == 404
+
+
+def test_metrics(client, db) -> None:
+    client.get("/")
+
+    response = client.get("/metrics", cookies=generate_admin_session_cookies())
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'microblogpub_http_requests_total{method="GET",route="/",status_code="200"}'
+        in response.text
+    )
+    assert 'microblogpub_queue_size{queue="incoming"} 0.0' in response.text
+
+
+def test_metrics__histogram() -> None:
+    with mock.patch.dict(metrics._REGISTRY):
+        histogram = metrics.Histogram(
+            "test_duration_seconds",
+            "Test histogram.",
+            ("kind",),
+            buckets=(0.1, 1.0),
+        )
+        histogram.observe(0.05, kind="a")
+        histogram.observe(0.5, kind="a")
+        histogram.observe(5.0, kind="a")
+
+        assert histogram._render_samples(histogram._values) == [
+            'test_duration_seconds_bucket{kind="a",le="0.1"} 1.0',
+            'test_duration_seconds_bucket{kind="a",le="1.0"} 2.0',
+            'test_duration_seconds_bucket{kind="a",le="+Inf"} 3.0',
+            'test_duration_seconds_sum{kind="a"} 5.55',
+            'test_duration_seconds_count{kind="a"} 3.0',
+        ]
+
+
+@requires_sqlite
+@pytest.mark.parametrize(
+    "path,setup_remote_actor_as_followx",
+    [
+        ("/followers", setup_remote_actor_as_follower),
+        ("/following", setup_remote_actor_as_following),
+    ],
+)
+def test_followx__html_admin_with_read_engine(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+    tmp_path: Path,
+    path: str,
+    setup_remote_actor_as_followx: Callable[[RemoteActor], Any],
+) -> None:
+    # Given an actor that moved to an actor not refreshed for a while
+    moved_to_ra = setup_remote_actor(respx_mock, base_url="https://example.org")
+    moved_to_actor = factories.ActorFactory.from_remote_actor(moved_to_ra)
+    db.execute(
+        update(models.Actor)
+        .where(models.Actor.id == moved_to_actor.id)
+        .values(handle=moved_to_ra.handle, updated_at=now() - timedelta(days=2))
+    )
+    db.commit()
+    ra = setup_remote_actor(respx_mock)
+    ra.ap_actor["movedTo"] = moved_to_ra.ap_id
+    setup_remote_actor_as_followx(ra)
+
+    # And a file DB, with the read-only engine enabled
+    db_path = tmp_path / "read_engine.db"
+    with engine.connect() as conn, sqlite3.connect(db_path) as file_conn:
+        conn.connection.driver_connection.backup(file_conn)  # type: ignore
+    file_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    read_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    apply_sqlite_pragmas(read_engine.sync_engine, {"query_only": "ON"})
+
+    async def get_file_db_session() -> AsyncGenerator[AsyncSession, None]:
+        async with AsyncSession(file_engine, expire_on_commit=False) as session:
+            yield session
+
+    async def get_file_read_db_session() -> AsyncGenerator[AsyncSession, None]:
+        async with AsyncSession(read_engine, expire_on_commit=False) as session:
+            yield session
+
+    app.dependency_overrides[get_db_session] = get_file_db_session
+    app.dependency_overrides[get_read_db_session] = get_file_read_db_session
+    try:
+        # When the admin displays the page (which refreshes the moved-to actor)
+        response = client.get(path, cookies=generate_admin_session_cookies())
+    finally:
+        del app.dependency_overrides[get_db_session]
+        del app.dependency_overrides[get_read_db_session]
+        asyncio.run(file_engine.dispose())
+        asyncio.run(read_engine.dispose())
+
+    # Then it's displayed
+    assert response.status_code == 200
+    assert "has moved to" in response.text
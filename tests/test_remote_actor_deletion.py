@@ -11,6 +11,8 @@ from app.ap_object import RemoteObject
 from tests import factories
 from tests.utils import mock_httpsig_checker
 from tests.utils import run_process_next_incoming_activity
+from tests.utils import setup_inbox_note
+from tests.utils import setup_outbox_note
 from tests.utils import setup_remote_actor
 from tests.utils import setup_remote_actor_as_following_and_follower
 
@@ -64,7 +66,13 @@ def test_inbox__incoming_delete_for_known_actor(
     assert actor
     assert following.outbox_object
 
-    # TODO: setup few more activities (like announce and create)
+    # And who replied to an outbox object
+    outbox_note = setup_outbox_note()
+    outbox_note.replies_count = 1
+    reply = setup_inbox_note(actor, in_reply_to=outbox_note.ap_id)
+    assert reply.in_reply_to == outbox_note.ap_id
+
+    # TODO: setup few more activities (like announce)
 
     # When receiving a Delete activity for an unknown actor
     delete_activity = RemoteObject(
@@ -104,6 +112,10 @@ def test_inbox__incoming_delete_for_known_actor(
     # And the follower actor was deleted too
     assert db.scalar(select(func.count(models.Follower.id))) == 0
 
+    # And the replies count of the outbox object was decremented
+    db.refresh(outbox_note)
+    assert outbox_note.replies_count == 0
+
     # And the actor was marked in deleted
     db.refresh(actor)
     assert actor.is_deleted is True
@@ -0,0 +1,195 @@
+import base64
+from unittest import mock
+
+import pytest
+import respx
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import activitypub as ap
+from app import indieauth
+from app import models
+from app import search
+from app.config import generate_csrf_token
+from app.main import app
+from tests.utils import generate_admin_session_cookies
+from tests.utils import requires_sqlite
+from tests.utils import run_async
+from tests.utils import setup_remote_actor
+
+# The full-text search is disabled with PostgreSQL
+pytestmark = requires_sqlite
+
+
+def _create_note(client: TestClient, content: str) -> None:
+    response = client.post(
+        "/admin/actions/new",
+        data={
+            "content": content,
+            "redirect_url": "http://testserver/",
+            "visibility": ap.VisibilityEnum.PUBLIC.name,
+            "csrf_token": generate_csrf_token(),
+        },
+        cookies=generate_admin_session_cookies(),
+    )
+    assert response.status_code == 302
+
+
+def _search(query: str, cursor: str | None = None) -> list[search.SearchResult]:
+    results, _ = run_async(search.search, query, cursor)
+    return results
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("hello world", '"hello" "world"'),
+        ("#Python", 'tags : "Python"'),
+        ("micro*", '"micro" *'),
+        ('"quoted', '"""quoted"'),
+        ("  # * ", None),
+    ],
+)
+def test_build_match_query(query: str, expected: str | None) -> None:
+    assert search._build_match_query(query) == expected
+
+
+def test_search__outbox_note(
+    db: Session,
+    client: TestClient,
+) -> None:
+    # When creating a note with a hashtag
+    _create_note(client, "Hello from the café #fediverse")
+    outbox_object = db.execute(select(models.OutboxObject)).scalar_one()
+
+    # Then it can be found by content (ignoring accents), by prefix and by hashtag
+    for query in ["cafe", "hell*", "#fediverse", "hello #fediverse"]:
+        results = _search(query)
+        assert [(r.kind, r.ref_id) for r in results] == [
+            (search.SearchKind.OUTBOX, outbox_object.id)
+        ]
+
+    # And a word from the text is not a hashtag
+    assert _search("#hello") == []
+
+    # And the admin search page shows it
+    response = client.get(
+        "/admin/search?query=cafe",
+        cookies=generate_admin_session_cookies(),
+    )
+    assert response.status_code == 200
+    assert outbox_object.ap_id in response.text
+
+    # And the API requires an access token
+    assert client.get("/search?q=cafe").status_code == 401
+
+    # When deleting the note
+    response = client.post(
+        "/admin/actions/delete",
+        data={
+            "redirect_url": "http://testserver/",
+            "ap_object_id": outbox_object.ap_id,
+            "csrf_token": generate_csrf_token(),
+        },
+        cookies=generate_admin_session_cookies(),
+    )
+    assert response.status_code == 302
+
+    # Then it's removed from the index
+    assert _search("cafe") == []
+
+
+def test_search__actor(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    ra = setup_remote_actor(respx_mock)
+
+    # When an actor is fetched
+    response = client.post(
+        "/admin/actions/follow",
+        data={
+            "redirect_url": "http://testserver/",
+            "ap_actor_id": ra.ap_id,
+            "csrf_token": generate_csrf_token(),
+        },
+        cookies=generate_admin_session_cookies(),
+    )
+    assert response.status_code == 302
+    actor_in_db = db.execute(select(models.Actor)).scalar_one()
+
+    # Then it can be found by handle
+    results = _search(ra.preferred_username)
+    assert [(r.kind, r.ref_id) for r in results] == [
+        (search.SearchKind.ACTOR, actor_in_db.id)
+    ]
+
+
+def test_search__pagination(
+    db: Session,
+    client: TestClient,
+) -> None:
+    for i in range(5):
+        _create_note(client, f"Note {i} about #python" + " python" * i)
+
+    with mock.patch.object(search, "_PAGE_SIZE", 2):
+        ref_ids: list[int] = []
+        cursor = None
+        pages = 0
+        while True:
+            results, cursor = run_async(search.search, "python", cursor)
+            ref_ids.extend(result.ref_id for result in results)
+            pages += 1
+            if not cursor:
+                break
+
+    # Every note is returned once, the most relevant first
+    assert pages == 3
+    assert len(set(ref_ids)) == 5
+    notes = {
+        outbox_object.id: outbox_object.source
+        for outbox_object in db.execute(select(models.OutboxObject)).scalars()
+    }
+    assert notes[ref_ids[0]].startswith("Note 4")
+
+
+@pytest.mark.parametrize(
+    "scopes,cursor,expected_status_code",
+    [
+        (["create"], None, 401),
+        (["read"], None, 200),
+        (["read"], "not-a-cursor", 400),
+        (["read"], base64.urlsafe_b64encode(b"1.0").decode(), 400),
+    ],
+)
+def test_search__api(
+    db: Session,
+    client: TestClient,
+    scopes: list[str],
+    cursor: str | None,
+    expected_status_code: int,
+) -> None:
+    _create_note(client, "Hello from the API")
+
+    def enforce_access_token() -> indieauth.AccessTokenInfo:
+        return indieauth.AccessTokenInfo(
+            scopes=scopes,
+            client_id=None,
+            access_token="token",
+            exp=0,
+        )
+
+    app.dependency_overrides[indieauth.enforce_access_token] = enforce_access_token
+    try:
+        response = client.get(
+            "/search",
+            params={"q": "hello", **({"cursor": cursor} if cursor else {})},
+        )
+    finally:
+        del app.dependency_overrides[indieauth.enforce_access_token]
+
+    assert response.status_code == expected_status_code
+    if expected_status_code == 200:
+        assert len(response.json()["items"]) == 1
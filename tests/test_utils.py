@@ -1,8 +1,20 @@
+import asyncio
+import json
 from unittest import mock
 
 import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.orm import Session
 
+from app import models
+from app.database import AsyncSession
+from app.utils import profiler
+from app.utils import query_tracker
+from app.utils.compressed_json import compress
+from app.utils.compressed_json import decompress
 from app.utils.url import is_hostname_blocked
+from tests.utils import run_async
 
 
 @pytest.mark.parametrize(
@@ -17,3 +29,61 @@ def test_is_hostname_blocked(hostname: str, should_be_blocked: bool) -> None:
     with mock.patch("app.utils.url.BLOCKED_SERVERS", ["example.com"]):
         is_hostname_blocked.cache_clear()
         assert is_hostname_blocked(hostname) is should_be_blocked
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {"type": "Note", "content": "<p>Héllo 🎉</p>", "tag": []},
+        [{"name": "a"}, {"name": "b"}],
+        None,
+    ],
+)
+def test_compressed_json(value: object) -> None:
+    data = compress(value)
+    assert decompress(data) == value
+
+    # Values stored before the column was compressed are still readable
+    assert decompress(json.dumps(value)) == value
+    assert decompress(json.dumps(value).encode()) == value
+
+
+def test_statement_shape() -> None:
+    assert query_tracker.statement_shape(
+        "SELECT actor.id FROM actor\nWHERE actor.id IN (?, ?, ?) AND actor.ap_id = ?"
+    ) == ("SELECT actor.id FROM actor WHERE actor.id IN (?) AND actor.ap_id = ?")
+
+
+async def _select_actors(db_session: AsyncSession, times: int) -> None:
+    with query_tracker.track_queries("test") as tracker:
+        for i in range(times):
+            await db_session.execute(
+                select(models.Actor).where(models.Actor.id.in_(range(i + 1)))
+            )
+
+    assert tracker.queries_count == times
+    assert len(tracker.statements) == 1
+
+
+def test_track_queries(db: Session) -> None:
+    run_async(_select_actors, 3)
+
+
+def test_track_queries__repeated_statement(db: Session) -> None:
+    with pytest.raises(query_tracker.TooManyQueriesError, match="N\\+1"):
+        run_async(_select_actors, 15)
+
+
+def test_track_queries__request(client: TestClient) -> None:
+    with mock.patch.object(query_tracker, "SQL_QUERIES_THRESHOLD", 0):
+        with pytest.raises(query_tracker.TooManyQueriesError, match="GET /: "):
+            client.get("/")
+
+
+def test_profile_worker(db: Session) -> None:
+    worker_profile = asyncio.run(profiler.profile_worker("incoming", 10))
+
+    assert worker_profile.name == "incoming worker"
+    assert worker_profile.sql_queries_count > 0
+    speedscope_profile = profiler.to_speedscope(worker_profile)
+    assert speedscope_profile["profiles"][0]["type"] == "sampled"
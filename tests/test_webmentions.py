@@ -0,0 +1,94 @@
+import httpx
+import respx
+from fastapi.testclient import TestClient
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import models
+from tests.utils import run_process_next_incoming_activity
+from tests.utils import setup_outbox_note
+
+
+def test_webmention_endpoint__enqueue_and_coalesce(
+    db: Session,
+    client: TestClient,
+) -> None:
+    # Given a local note
+    outbox_object = setup_outbox_note()
+    source = "https://example.com/reply"
+
+    # When receiving the same webmention twice
+    for _ in range(2):
+        response = client.post(
+            "/webmentions",
+            data={"source": source, "target": outbox_object.ap_id},
+        )
+
+        # Then the server accepts it without fetching the source
+        assert response.status_code == 202
+
+    # And a single incoming activity was queued
+    incoming_activity = db.execute(select(models.IncomingActivity)).scalar_one()
+    assert incoming_activity.webmention_source == source
+    assert incoming_activity.webmention_target == outbox_object.ap_id
+    assert db.scalar(select(func.count(models.Webmention.id))) == 0
+
+
+def test_webmention_endpoint__invalid_target(
+    db: Session,
+    client: TestClient,
+) -> None:
+    response = client.post(
+        "/webmentions",
+        data={
+            "source": "https://example.com/reply",
+            "target": "https://another-domain.com/note",
+        },
+    )
+
+    assert response.status_code == 400
+    assert db.scalar(select(func.count(models.IncomingActivity.id))) == 0
+
+
+def test_process_webmention(
+    db: Session,
+    client: TestClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    # Given a local note
+    outbox_object = setup_outbox_note()
+    source = "https://example.com/reply"
+    respx_mock.get(source).mock(
+        return_value=httpx.Response(
+            200,
+            html=(
+                '<html><body><div class="h-entry">'
+                f'<a class="u-in-reply-to" href="{outbox_object.ap_id}">re</a>'
+                "</div></body></html>"
+            ),
+        )
+    )
+
+    # And a queued webmention
+    response = client.post(
+        "/webmentions",
+        data={"source": source, "target": outbox_object.ap_id},
+    )
+    assert response.status_code == 202
+
+    # When the incoming worker processes it
+    run_process_next_incoming_activity()
+
+    # Then the webmention is saved
+    webmention = db.execute(select(models.Webmention)).scalar_one()
+    assert webmention.source == source
+    assert webmention.outbox_object_id == outbox_object.id
+
+    # And the incoming activity is marked as processed
+    incoming_activity = db.execute(select(models.IncomingActivity)).scalar_one()
+    assert incoming_activity.is_processed is True
+
+    # And a notification was created
+    notif = db.execute(select(models.Notification)).scalar_one()
+    assert notif.notification_type == models.NotificationType.NEW_WEBMENTION
@@ -5,6 +5,7 @@ from uuid import uuid4
 
 import fastapi
 import httpx
+import pytest
 import respx
 
 from app import activitypub as ap
@@ -14,11 +15,14 @@ from app import models
 from app.actor import LOCAL_ACTOR
 from app.ap_object import RemoteObject
 from app.config import session_serializer
+from app.database import IS_POSTGRESQL
+from app.database import IS_SQLITE
 from app.database import AsyncSession
 from app.database import async_session
 from app.incoming_activities import fetch_next_incoming_activity
 from app.incoming_activities import process_next_incoming_activity
 from app.main import app
+from app.outgoing_activities import process_pending_fan_outs
 from tests import factories
 
 
@@ -44,6 +48,20 @@ def mock_httpsig_checker(
         del app.dependency_overrides[httpsig.httpsig_checker]
 
 
+# For the tests of the PostgreSQL-specific code paths (run with
+# `MICROBLOGPUB_DATABASE_URL=postgresql+asyncpg://...`)
+requires_postgresql = pytest.mark.skipif(
+    not IS_POSTGRESQL,
+    reason="PostgreSQL only",
+)
+
+# For the features only available with SQLite (like the full-text search)
+requires_sqlite = pytest.mark.skipif(
+    not IS_SQLITE,
+    reason="SQLite only",
+)
+
+
 def generate_admin_session_cookies() -> dict[str, Any]:
     return {"session": session_serializer.dumps({"is_logged_in": True})}
 
@@ -237,7 +255,7 @@ def run_async(func, *args, **kwargs):
         async with async_session() as db:
             return await func(db, *args, **kwargs)
 
-    asyncio.run(_func())
+    return asyncio.run(_func())
 
 
 async def _process_next_incoming_activity(db_session: AsyncSession) -> None:
@@ -248,3 +266,7 @@ async def _process_next_incoming_activity(db_session: AsyncSession) -> None:
 
 def run_process_next_incoming_activity() -> None:
     run_async(_process_next_incoming_activity)
+
+
+def run_process_pending_fan_outs() -> None:
+    run_async(process_pending_fan_outs)